@@ -1,48 +1,209 @@
 import asyncio
+import hashlib
+import json
 import math
+import os
 import sys
+import time
 import logging
+from datetime import datetime, timezone
+from functools import wraps
+from typing import Optional
 
 
 sys.path.append(".")
 
-from quart import Quart, jsonify, request, render_template
+from quart import Quart, Response, g, make_response, request, render_template
 
 from SHEweldo.models.enums import Department, ExperienceLevel, Gender, Industry
 from SHEweldo.services import Service, SalaryService, CompanyService
-from SHEweldo.controllers.database import FilterParams
+from SHEweldo.controllers.database import DatabaseController, FilterParams
+from SHEweldo.controllers.connection import ConnectionManager
+from SHEweldo.controllers.sharding import ShardedDatabaseController, shard_paths
+from SHEweldo.controllers.slow_queries import SlowQueryLog
+from SHEweldo.controllers.write_queue import WriteBehindQueue
+from SHEweldo.controllers.versions import COMPANIES_SCOPE, GLOBAL_SCOPE
+from SHEweldo.config import Settings
+from SHEweldo.cache import EncodedResponseCache, ResultCache
+from SHEweldo.encoding import SHAPES, ResponseEncoder, make_encoder, to_columnar
+from SHEweldo.leaderboard import Leaderboard
+from SHEweldo.live import LiveHub
+from SHEweldo.sampling import StratifiedSampler
+from SHEweldo.metrics import Metrics
 
 
 class AppAPI:
-    def __init__(self, salary_service: Service, company_service: Service):
+    def __init__(self, salary_service: Optional[Service], company_service: Optional[Service],
+                 encoder: Optional[ResponseEncoder] = None, response_cache: Optional[EncodedResponseCache] = None,
+                 max_batch_size: int = 1000, metrics: Optional[Metrics] = None, debug: bool = False,
+                 live_keepalive: float = 15.0, debug_endpoints: bool = False):
         self._salary_service = salary_service
         self._company_service = company_service
+        self._encoder = encoder or make_encoder()
+        self._response_cache = response_cache
+        self._max_batch_size = max_batch_size
+        self._metrics = metrics
+        self._live_keepalive = live_keepalive
+        self._debug_endpoints = debug_endpoints
 
         self._app = Quart(__name__)
-        self._app.debug = True
+        self._app.debug = debug
 
+        if metrics:
+            self._setup_metrics(metrics)
         self._setup_api_routes()
         self._setup_frontend_routes()
         self._configure_error_handlers()
 
+    def _json(self, value) -> Response:
+        if request.args.get("shape") == "columnar":
+            value = to_columnar(value)
+        return Response(self._encoder.encode(value), mimetype="application/json")
+
+    @staticmethod
+    def _approximate() -> bool:
+        """Whether the request opts into sampled graphs with approx=true."""
+        return request.args.get("approx", "").strip().lower() in ("1", "true", "yes")
+
+    def _conditional(self, scope=lambda **_: GLOBAL_SCOPE, cookies: tuple[str, ...] = ()):
+        """
+        Makes a GET view conditional on the data version of `scope`: an
+        If-None-Match that matches the current ETag gets 304 Not Modified
+        before the view runs any query. The query string is part of the URL
+        already, so the ETag only adds the `cookies` the view reads.
+
+        The ETag pins the data a body was built from, so with a response
+        cache a repeated request is answered with the already encoded body.
+        """
+        def decorator(view):
+            @wraps(view)
+            async def conditional_view(**kwargs):
+                if request.args.get("shape", SHAPES[0]) not in SHAPES:
+                    return self._json({"error": f"'shape' must be one of {list(SHAPES)}"}), 400
+
+                version, modified_at = self._salary_service.db_controller.get_data_version(scope(**kwargs))
+                etag = str(version)
+                if cookies:
+                    values = "\0".join(request.cookies.get(name, "") for name in cookies)
+                    etag += "-" + hashlib.sha1(values.encode()).hexdigest()[:16]
+
+                cache_key = (request.path, request.query_string, etag)
+                if request.if_none_match.contains_weak(etag):
+                    response = Response("", status=304)
+                elif self._response_cache and (cached := self._response_cache.get(cache_key)) is not None:
+                    response = Response(cached, mimetype="application/json")
+                else:
+                    response = await make_response(await view(**kwargs))
+                    if response.status_code != 200:
+                        return response
+                    if self._response_cache:
+                        self._response_cache.put(cache_key, await response.get_data())
+
+                response.set_etag(etag, weak=True)
+                if modified_at:
+                    response.last_modified = datetime.fromtimestamp(modified_at, timezone.utc)
+                # Revalidate on every use; a matching ETag makes that cheap.
+                response.headers["Cache-Control"] = "no-cache"
+                if cookies:
+                    response.vary.add("Cookie")
+                return response
+            return conditional_view
+        return decorator
+
+    def _setup_metrics(self, metrics: Metrics):
+        @self._app.before_serving
+        async def start_loop_monitor():
+            metrics.start_loop_monitor()
+
+        @self._app.after_serving
+        async def stop_loop_monitor():
+            await metrics.stop_loop_monitor()
+
+        @self._app.before_request
+        async def start_timer():
+            g.request_started = time.perf_counter()
+
+        @self._app.after_request
+        async def observe_request(response):
+            if (started := g.get("request_started")) is not None:
+                # The rule, not the path, so company hashes don't become labels.
+                route = request.url_rule.rule if request.url_rule else "unmatched"
+                metrics.request_latency.observe(
+                    time.perf_counter() - started, request.method, route, response.status_code
+                )
+            return response
+
+        @self._app.route("/metrics", methods=["GET"])
+        async def get_metrics():
+            return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+        if self._response_cache:
+            metrics.add_stats("response_cache", self._response_cache.stats)
+
+    async def _read_batch(self) -> list:
+        """
+        Reads a batch body: a JSON array, or JSON Lines when the content type
+        is application/x-ndjson. A line that is not valid JSON is kept as its
+        ValueError so it is rejected on its own instead of failing the batch.
+        """
+        if request.mimetype == "application/x-ndjson":
+            items = []
+            for line in (await request.get_data(as_text=True)).splitlines():
+                if not line.strip():
+                    continue
+                try:
+                    items.append(json.loads(line))
+                except ValueError as e:
+                    items.append(e)
+                if len(items) > self._max_batch_size:
+                    break
+            return items
+
+        # Malformed JSON comes back as None, and is refused below like any
+        # other body that is not an array.
+        items = await request.get_json(silent=True)
+        if not isinstance(items, list):
+            raise ValueError("Expected a JSON array of records")
+        return items
+
+    async def _submit_batch(self, service: Service):
+        try:
+            items = await self._read_batch()
+            if not items:
+                return self._json({"error": "No data provided"}), 400
+            if len(items) > self._max_batch_size:
+                return self._json({"error": f"A batch holds at most {self._max_batch_size} records"}), 413
+
+            results = await service.add_many(items)
+            created = sum(result["status"] == "created" for result in results)
+            body = {"created": created, "rejected": len(results) - created, "results": results}
+            # 207 Multi-Status: the per-item results say which ones failed.
+            return self._json(body), 201 if created == len(results) else 207
+        except ValueError as e:
+            return self._json({"error": str(e)}), 400
+        except Exception as e:
+            return self._json({"error": "Server error"}), 500
+
     def _setup_api_routes(self):
+        # Results filtered to one company only change with that company's data.
+        company_filter_scope = lambda **_: request.args.get("company_hash") or GLOBAL_SCOPE
 
         @self._app.route("/api/employee/submit", methods=["POST"])
         async def post_salary():
             try:
                 data = await request.get_json()
                 if not data:
-                    return jsonify({"error": "No data provided"}), 400
+                    return self._json({"error": "No data provided"}), 400
 
                 response_data = await self._salary_service.add(data)
 
                 if response_data.get("error"):
-                    return jsonify(response_data), 500
+                    return self._json(response_data), 500
 
                 salary_id = response_data.get("id")
                 salary_amount = response_data.get("salary")
 
-                response = jsonify(response_data)
+                response = self._json(response_data)
                 response.status_code = 201
 
                 response.set_cookie(
@@ -65,9 +226,9 @@ class AppAPI:
                 return response
 
             except ValueError as e:
-                return jsonify({"error": str(e)}), 400
+                return self._json({"error": str(e)}), 400
             except Exception as e:
-                return jsonify({"error": "Server error"}), 500
+                return self._json({"error": "Server error"}), 500
             
         @self._app.route("/api/company/submit", methods=["POST"])
         async def post_company():
@@ -75,14 +236,35 @@ class AppAPI:
                 data = await request.get_json()
                 response = await self._company_service.add(data)
                 if response.get("error"):
-                    return jsonify(response), 500
-                return jsonify(response), 201
+                    return self._json(response), 500
+                return self._json(response), 201
             except ValueError as e:
-                return jsonify({"error": str(e)}), 400
+                return self._json({"error": str(e)}), 400
             except Exception as e:
-                return jsonify({"error": "Server error"}), 500
+                return self._json({"error": "Server error"}), 500
+
+        @self._app.route("/api/employee/submit/batch", methods=["POST"])
+        async def post_salary_batch():
+            return await self._submit_batch(self._salary_service)
+
+        @self._app.route("/api/company/submit/batch", methods=["POST"])
+        async def post_company_batch():
+            return await self._submit_batch(self._company_service)
+
+        if self._debug_endpoints:
+            @self._app.route("/api/debug/slow-queries", methods=["GET"])
+            async def get_slow_queries():
+                slow_query_log = self._salary_service.db_controller.slow_query_log
+                if slow_query_log is None:
+                    return self._json({"error": "Slow query log is off; set SHEWELDO_SLOW_QUERY_MS"}), 404
+                return self._json({
+                    **slow_query_log.stats(),
+                    "shapes": slow_query_log.shapes(slow_only=request.args.get("all") != "1"),
+                    "recent": slow_query_log.recent(),
+                }), 200
 
         @self._app.route("/api/graphs/employee", methods=["GET"])
+        @self._conditional(company_filter_scope, cookies=("salary_id", "salary_amount"))
         async def get_comparison_graphs():
             try:
                 filters: FilterParams = {}
@@ -108,35 +290,210 @@ class AppAPI:
                     ]
                 )
 
+                approximate = self._approximate()
+                # Without filters the graphs cover the cookie salary's own
+                # company, whose salaries are counted exactly.
+                approximation = {"approximate": False}
                 if not filters:
                     bargraph_data, piegraph_data = await self._salary_service.fetch_filtered_records(
-                        range_steps, salary_id
+                        range_steps, id=salary_id
+                    )
+                elif approximate:
+                    bargraph_data, piegraph_data, approximation = (
+                        await self._salary_service.fetch_approximate_records(range_steps, filters)
                     )
                 else:
                     bargraph_data, piegraph_data = await self._salary_service.fetch_filtered_records(
                         range_steps, filters
                     )
 
-                return jsonify(
-                    {
-                        "bar_graph": bargraph_data,
-                        "pie_graph": piegraph_data,
-                        "current": salary_amount,
-                    }
-                ), 200
+                body = {
+                    "bar_graph": bargraph_data,
+                    "pie_graph": piegraph_data,
+                    "current": salary_amount,
+                }
+                if approximate:
+                    body["approximation"] = approximation
+                return self._json(body), 200
+
+            except Exception as e:
+                return self._json({"error": str(e)}), 500
+
+        # Server-Sent Events for the employee graphs: a "snapshot" with the
+        # bar and pie graph, then a "delta" with the changed buckets whenever
+        # matching salaries are inserted (see LiveHub). Without filters it
+        # follows the cookie salary's own segment, like the graphs.
+        @self._app.route("/api/graphs/employee/live", methods=["GET"])
+        async def stream_comparison_graphs():
+            live = self._salary_service.live
+            if live is None:
+                return self._json({"error": "Live graphs are off; set SHEWELDO_LIVE_MAX_SUBSCRIBERS"}), 404
+            try:
+                range_steps = int(request.args.get("range_steps") or 1000)
+                if range_steps <= 0:
+                    raise ValueError("'range_steps' must be positive")
+
+                filters = self._salary_service._build_filters(
+                    request.args,
+                    [
+                        ("company_hash", None),
+                        ("industry", Industry),
+                        ("department", Department),
+                        ("experience_level", ExperienceLevel),
+                        ("gender", Gender)
+                    ]
+                )
+                if not filters:
+                    salary_id = request.cookies.get("salary_id")
+                    if not salary_id:
+                        raise ValueError("Filters or a salary_id cookie are required")
+                    filters = await self._salary_service.salary_filters(salary_id)
 
+                subscription = live.subscribe(filters, range_steps)
+            except ValueError as e:
+                return self._json({"error": str(e)}), 400
+            except RuntimeError as e:
+                return self._json({"error": str(e)}), 503
             except Exception as e:
-                return jsonify({"error": str(e)}), 500
+                return self._json({"error": str(e)}), 500
+
+            async def events():
+                try:
+                    while (event := await subscription.next(self._live_keepalive)) is not None:
+                        yield event
+                finally:
+                    live.unsubscribe(subscription)
+
+            response = await make_response(events(), {
+                "Content-Type": "text/event-stream",
+                "Cache-Control": "no-cache",
+                "X-Accel-Buffering": "no",
+            })
+            # The stream lasts as long as the client stays.
+            response.timeout = None
+            return response
+
+        @self._app.route("/api/graphs/percentiles", methods=["GET"])
+        @self._conditional(company_filter_scope)
+        async def get_salary_percentiles():
+            try:
+                filters = self._salary_service._build_filters(
+                    request.args,
+                    [
+                        ("company_hash", None),
+                        ("industry", Industry),
+                        ("department", Department),
+                        ("experience_level", ExperienceLevel),
+                        ("gender", Gender)
+                    ]
+                )
+                percentiles = (
+                    [float(p) for p in request.args["p"].split(",")]
+                    if request.args.get("p")
+                    else None
+                )
+
+                return self._json(await self._salary_service.fetch_percentiles(filters, percentiles)), 200
+            except ValueError as e:
+                return self._json({"error": str(e)}), 400
+            except Exception as e:
+                return self._json({"error": str(e)}), 500
+
+        @self._app.route("/api/graphs/pay-gap", methods=["GET"])
+        @self._conditional(company_filter_scope)
+        async def get_pay_gap():
+            try:
+                filters = self._salary_service._build_filters(
+                    request.args,
+                    [
+                        ("company_hash", None),
+                        ("industry", Industry),
+                        ("department", Department),
+                        ("experience_level", ExperienceLevel),
+                        ("gender", Gender)
+                    ]
+                )
+                reference = Gender(request.args.get("reference", Gender.MALE.value).lower())
+
+                return self._json(await self._salary_service.fetch_pay_gap(filters, reference)), 200
+            except ValueError as e:
+                return self._json({"error": str(e)}), 400
+            except Exception as e:
+                return self._json({"error": str(e)}), 500
+
+        @self._app.route("/api/employee/export", methods=["GET"])
+        async def export_salaries():
+            try:
+                filters = self._salary_service._build_filters(
+                    request.args,
+                    [
+                        ("company_hash", None),
+                        ("industry", Industry),
+                        ("department", Department),
+                        ("experience_level", ExperienceLevel),
+                        ("gender", Gender)
+                    ]
+                )
+                export_format = request.args.get("format", "ndjson").lower()
+                after = int(request.args.get("after") or 0)
+                limit = int(request.args["limit"]) if request.args.get("limit") else None
+
+                body, mimetype = self._salary_service.export_records(filters, export_format, after, limit)
+            except ValueError as e:
+                return self._json({"error": str(e)}), 400
+
+            response = Response(body, mimetype=mimetype)
+            if export_format == "csv":
+                response.headers["Content-Disposition"] = "attachment; filename=salaries.csv"
+            return response
 
         @self._app.route("/api/companies", methods=["GET"])
+        @self._conditional(lambda **_: COMPANIES_SCOPE)
         async def get_companies():
             try:
-                companies = await self._company_service.get_all()
-                return jsonify([{"name": name, "hash": hash} for name, hash in companies]), 200
+                # Without search or paging parameters the full list is returned
+                # as before, for clients that still expect a plain array.
+                if not any(param in request.args for param in ("q", "after", "limit", "industry", "country")):
+                    companies = await self._company_service.get_all()
+                    return self._json([{"name": name, "hash": hash} for name, hash in companies]), 200
+
+                filters = self._company_service._build_filters(request.args, [("industry", Industry)])
+                page = await self._company_service.search(
+                    prefix=request.args.get("q", ""),
+                    industry=filters.get("industry"),
+                    country=request.args.get("country"),
+                    after=request.args.get("after"),
+                    limit=int(request.args.get("limit") or 20),
+                )
+                return self._json(page), 200
+            except ValueError as e:
+                return self._json({"error": str(e)}), 400
+            except Exception as e:
+                return self._json({"error": str(e)}), 500
+
+        @self._app.route("/api/companies/top", methods=["GET"])
+        @self._conditional()
+        async def get_top_companies():
+            try:
+                filters = self._company_service._build_filters(
+                    request.args,
+                    [
+                        ("industry", Industry),
+                        ("department", Department),
+                        ("experience_level", ExperienceLevel)
+                    ]
+                )
+                k = int(request.args.get("k") or 5)
+
+                return self._json(await self._company_service.top_companies(filters, k)), 200
+            except ValueError as e:
+                return self._json({"error": str(e)}), 400
             except Exception as e:
-                return jsonify({"error": str(e)}), 500
+                return self._json({"error": str(e)}), 500
 
+        # The benchmark histogram covers every company, so any insert counts.
         @self._app.route("/api/companies/<string:company_hash>", methods=["GET"])
+        @self._conditional()
         async def get_benchmark(company_hash: str):
             try:
                 filters: FilterParams = {}
@@ -157,7 +514,12 @@ class AppAPI:
                     ]
                 )
 
-                if not filters:
+                approximation = None
+                if self._approximate():
+                    bargraph_data, current_average, piegraph_data, approximation = (
+                        await self._company_service.fetch_approximate_records(range_steps, filters, company_hash)
+                    )
+                elif not filters:
                     bargraph_data, current_average, piegraph_data = await self._company_service.fetch_filtered_records(
                         salary_range_step=range_steps, id=company_hash
                     )
@@ -166,16 +528,17 @@ class AppAPI:
                         salary_range_step=range_steps, filters=filters, id=company_hash
                     )
 
-                return jsonify(
-                    {
-                        "bar_graph": bargraph_data,
-                        "current_avg": current_average,
-                        "pie_graph": piegraph_data,
-                    }
-                ), 200
+                body = {
+                    "bar_graph": bargraph_data,
+                    "current_avg": current_average,
+                    "pie_graph": piegraph_data,
+                }
+                if approximation is not None:
+                    body["approximation"] = approximation
+                return self._json(body), 200
 
             except Exception as e:
-                return jsonify({"error": str(e)}), 500
+                return self._json({"error": str(e)}), 500
 
     def _setup_frontend_routes(self):
         @self._app.route("/")
@@ -223,58 +586,260 @@ class AppAPI:
                 error_message="This method is not allowed for the requested resource."
             ), 405
 
+    def use_services(self, salary_service: Service, company_service: Service) -> None:
+        """Attaches services built after the app, on the loop that serves it."""
+        self._salary_service = salary_service
+        self._company_service = company_service
+
+    async def close(self) -> None:
+        """Closes every database controller the services use, each once."""
+        controllers = []
+        for service in (self._salary_service, self._company_service):
+            if service and not any(service.db_controller is controller for controller in controllers):
+                controllers.append(service.db_controller)
+        for controller in controllers:
+            await controller.close()
+
     def run(self, host: str = "0.0.0.0", port: int = 5000, debug: bool = False):
         self._app.run(host=host, port=port, debug=debug)
 
 
-async def main():
-    salary_service = SalaryService()
-    company_service = CompanyService()
+def _build_sqlite_controller(settings: Settings, db_name: str,
+                             slow_query_log: Optional[SlowQueryLog]) -> DatabaseController:
+    connection_manager = ConnectionManager(
+        db_name,
+        read_pool_size=settings.read_pool_size,
+        busy_timeout_ms=settings.busy_timeout_ms,
+        busy_retries=settings.busy_retries,
+    )
+    write_queue = (
+        WriteBehindQueue(
+            connection_manager,
+            max_batch_size=settings.write_batch_size,
+            max_latency_ms=settings.write_flush_ms,
+        )
+        if settings.write_behind
+        else None
+    )
+    return DatabaseController(
+        connection_manager=connection_manager, write_queue=write_queue, slow_query_log=slow_query_log
+    )
+
+
+async def build_services(settings: Settings, metrics: Optional[Metrics] = None) -> tuple[SalaryService, CompanyService]:
+    slow_query_log = SlowQueryLog(settings.slow_query_ms) if settings.slow_query_ms > 0 else None
+    shards = [
+        _build_sqlite_controller(settings, db_name, slow_query_log)
+        for db_name in shard_paths(settings.db_name, settings.shards)
+    ]
+    db_controller = shards[0]
+    if settings.shards > 1:
+        if settings.backend != "sqlite":
+            raise ValueError("Sharding requires the sqlite backend")
+        db_controller = ShardedDatabaseController(shards)
+    if settings.backend == "columnar":
+        from SHEweldo.controllers.columnar import ColumnarDatabaseController
+
+        db_controller = ColumnarDatabaseController(db_controller)
+    elif settings.backend == "duckdb":
+        from SHEweldo.controllers.duckdb_backend import DuckDBDatabaseController
+
+        db_controller = DuckDBDatabaseController(db_controller)
+    elif settings.backend != "sqlite":
+        raise ValueError(f"Unknown backend {settings.backend!r}; expected 'sqlite', 'columnar' or 'duckdb'")
+
+    cache = None
+    if settings.cache_enabled:
+        cache = ResultCache(
+            max_entries=settings.cache_max_entries,
+            max_bytes=settings.cache_max_bytes,
+            ttl_seconds=settings.cache_ttl_seconds,
+        )
+        db_controller.add_listener(cache)
+
+    leaderboard = Leaderboard(max_k=settings.leaderboard_max_k)
+    sampler = (
+        StratifiedSampler(settings.approx_sample_size, settings.approx_company_sample_size)
+        if settings.approx_sample_size > 0 and settings.approx_company_sample_size > 0
+        else None
+    )
+
+    live = (
+        LiveHub(db_controller, make_encoder(settings.json_encoder), settings.live_max_subscribers)
+        if settings.live_max_subscribers > 0
+        else None
+    )
+
+    salary_service = SalaryService(db_controller, cache, sampler, live)
+    company_service = CompanyService(db_controller, cache, leaderboard, sampler)
 
     await salary_service.initialize()
     await company_service.initialize()
 
-    api = AppAPI(salary_service, company_service)
+    await leaderboard.load(db_controller)
+    db_controller.add_listener(leaderboard)
+    if sampler:
+        await sampler.load(db_controller)
+        db_controller.add_listener(sampler)
+    if live:
+        db_controller.add_listener(live)
+
+    if metrics:
+        metrics.instrument_controller(db_controller)
+        for index, shard in enumerate(shards):
+            suffix = f"_shard{index}" if len(shards) > 1 else ""
+            shard.connections.wait_observer = metrics.observe_connection_wait
+            metrics.add_stats(f"connections{suffix}", shard.connections.stats)
+            if shard.write_queue:
+                metrics.add_stats(f"write_queue{suffix}", shard.write_queue.stats)
+        if cache:
+            metrics.add_stats("result_cache", cache.stats)
+        metrics.add_stats("leaderboard", leaderboard.stats)
+        if sampler:
+            metrics.add_stats("sampler", sampler.stats)
+        if live:
+            metrics.add_stats("live", live.stats)
+        if slow_query_log:
+            metrics.add_stats("slow_query_log", slow_query_log.stats)
+
+    return salary_service, company_service
+
+
+def build_api(settings: Settings, salary_service: Optional[SalaryService], company_service: Optional[CompanyService],
+              metrics: Optional[Metrics] = None) -> AppAPI:
+    return AppAPI(
+        salary_service,
+        company_service,
+        encoder=make_encoder(settings.json_encoder),
+        response_cache=EncodedResponseCache(settings.response_cache_max_bytes) if settings.cache_enabled else None,
+        max_batch_size=settings.max_batch_size,
+        metrics=metrics,
+        debug=settings.debug,
+        live_keepalive=settings.live_keepalive_seconds,
+        debug_endpoints=settings.debug_endpoints,
+    )
+
 
-    api.run(debug=True)
+async def prewarm(salary_service: SalaryService) -> int:
+    """Opens every pooled connection and fills the result cache. Returns the results computed."""
+    await salary_service.db_controller.warm()
+    return await salary_service.prewarm()
+
+
+async def follow_other_writers(salary_service: SalaryService, company_service: CompanyService,
+                               interval: float) -> None:
+    """
+    Keeps one worker's in-memory state in step with writes made by other
+    processes: the other workers, and manage.py commands such as import,
+    seed and rebuild-rollups. Those writes never reach this process's
+    listeners, so when the stored data versions move the result cache is
+    dropped, the leaderboard rebuilt and live views reloaded; ETags follow
+    the refreshed versions by themselves. The approximation samples scan
+    every salary to rebuild, so they are only marked stale and rebuilt by
+    the next approximate graph, once however many writes came before it.
+    Results may lag other processes' writes by up to `interval` seconds.
+    """
+    controller = salary_service.db_controller
+    rebuilt = [state for state in (company_service.leaderboard, salary_service.live) if state]
+    stale = False
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            if await controller.refresh_data_versions():
+                if salary_service.cache:
+                    salary_service.cache.clear()
+                if company_service.sampler:
+                    company_service.sampler.stale = True
+                stale = True
+            if stale and rebuilt:
+                version = controller.get_data_version()
+                for state in rebuilt:
+                    await state.reload(controller)
+                # An insert that landed mid-rebuild may be missing from it.
+                stale = controller.get_data_version() != version
+            else:
+                stale = False
+        except Exception as e:
+            print(f"Worker sync failed: {e}")
+
+
+def create_app(settings: Optional[Settings] = None) -> Quart:
+    """
+    Application factory for Hypercorn workers. Services are built in
+    before_serving, on the loop that will serve them, so every worker owns
+    its connections, and they are closed again in after_serving.
+    """
+    settings = settings or Settings.from_env()
+    metrics = None
+    if settings.metrics_enabled:
+        # Each worker counts only the requests it served itself.
+        shared = settings.workers > 1
+        if shared:
+            os.makedirs(settings.metrics_dir, exist_ok=True)
+        metrics = Metrics(settings.metrics_dir if shared else None)
+    api = build_api(settings, None, None, metrics)
+    sync_task: Optional[asyncio.Task] = None
+
+    @api._app.before_serving
+    async def start_services():
+        nonlocal sync_task
+        started = time.perf_counter()
+        salary_service, company_service = await build_services(settings, metrics)
+        api.use_services(salary_service, company_service)
+        built = time.perf_counter()
+
+        warmed = await prewarm(salary_service) if settings.prewarm else 0
+        # Even a lone worker shares the database with manage.py. The columnar
+        # backend serves the rows it loaded at startup, so it has nothing to
+        # follow.
+        if settings.backend != "columnar":
+            sync_task = asyncio.get_running_loop().create_task(
+                follow_other_writers(salary_service, company_service, settings.worker_sync_ms / 1000)
+            )
+        finished = time.perf_counter()
+        print(
+            f"Worker {os.getpid()} ready in {finished - started:.2f}s "
+            f"(services {built - started:.2f}s, prewarm {finished - built:.2f}s, {warmed} results)"
+        )
+
+    @api._app.after_serving
+    async def stop_services():
+        if sync_task:
+            sync_task.cancel()
+            try:
+                await sync_task
+            except asyncio.CancelledError:
+                pass
+        await api.close()
+        print(f"Worker {os.getpid()} stopped")
 
+    return api._app
 
-if __name__ == "__main__":
-    import logging
-    import os
-    import asyncio
+
+def main() -> int:
     from hypercorn.config import Config
-    from hypercorn.asyncio import serve
+    from hypercorn.run import run
 
-    log_file = os.path.abspath("app.log")
-    logging.basicConfig(
-        level=logging.INFO,
-        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-        handlers=[
-            logging.FileHandler(log_file),
-            logging.StreamHandler()
-        ]
-    )
     logger = logging.getLogger(__name__)
-    logger.info("===== Application Starting =====")
+    settings = Settings.from_env()
+    if settings.workers > 1 and settings.backend == "columnar":
+        # Each worker would hold its own copy of every row, blind to the others' inserts.
+        raise ValueError("The columnar backend serves from process memory; run it with SHEWELDO_WORKERS=1")
 
-    async def setup_app():
-        from SHEweldo.services import SalaryService, CompanyService
-        
-        salary_service = SalaryService()
-        company_service = CompanyService()
-        await salary_service.initialize()
-        await company_service.initialize()
-        
-        from SHEweldo.app import AppAPI
-        api = AppAPI(salary_service, company_service)
-        return api._app
+    if settings.metrics_enabled and settings.workers > 1 and os.path.isdir(settings.metrics_dir):
+        # Counts left by an earlier run would be added to this one's.
+        for file_name in os.listdir(settings.metrics_dir):
+            if file_name.endswith((".json", ".json.tmp")):
+                os.remove(os.path.join(settings.metrics_dir, file_name))
 
     config = Config()
-    config.bind = ["0.0.0.0:5000"]
-    config.use_reloader = True
+    config.bind = [settings.bind]
+    config.workers = settings.workers
+    config.use_reloader = settings.debug
     config.loglevel = "info"
     config.logconfig = None
+    # Every worker imports the app and calls the factory itself.
+    config.application_path = "SHEweldo.app:create_app()"
 
     certfile_path = os.path.join("SHEweldo", "localhost.pem")
     keyfile_path = os.path.join("SHEweldo", "localhost-key.pem")
@@ -286,10 +851,29 @@ if __name__ == "__main__":
     # else:
     #     logger.warning("SSL/TLS certificates not found. Running in HTTP mode.")
 
+    logger.info(
+        f"Serving on {settings.bind} with {settings.workers} worker(s), "
+        f"debug {'on' if settings.debug else 'off'}, {settings.backend} backend"
+    )
+    return run(config)
+
+
+if __name__ == "__main__":
+    log_file = os.path.abspath("app.log")
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+        handlers=[
+            logging.FileHandler(log_file),
+            logging.StreamHandler()
+        ]
+    )
+    logger = logging.getLogger(__name__)
+    logger.info("===== Application Starting =====")
+
     try:
         logger.info(f"Log file location: {log_file}")
-        app = asyncio.run(setup_app())
-        asyncio.run(serve(app, config))
+        sys.exit(main())
     except Exception as e:
         logger.exception("Server failed to start")
-        raise
\ No newline at end of file
+        raise
@@ -0,0 +1,250 @@
+import asyncio
+import itertools
+import json
+import math
+import platform
+import random
+import time
+from dataclasses import asdict, dataclass
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from SHEweldo.app import build_api, build_services
+from SHEweldo.config import Settings
+from SHEweldo.dataset import generate_dataset, populate
+from SHEweldo.metrics import Metrics
+from SHEweldo.models.entities import Company
+from SHEweldo.models.enums import *
+
+# A request factory returns (method, path, options for the test client).
+RequestFactory = Callable[[random.Random], Tuple[str, str, Dict[str, Any]]]
+
+
+@dataclass
+class EndpointResult:
+    requests: int
+    errors: int
+    p50_ms: float
+    p95_ms: float
+    p99_ms: float
+    mean_ms: float
+    max_ms: float
+    throughput_rps: float
+
+
+def _percentile(ordered: List[float], percentile: float) -> float:
+    """Nearest-rank percentile of an ascending list."""
+    return ordered[max(0, math.ceil(percentile / 100 * len(ordered)) - 1)]
+
+
+def _summarize(latencies: List[float], errors: int, wall_seconds: float) -> EndpointResult:
+    ordered = sorted(latencies)
+    return EndpointResult(
+        requests=len(ordered),
+        errors=errors,
+        p50_ms=_percentile(ordered, 50) * 1000,
+        p95_ms=_percentile(ordered, 95) * 1000,
+        p99_ms=_percentile(ordered, 99) * 1000,
+        mean_ms=sum(ordered) / len(ordered) * 1000,
+        max_ms=ordered[-1] * 1000,
+        throughput_rps=len(ordered) / wall_seconds,
+    )
+
+
+def _salary_payload(rng: random.Random, company_hash: str) -> Dict[str, Any]:
+    return {
+        "company_hash": company_hash,
+        "years_at_the_company": rng.randint(0, 10),
+        "total_experience": rng.randint(0, 25),
+        "salary_amount": round(rng.lognormvariate(10.75, 0.35), 2),
+        "gender": rng.choice(list(Gender)).value,
+        "submission_date": f"2025-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+        "is_well_compensated": rng.random() < 0.5,
+        "department": rng.choice(list(Department)).value,
+        "job_title": "Engineer",
+    }
+
+
+def build_endpoints(companies: List[Company]) -> Dict[str, RequestFactory]:
+    """
+    One request factory per AppAPI route, reads first. Requests vary their
+    filters so they are not all answered from one cache entry. Writes come
+    last so the reads run against the generated dataset only.
+    """
+    hashes = [company.id for company in companies]
+    names = itertools.count()
+
+    def filter_query(rng: random.Random) -> str:
+        name, enum_cls = rng.choice([
+            ("department", Department), ("experience_level", ExperienceLevel), ("industry", Industry),
+        ])
+        return f"{name}={rng.choice(list(enum_cls)).value}"
+
+    def company_payload(rng: random.Random) -> Dict[str, Any]:
+        return {
+            "company_name": f"Benchmark Company {next(names)}",
+            "company_size": rng.choice([10, 200, 2000, 20000]),
+            "company_industry": rng.choice(list(Industry)).value,
+            "country": "Philippines",
+        }
+
+    return {
+        "GET /api/graphs/employee": lambda rng: ("GET", f"/api/graphs/employee?company_hash={rng.choice(hashes)}", {
+            "headers": {"Cookie": f"salary_amount={rng.randint(20, 150) * 1000}; salary_id=benchmark"},
+        }),
+        "GET /api/graphs/employee?approx=": lambda rng: ("GET", f"/api/graphs/employee?{filter_query(rng)}&approx=true", {
+            "headers": {"Cookie": f"salary_amount={rng.randint(20, 150) * 1000}; salary_id=benchmark"},
+        }),
+        "GET /api/graphs/percentiles": lambda rng: ("GET", f"/api/graphs/percentiles?{filter_query(rng)}", {}),
+        "GET /api/graphs/pay-gap": lambda rng: ("GET", f"/api/graphs/pay-gap?{filter_query(rng)}", {}),
+        "GET /api/employee/export": lambda rng: ("GET", f"/api/employee/export?{filter_query(rng)}&limit=500", {}),
+        "GET /api/companies": lambda rng: ("GET", "/api/companies", {}),
+        "GET /api/companies?q=": lambda rng: ("GET", f"/api/companies?q=Company {rng.randint(0, 9)}", {}),
+        "GET /api/companies/top": lambda rng: ("GET", f"/api/companies/top?{filter_query(rng)}", {}),
+        "GET /api/companies/<hash>": lambda rng: ("GET", f"/api/companies/{rng.choice(hashes)}", {}),
+        "GET /api/companies/<hash>?approx=": lambda rng: (
+            "GET", f"/api/companies/{rng.choice(hashes)}?{filter_query(rng)}&approx=true", {}
+        ),
+        "GET /metrics": lambda rng: ("GET", "/metrics", {}),
+        "GET /": lambda rng: ("GET", "/", {}),
+        "GET /employee/submit": lambda rng: ("GET", "/employee/submit", {}),
+        "GET /company/submit": lambda rng: ("GET", "/company/submit", {}),
+        "GET /employee/graph": lambda rng: ("GET", "/employee/graph", {}),
+        "GET /company/graph": lambda rng: ("GET", "/company/graph", {}),
+        "POST /api/employee/submit": lambda rng: ("POST", "/api/employee/submit", {
+            "json": _salary_payload(rng, rng.choice(hashes)),
+        }),
+        "POST /api/company/submit": lambda rng: ("POST", "/api/company/submit", {"json": company_payload(rng)}),
+        "POST /api/employee/submit/batch": lambda rng: ("POST", "/api/employee/submit/batch", {
+            "json": [_salary_payload(rng, rng.choice(hashes)) for _ in range(100)],
+        }),
+        "POST /api/company/submit/batch": lambda rng: ("POST", "/api/company/submit/batch", {
+            "json": [company_payload(rng) for _ in range(20)],
+        }),
+    }
+
+
+async def _run_endpoint(client, factory: RequestFactory, rng: random.Random, requests: int,
+                        concurrency: int) -> EndpointResult:
+    latencies: List[float] = []
+    errors = 0
+    # Workers draw from one shared budget, so `requests` is the total.
+    budget = iter(range(requests))
+
+    async def worker():
+        nonlocal errors
+        for _ in budget:
+            method, path, options = factory(rng)
+            started = time.perf_counter()
+            response = await client.open(path, method=method, **options)
+            await response.get_data()
+            latencies.append(time.perf_counter() - started)
+            if response.status_code >= 400:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return _summarize(latencies, errors, time.perf_counter() - started)
+
+
+async def run_benchmark(settings: Settings, companies: int = 200, salaries: int = 20000, seed: int = 0,
+                        requests: int = 200, concurrency: int = 8, warmup: int = 20,
+                        only: Optional[List[str]] = None) -> Dict[str, Any]:
+    """
+    Generates the dataset into `settings.db_name`, which should not exist
+    yet, then drives every route in-process through Quart's test client
+    with `concurrency` requests in flight. Returns the results as a
+    JSON-serializable dict of run metadata and per-endpoint results.
+    """
+    generated_companies, generated_salaries = generate_dataset(companies, salaries, seed)
+    metrics = Metrics() if settings.metrics_enabled else None
+    salary_service, company_service = await build_services(settings, metrics)
+    try:
+        await populate(salary_service.db_controller, generated_companies, generated_salaries, chunk_size=5000)
+        client = build_api(settings, salary_service, company_service, metrics)._app.test_client()
+        rng = random.Random(seed)
+
+        results = {}
+        for name, factory in build_endpoints(generated_companies).items():
+            if only and not any(fragment in name for fragment in only):
+                continue
+            if name == "GET /metrics" and metrics is None:
+                continue
+            if warmup:
+                await _run_endpoint(client, factory, rng, warmup, concurrency)
+            results[name] = asdict(await _run_endpoint(client, factory, rng, requests, concurrency))
+            print(f"{name:<34} {_format_result(results[name])}")
+    finally:
+        await salary_service.db_controller.close()
+
+    return {
+        "meta": {
+            "companies": companies,
+            "salaries": salaries,
+            "seed": seed,
+            "requests": requests,
+            "concurrency": concurrency,
+            "backend": settings.backend,
+            "cache": settings.cache_enabled,
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "created_at": time.time(),
+        },
+        "endpoints": results,
+    }
+
+
+def _format_result(result: Dict[str, Any]) -> str:
+    return (
+        f"p50 {result['p50_ms']:8.2f} ms  p95 {result['p95_ms']:8.2f} ms  p99 {result['p99_ms']:8.2f} ms  "
+        f"{result['throughput_rps']:8.1f} req/s  {result['errors']} error(s)"
+    )
+
+
+def _change(current: float, baseline: float) -> float:
+    return (current - baseline) / baseline if baseline else 0.0
+
+
+def compare_to_baseline(results: Dict[str, Any], baseline: Dict[str, Any],
+                        tolerance: float = 0.1) -> Tuple[List[str], List[str]]:
+    """
+    Returns (report lines, regressed endpoint names). An endpoint regresses
+    when its p50 or p95 latency grows, or its throughput falls, by more
+    than `tolerance` relative to the baseline, or when it fails more often.
+    """
+    lines = []
+    regressions = []
+    for name, current in results["endpoints"].items():
+        previous = baseline.get("endpoints", {}).get(name)
+        if previous is None:
+            lines.append(f"{name:<34} new endpoint, no baseline")
+            continue
+        changes = {
+            "p50": _change(current["p50_ms"], previous["p50_ms"]),
+            "p95": _change(current["p95_ms"], previous["p95_ms"]),
+            "p99": _change(current["p99_ms"], previous["p99_ms"]),
+            "throughput": _change(current["throughput_rps"], previous["throughput_rps"]),
+        }
+        regressed = (
+            changes["p50"] > tolerance
+            or changes["p95"] > tolerance
+            or changes["throughput"] < -tolerance
+            or current["errors"] > previous["errors"]
+        )
+        if regressed:
+            regressions.append(name)
+        lines.append(
+            f"{name:<34} " + "  ".join(f"{key} {change:+7.1%}" for key, change in changes.items())
+            + ("  REGRESSED" if regressed else "")
+        )
+    return lines, regressions
+
+
+def load_results(path: str) -> Dict[str, Any]:
+    with open(path, encoding="utf-8") as stream:
+        return json.load(stream)
+
+
+def save_results(results: Dict[str, Any], path: str) -> None:
+    with open(path, "w", encoding="utf-8") as stream:
+        json.dump(results, stream, indent=2)
+        stream.write("\n")
@@ -0,0 +1,188 @@
+import json
+import time
+from collections import OrderedDict
+from enum import Enum
+from typing import Any, Dict, FrozenSet, Hashable, Iterable, Optional, Tuple
+
+from SHEweldo.controllers.database import FilterParams, InsertListener
+from SHEweldo.models.entities import Company, SalaryRecord
+
+
+def normalize_filters(filters: Optional[FilterParams]) -> Tuple[Tuple[str, str], ...]:
+    if not filters:
+        return ()
+    return tuple(sorted(
+        (key, value.value if isinstance(value, Enum) else str(value))
+        for key, value in filters.items()
+    ))
+
+
+class _Entry:
+    __slots__ = ("value", "filters", "companies", "size", "expires_at")
+
+    def __init__(self, value: Any, filters: Dict[str, str], companies: FrozenSet[str], size: int, expires_at: float):
+        self.value = value
+        self.filters = filters
+        self.companies = companies
+        self.size = size
+        self.expires_at = expires_at
+
+
+class ResultCache(InsertListener):
+    """
+    Bounded LRU cache for graph query results, keyed on the normalized filters
+    and range step. Entries expire after `ttl_seconds` and the least recently
+    used ones are evicted once either `max_entries` or `max_bytes` is reached.
+
+    As an InsertListener it drops only the entries an insert can change: those
+    whose filters all match the new salary, or that are scoped to its company.
+    """
+
+    def __init__(self, max_entries: int = 1024, max_bytes: int = 32 * 1024 * 1024, ttl_seconds: float = 60.0):
+        self._max_entries = max_entries
+        self._max_bytes = max_bytes
+        self._ttl = ttl_seconds
+        self._entries: "OrderedDict[Hashable, _Entry]" = OrderedDict()
+        self._bytes = 0
+
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._invalidations = 0
+
+    @staticmethod
+    def make_key(namespace: str, filters: Optional[FilterParams], range_step: int, scope: Optional[str] = None) -> Hashable:
+        return (namespace, normalize_filters(filters), range_step, scope)
+
+    def get(self, key: Hashable) -> Tuple[bool, Any]:
+        entry = self._entries.get(key)
+        if entry is None:
+            self._misses += 1
+            return False, None
+        if entry.expires_at <= time.monotonic():
+            self._remove(key)
+            self._misses += 1
+            return False, None
+
+        self._entries.move_to_end(key)
+        self._hits += 1
+        return True, entry.value
+
+    def put(self, key: Hashable, value: Any, filters: Optional[FilterParams], companies: Iterable[str] = ()) -> None:
+        size = len(json.dumps(value, default=str))
+        if size > self._max_bytes:
+            return
+
+        if key in self._entries:
+            self._remove(key)
+
+        self._entries[key] = _Entry(
+            value,
+            dict(normalize_filters(filters)),
+            frozenset(company for company in companies if company),
+            size,
+            time.monotonic() + self._ttl,
+        )
+        self._bytes += size
+
+        while self._entries and (len(self._entries) > self._max_entries or self._bytes > self._max_bytes):
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self._evictions += 1
+
+    def _remove(self, key: Hashable) -> None:
+        entry = self._entries.pop(key)
+        self._bytes -= entry.size
+
+    def _invalidate_where(self, affected) -> None:
+        stale = [key for key, entry in self._entries.items() if affected(entry)]
+        for key in stale:
+            self._remove(key)
+        self._invalidations += len(stale)
+
+    def on_salary_inserted(self, record: SalaryRecord, industry: str) -> None:
+        attributes = {
+            "company_hash": record.company_hash,
+            "industry": industry,
+            "department": record.department.value,
+            "experience_level": record.experience_level.value,
+            "gender": record.gender.value,
+        }
+        self._invalidate_where(
+            lambda entry: record.company_hash in entry.companies
+            or all(attributes.get(key) == value for key, value in entry.filters.items())
+        )
+
+    def on_company_inserted(self, company: Company) -> None:
+        # Registering a company can move its earlier salaries into an industry.
+        self._invalidate_where(
+            lambda entry: company.id in entry.companies
+            or entry.filters.get("industry") == company.industry.value
+        )
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "max_entries": self._max_entries,
+            "max_bytes": self._max_bytes,
+            "ttl_seconds": self._ttl,
+            "hits": self._hits,
+            "misses": self._misses,
+            "evictions": self._evictions,
+            "invalidations": self._invalidations,
+        }
+
+
+class EncodedResponseCache:
+    """
+    Encoded response bodies keyed on the request and the ETag of the data
+    they were built from. The ETag changes with the data version, so entries
+    never go stale: outdated ones are simply no longer requested and fall
+    out of the LRU once `max_bytes` is reached.
+    """
+
+    def __init__(self, max_bytes: int = 8 * 1024 * 1024):
+        self._max_bytes = max_bytes
+        self._entries: "OrderedDict[Hashable, bytes]" = OrderedDict()
+        self._bytes = 0
+
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    def get(self, key: Hashable) -> Optional[bytes]:
+        body = self._entries.get(key)
+        if body is None:
+            self._misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self._hits += 1
+        return body
+
+    def put(self, key: Hashable, body: bytes) -> None:
+        if len(body) > self._max_bytes:
+            return
+        if key in self._entries:
+            self._bytes -= len(self._entries.pop(key))
+
+        self._entries[key] = body
+        self._bytes += len(body)
+        while self._bytes > self._max_bytes:
+            _, oldest = self._entries.popitem(last=False)
+            self._bytes -= len(oldest)
+            self._evictions += 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "max_bytes": self._max_bytes,
+            "hits": self._hits,
+            "misses": self._misses,
+            "evictions": self._evictions,
+        }
@@ -0,0 +1,118 @@
+import os
+from dataclasses import dataclass
+
+
+def _env_int(name: str, default: int) -> int:
+    value = os.environ.get(name)
+    return int(value) if value not in (None, "") else default
+
+
+def _env_float(name: str, default: float) -> float:
+    value = os.environ.get(name)
+    return float(value) if value not in (None, "") else default
+
+
+def _env_bool(name: str, default: bool) -> bool:
+    value = os.environ.get(name)
+    if value in (None, ""):
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
+@dataclass
+class Settings:
+    db_name: str = "record.db"
+    # "sqlite" answers graph queries from the rollup tables, "columnar" from
+    # NumPy columns held in memory (requires numpy), "duckdb" from an
+    # in-memory DuckDB copy of the raw rows (requires duckdb).
+    backend: str = "sqlite"
+    # Split salaries by company over this many SQLite files, named after
+    # db_name (see controllers/sharding.py); 1 keeps the single file. Change
+    # it on an existing database with `manage.py reshard`.
+    shards: int = 1
+    read_pool_size: int = 4
+    busy_timeout_ms: int = 5000
+    busy_retries: int = 5
+    write_behind: bool = False
+    write_batch_size: int = 100
+    write_flush_ms: float = 10.0
+    cache_enabled: bool = True
+    cache_max_entries: int = 1024
+    cache_max_bytes: int = 32 * 1024 * 1024
+    cache_ttl_seconds: float = 60.0
+    leaderboard_max_k: int = 100
+    # Random samples behind approx=true graphs: salaries kept per (industry,
+    # department, experience level, gender) stratum and companies kept per
+    # industry. 0 turns sampling off and approx=true returns exact graphs.
+    approx_sample_size: int = 32
+    approx_company_sample_size: int = 256
+    # Clients following /api/graphs/employee/live at once, over all views;
+    # 0 turns the endpoint off. Idle streams get a comment this often so
+    # proxies keep them open.
+    live_max_subscribers: int = 1000
+    live_keepalive_seconds: float = 15.0
+    # "auto" encodes responses with orjson when it is installed, else json.
+    json_encoder: str = "auto"
+    response_cache_max_bytes: int = 8 * 1024 * 1024
+    # Most items accepted by one request to a batch submit endpoint.
+    max_batch_size: int = 1000
+    # Serve Prometheus metrics on /metrics and time every route and query.
+    metrics_enabled: bool = True
+    # With several workers, where each writes its metrics for whichever one
+    # answers the scrape to add up; emptied when the server starts.
+    metrics_dir: str = "worker-metrics"
+    # Log read queries slower than this, with their plan; 0 turns it off.
+    slow_query_ms: float = 0.0
+    # Serve the /api/debug routes, which are unauthenticated; keep them off
+    # on anything reachable by the public.
+    debug_endpoints: bool = False
+    # Server launch: Hypercorn worker processes, each with its own services
+    # on its own event loop, and the address they share.
+    bind: str = "0.0.0.0:5000"
+    workers: int = 1
+    # Debug mode and the code reloader; never in production.
+    debug: bool = False
+    # Open every pooled connection and fill the result cache with the
+    # common single-filter graphs before a worker accepts requests.
+    prewarm: bool = True
+    # How often each worker checks the data versions for writes made by
+    # other processes (the other workers, manage.py import, seed and
+    # rebuild-rollups) and drops its now stale in-memory results.
+    worker_sync_ms: float = 1000.0
+
+    @classmethod
+    def from_env(cls) -> "Settings":
+        return cls(
+            db_name=os.environ.get("SHEWELDO_DB", cls.db_name),
+            backend=os.environ.get("SHEWELDO_BACKEND", cls.backend).strip().lower(),
+            shards=_env_int("SHEWELDO_SHARDS", cls.shards),
+            read_pool_size=_env_int("SHEWELDO_READ_POOL_SIZE", cls.read_pool_size),
+            busy_timeout_ms=_env_int("SHEWELDO_BUSY_TIMEOUT_MS", cls.busy_timeout_ms),
+            busy_retries=_env_int("SHEWELDO_BUSY_RETRIES", cls.busy_retries),
+            write_behind=_env_bool("SHEWELDO_WRITE_BEHIND", cls.write_behind),
+            write_batch_size=_env_int("SHEWELDO_WRITE_BATCH_SIZE", cls.write_batch_size),
+            write_flush_ms=_env_float("SHEWELDO_WRITE_FLUSH_MS", cls.write_flush_ms),
+            cache_enabled=_env_bool("SHEWELDO_CACHE", cls.cache_enabled),
+            cache_max_entries=_env_int("SHEWELDO_CACHE_MAX_ENTRIES", cls.cache_max_entries),
+            cache_max_bytes=_env_int("SHEWELDO_CACHE_MAX_BYTES", cls.cache_max_bytes),
+            cache_ttl_seconds=_env_float("SHEWELDO_CACHE_TTL_SECONDS", cls.cache_ttl_seconds),
+            leaderboard_max_k=_env_int("SHEWELDO_LEADERBOARD_MAX_K", cls.leaderboard_max_k),
+            approx_sample_size=_env_int("SHEWELDO_APPROX_SAMPLE_SIZE", cls.approx_sample_size),
+            approx_company_sample_size=_env_int(
+                "SHEWELDO_APPROX_COMPANY_SAMPLE_SIZE", cls.approx_company_sample_size
+            ),
+            live_max_subscribers=_env_int("SHEWELDO_LIVE_MAX_SUBSCRIBERS", cls.live_max_subscribers),
+            live_keepalive_seconds=_env_float("SHEWELDO_LIVE_KEEPALIVE_SECONDS", cls.live_keepalive_seconds),
+            json_encoder=os.environ.get("SHEWELDO_JSON_ENCODER", cls.json_encoder).strip().lower(),
+            response_cache_max_bytes=_env_int("SHEWELDO_RESPONSE_CACHE_MAX_BYTES", cls.response_cache_max_bytes),
+            max_batch_size=_env_int("SHEWELDO_MAX_BATCH_SIZE", cls.max_batch_size),
+            metrics_enabled=_env_bool("SHEWELDO_METRICS", cls.metrics_enabled),
+            metrics_dir=os.environ.get("SHEWELDO_METRICS_DIR", cls.metrics_dir),
+            slow_query_ms=_env_float("SHEWELDO_SLOW_QUERY_MS", cls.slow_query_ms),
+            debug_endpoints=_env_bool("SHEWELDO_DEBUG_ENDPOINTS", cls.debug_endpoints),
+            bind=os.environ.get("SHEWELDO_BIND", cls.bind),
+            workers=_env_int("SHEWELDO_WORKERS", cls.workers),
+            debug=_env_bool("SHEWELDO_DEBUG", cls.debug),
+            prewarm=_env_bool("SHEWELDO_PREWARM", cls.prewarm),
+            worker_sync_ms=_env_float("SHEWELDO_WORKER_SYNC_MS", cls.worker_sync_ms),
+        )
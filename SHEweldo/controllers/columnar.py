@@ -0,0 +1,311 @@
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from SHEweldo.models.entities import SalaryRecord, Company
+from SHEweldo.models.enums import *
+from SHEweldo.controllers.database import DatabaseController, FilterParams, IDatabaseController, InsertListener
+from SHEweldo.controllers.rollups import ROLLUP_BUCKET_WIDTH, percentiles_from_buckets
+from SHEweldo.controllers.slow_queries import SlowQueryLog
+from SHEweldo.controllers.versions import GLOBAL_SCOPE, DataVersion
+
+_DEPARTMENT_CODES = {department: code for code, department in enumerate(Department)}
+_EXPERIENCE_CODES = {level: code for code, level in enumerate(ExperienceLevel)}
+_GENDER_CODES = {gender: code for code, gender in enumerate(Gender)}
+_INDUSTRY_CODES = {industry: code for code, industry in enumerate(Industry)}
+
+# Industry code of a company whose salaries arrived before it was registered.
+_NO_INDUSTRY = -1
+
+# Salaries read and appended to the columns at a time when loading.
+_LOAD_CHUNK_SIZE = 10000
+
+
+class _SalaryColumns:
+    """
+    Append-only column store. Arrays grow by doubling, and only the first
+    `size` entries are live, so an insert is amortized O(1).
+    """
+
+    _DTYPES = {
+        "company": np.int32,
+        "department": np.int8,
+        "experience_level": np.int8,
+        "gender": np.int8,
+        "salary_amount": np.float64,
+        "is_well_compensated": np.bool_,
+    }
+
+    def __init__(self, capacity: int = 1024):
+        self.size = 0
+        self._arrays = {name: np.empty(capacity, dtype=dtype) for name, dtype in self._DTYPES.items()}
+
+    def __getitem__(self, name: str) -> np.ndarray:
+        return self._arrays[name][:self.size]
+
+    def _reserve(self, capacity: int) -> None:
+        current = len(self._arrays["company"])
+        if capacity <= current:
+            return
+        new_capacity = max(capacity, current * 2)
+        for name, array in self._arrays.items():
+            grown = np.empty(new_capacity, dtype=array.dtype)
+            grown[:self.size] = array[:self.size]
+            self._arrays[name] = grown
+
+    def extend(self, **columns) -> None:
+        count = len(columns["company"])
+        self._reserve(self.size + count)
+        for name, values in columns.items():
+            self._arrays[name][self.size:self.size + count] = values
+        self.size += count
+
+    def append(self, **values) -> None:
+        self._reserve(self.size + 1)
+        for name, value in values.items():
+            self._arrays[name][self.size] = value
+        self.size += 1
+
+
+def _histogram(values: np.ndarray, range_step: int) -> List[Dict[str, Any]]:
+    range_starts, counts = np.unique(np.floor(values / range_step) * range_step, return_counts=True)
+    return [
+        {"range_start": float(range_start), "count": int(count)}
+        for range_start, count in zip(range_starts[::-1], counts[::-1])
+    ]
+
+
+def _pie(total: int, well_compensated: int) -> List[Dict[str, Any]]:
+    return [
+        {"is_well_compensated": is_well_compensated, "count": count}
+        for is_well_compensated, count in enumerate((total - well_compensated, well_compensated))
+        if count
+    ]
+
+
+class ColumnarDatabaseController(IDatabaseController, InsertListener):
+    """
+    Keeps every salary in memory as NumPy columns and answers the graph
+    queries with vectorized masks and bincounts instead of SQL.
+
+    SQLite stays the source of truth: the columns are loaded from `store` on
+    initialize, writes and point lookups go through it, and the columns are
+    kept current by listening to its committed inserts.
+    """
+
+    def __init__(self, store: Optional[DatabaseController] = None):
+        self._store = store or DatabaseController()
+        self._store.add_listener(self)
+
+        self._columns = _SalaryColumns()
+        self._company_codes: Dict[str, int] = {}
+        self._company_hashes: List[str] = []
+        self._company_names: Dict[str, str] = {}
+        self._company_industries = np.full(16, _NO_INDUSTRY, dtype=np.int8)
+
+    @property
+    def store(self) -> DatabaseController:
+        return self._store
+
+    @property
+    def slow_query_log(self) -> Optional[SlowQueryLog]:
+        return self._store.slow_query_log
+
+    async def initialize(self):
+        await self._store.initialize()
+        await self._load()
+
+    async def _load(self) -> None:
+        companies = await self._store._fetchall("SELECT hash, name, industry FROM companies")
+        for company_hash, name, industry in companies:
+            self._register_company(company_hash, name, Industry(industry))
+
+        # A chunk at a time, so only one chunk of rows is ever held as Python
+        # objects next to the columns.
+        async for rows in self._store.iter_filtered_records({}, chunk_size=_LOAD_CHUNK_SIZE):
+            _, company_hashes, departments, experience_levels, genders, amounts, well_compensated, _ = zip(*rows)
+            self._columns.extend(
+                company=[self._company_code(company_hash) for company_hash in company_hashes],
+                department=[_DEPARTMENT_CODES[Department(value)] for value in departments],
+                experience_level=[_EXPERIENCE_CODES[ExperienceLevel(value)] for value in experience_levels],
+                gender=[_GENDER_CODES[Gender(value)] for value in genders],
+                salary_amount=amounts,
+                is_well_compensated=well_compensated,
+            )
+        print(f"Loaded {self._columns.size} salaries into columnar storage.")
+
+    def _company_code(self, company_hash: str) -> int:
+        code = self._company_codes.get(company_hash)
+        if code is None:
+            code = len(self._company_hashes)
+            self._company_codes[company_hash] = code
+            self._company_hashes.append(company_hash)
+            if code >= len(self._company_industries):
+                grown = np.full(len(self._company_industries) * 2, _NO_INDUSTRY, dtype=np.int8)
+                grown[:code] = self._company_industries[:code]
+                self._company_industries = grown
+        return code
+
+    def _register_company(self, company_hash: str, name: str, industry: Industry) -> None:
+        code = self._company_code(company_hash)
+        self._company_names[company_hash] = name
+        self._company_industries[code] = _INDUSTRY_CODES[industry]
+
+    def on_salary_inserted(self, record: SalaryRecord, industry: str) -> None:
+        self._columns.append(
+            company=self._company_code(record.company_hash),
+            department=_DEPARTMENT_CODES[record.department],
+            experience_level=_EXPERIENCE_CODES[record.experience_level],
+            gender=_GENDER_CODES[record.gender],
+            salary_amount=record.salary_amount,
+            is_well_compensated=bool(record.is_well_compensated),
+        )
+
+    def on_company_inserted(self, company: Company) -> None:
+        self._register_company(company.id, company.name, company.industry)
+
+    def add_listener(self, listener: InsertListener) -> None:
+        self._store.add_listener(listener)
+
+    def _mask(self, filters: FilterParams, company_hash: Optional[str] = None) -> np.ndarray:
+        columns = self._columns
+        mask = np.ones(columns.size, dtype=np.bool_)
+
+        for hash_val in (filters.get("company_hash"), company_hash):
+            if hash_val:
+                code = self._company_codes.get(hash_val)
+                if code is None:
+                    return np.zeros(columns.size, dtype=np.bool_)
+                mask &= columns["company"] == code
+        if "industry" in filters:
+            industries = self._company_industries[columns["company"]]
+            mask &= industries == _INDUSTRY_CODES[filters["industry"]]
+        if "department" in filters:
+            mask &= columns["department"] == _DEPARTMENT_CODES[filters["department"]]
+        if "experience_level" in filters:
+            mask &= columns["experience_level"] == _EXPERIENCE_CODES[filters["experience_level"]]
+        if "gender" in filters:
+            mask &= columns["gender"] == _GENDER_CODES[filters["gender"]]
+        return mask
+
+    def _company_averages(self, mask: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """Returns (company codes, average salary) for every company in the mask."""
+        codes = self._columns["company"][mask]
+        minlength = len(self._company_hashes)
+        counts = np.bincount(codes, minlength=minlength)
+        sums = np.bincount(codes, weights=self._columns["salary_amount"][mask], minlength=minlength)
+        present = np.flatnonzero(counts)
+        return present, sums[present] / counts[present]
+
+    async def get_company_record(self, hash_val: str) -> Optional[Company]:
+        return await self._store.get_company_record(hash_val)
+
+    async def get_all_companies(self) -> list[tuple[str, str]]:
+        return await self._store.get_all_companies()
+
+    async def search_companies(self, prefix: str = "", industry: Optional[Industry] = None,
+                               country: Optional[str] = None, after: Optional[Tuple[str, str]] = None,
+                               limit: int = 20) -> list[tuple[str, str]]:
+        return await self._store.search_companies(prefix, industry, country, after, limit)
+
+    async def insert_salary_record(self, record: SalaryRecord) -> bool:
+        return await self._store.insert_salary_record(record)
+
+    async def insert_company(self, company: Company) -> bool:
+        return await self._store.insert_company(company)
+
+    async def insert_salary_records(self, records: List[SalaryRecord]) -> List[Tuple[SalaryRecord, str]]:
+        return await self._store.insert_salary_records(records)
+
+    async def insert_companies(self, companies: List[Company]) -> List[Tuple[Company, str]]:
+        return await self._store.insert_companies(companies)
+
+    async def get_salary_record(self, salary_id: str) -> Optional[SalaryRecord]:
+        return await self._store.get_salary_record(salary_id)
+
+    async def get_filtered_records(self, filters: FilterParams) -> list[SalaryRecord]:
+        return await self._store.get_filtered_records(filters)
+
+    async def get_company_directory(self) -> list[tuple[str, str, str]]:
+        return await self._store.get_company_directory()
+
+    async def get_company_segment_totals(self) -> list[tuple[str, str, str, int, float]]:
+        return await self._store.get_company_segment_totals()
+
+    def iter_filtered_records(self, filters: FilterParams, after: int = 0, chunk_size: int = 1000,
+                              as_json: bool = False) -> AsyncIterator[List[tuple]]:
+        return self._store.iter_filtered_records(filters, after, chunk_size, as_json)
+
+    async def get_average_salary(self, company_hash: str) -> float:
+        amounts = self._columns["salary_amount"][self._mask({}, company_hash)]
+        return int(amounts.mean()) if len(amounts) else 0
+
+    async def get_benchmark_data(self, filters: FilterParams, range_step: int) -> List[Dict[str, Any]]:
+        _, averages = self._company_averages(self._mask(filters))
+        return _histogram(averages, range_step)
+
+    async def get_bar_graph_data(self, filters: FilterParams, range_step: int) -> list[dict]:
+        return _histogram(self._columns["salary_amount"][self._mask(filters)], range_step)
+
+    async def get_pie_graph_data(self, filters: FilterParams, id: str = None) -> List[Dict[str, Any]]:
+        well_compensated = self._columns["is_well_compensated"][self._mask(filters, id)]
+        return _pie(len(well_compensated), int(np.count_nonzero(well_compensated)))
+
+    async def get_graph_summary(self, filters: FilterParams, range_step: int, id: str = None) -> tuple[list[dict], List[Dict[str, Any]], float]:
+        mask = self._mask(filters, id)
+        amounts = self._columns["salary_amount"][mask]
+        well_compensated = int(np.count_nonzero(self._columns["is_well_compensated"][mask]))
+        average = float(amounts.mean()) if len(amounts) else 0.0
+        return _histogram(amounts, range_step), _pie(len(amounts), well_compensated), average
+
+    async def get_salary_percentiles(self, filters: FilterParams, percentiles: List[float]) -> tuple[int, Dict[float, float]]:
+        # Same buckets and estimator as the rollups, so both backends agree.
+        amounts = self._columns["salary_amount"][self._mask(filters)]
+        buckets, counts = np.unique((amounts // ROLLUP_BUCKET_WIDTH).astype(np.int64), return_counts=True)
+        pairs = list(zip(buckets.tolist(), counts.tolist()))
+        return len(amounts), percentiles_from_buckets(pairs, percentiles)
+
+    async def get_pay_gap_cells(self, filters: FilterParams) -> list[tuple[str, str, str, int, float]]:
+        mask = self._mask(filters)
+        # One flat cell index per (department, experience_level, gender).
+        shape = (len(Department), len(ExperienceLevel), len(Gender))
+        cells = np.ravel_multi_index(
+            (self._columns["department"][mask], self._columns["experience_level"][mask], self._columns["gender"][mask]),
+            shape,
+        )
+        counts = np.bincount(cells, minlength=np.prod(shape))
+        sums = np.bincount(cells, weights=self._columns["salary_amount"][mask], minlength=np.prod(shape))
+
+        departments, experience_levels, genders = list(Department), list(ExperienceLevel), list(Gender)
+        populated = np.flatnonzero(counts)
+        # Sorted by value, matching the ORDER BY of the SQL backend.
+        return sorted(
+            (departments[d].value, experience_levels[e].value, genders[g].value, int(counts[cell]), float(sums[cell]))
+            for cell, d, e, g in zip(populated, *np.unravel_index(populated, shape))
+        )
+
+    async def get_top_companies(self, filters: FilterParams, range_step: int, limit: int = 5) -> List[Dict[str, Any]]:
+        codes, averages = self._company_averages(self._mask(filters))
+        # Like the SQL join, only registered companies can be ranked.
+        registered = self._company_industries[codes] != _NO_INDUSTRY
+        codes, averages = codes[registered], averages[registered]
+        hashes = [self._company_hashes[code] for code in codes]
+        # Highest average first, ties broken by hash as in the SQL ordering.
+        top = np.lexsort((np.array(hashes, dtype=str), -averages))[:limit]
+        return [
+            {
+                "name": self._company_names[hashes[index]],
+                "hash": hashes[index],
+                "average_salary": float(averages[index]),
+            }
+            for index in top
+        ]
+
+    def get_data_version(self, scope: str = GLOBAL_SCOPE) -> DataVersion:
+        return self._store.get_data_version(scope)
+
+    async def warm(self) -> None:
+        await self._store.warm()
+
+    async def close(self) -> None:
+        await self._store.close()
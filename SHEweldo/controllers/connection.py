@@ -0,0 +1,182 @@
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, TypeVar
+
+import aiosqlite
+
+from SHEweldo.controllers.migrations import migrate
+
+T = TypeVar("T")
+
+
+class ConnectionManager:
+    """
+    Owns every SQLite connection to one database file: a pool of read-only
+    connections and a single writer, all in WAL mode so readers never wait on
+    the writer. Create one per process and share it between services.
+    """
+
+    def __init__(self, db_name: str = "record.db", read_pool_size: int = 4,
+                 busy_timeout_ms: int = 5000, busy_retries: int = 5, busy_backoff: float = 0.05):
+        if read_pool_size < 1:
+            raise ValueError("read_pool_size must be at least 1")
+
+        self._db_name = db_name
+        self._read_pool_size = read_pool_size
+        self._busy_timeout_ms = busy_timeout_ms
+        self._busy_retries = busy_retries
+        self._busy_backoff = busy_backoff
+
+        self._writer: Optional[aiosqlite.Connection] = None
+        self._write_lock = asyncio.Lock()
+        self._readers: List[aiosqlite.Connection] = []
+        self._idle_readers: Optional[asyncio.Queue] = None
+        self._initialized = False
+        self._init_lock = asyncio.Lock()
+
+        self._read_acquisitions = 0
+        self._read_wait_total = 0.0
+        self._read_wait_max = 0.0
+        self._write_acquisitions = 0
+        self._write_wait_total = 0.0
+        self._write_wait_max = 0.0
+        self._busy_retry_count = 0
+        # Called as wait_observer("read" | "write", seconds) on every checkout.
+        self.wait_observer: Optional[Callable[[str, float], None]] = None
+
+    @property
+    def db_name(self) -> str:
+        return self._db_name
+
+    @property
+    def initialized(self) -> bool:
+        return self._initialized
+
+    async def initialize(self) -> None:
+        async with self._init_lock:
+            if self._initialized:
+                return
+
+            self._writer = await self._open()
+            await migrate(self._writer)
+
+            self._idle_readers = asyncio.Queue()
+            for _ in range(self._read_pool_size):
+                reader = await self._open()
+                await reader.execute("PRAGMA query_only = ON")
+                self._readers.append(reader)
+                self._idle_readers.put_nowait(reader)
+
+            self._initialized = True
+
+    async def _open(self) -> aiosqlite.Connection:
+        connection = await aiosqlite.connect(self._db_name)
+        await connection.execute("PRAGMA journal_mode = WAL")
+        await connection.execute("PRAGMA synchronous = NORMAL")
+        await connection.execute(f"PRAGMA busy_timeout = {int(self._busy_timeout_ms)}")
+        return connection
+
+    @asynccontextmanager
+    async def reader(self) -> AsyncIterator[aiosqlite.Connection]:
+        started = time.perf_counter()
+        connection = await self._idle_readers.get()
+        self._record_read_wait(time.perf_counter() - started)
+        try:
+            yield connection
+        finally:
+            self._idle_readers.put_nowait(connection)
+
+    @asynccontextmanager
+    async def writer(self) -> AsyncIterator[aiosqlite.Connection]:
+        started = time.perf_counter()
+        async with self._write_lock:
+            self._record_write_wait(time.perf_counter() - started)
+            yield self._writer
+
+    async def warm(self) -> None:
+        """
+        Runs a schema query on the writer and every pooled reader, so no
+        request pays for a connection's first read of the schema.
+        """
+        async with self.writer() as connection:
+            await connection.execute_fetchall("SELECT count(*) FROM sqlite_master")
+        readers = [await self._idle_readers.get() for _ in range(self._read_pool_size)]
+        try:
+            await asyncio.gather(*(
+                reader.execute_fetchall("SELECT count(*) FROM sqlite_master") for reader in readers
+            ))
+        finally:
+            for reader in readers:
+                self._idle_readers.put_nowait(reader)
+
+    async def run_read(self, operation: Callable[[aiosqlite.Connection], Awaitable[T]]) -> T:
+        async with self.reader() as connection:
+            return await self._with_busy_retry(operation, connection)
+
+    async def run_write(self, operation: Callable[[aiosqlite.Connection], Awaitable[T]]) -> T:
+        """
+        Runs `operation` on the writer connection. Any exception rolls back the
+        open transaction before it propagates, so a failed write never leaves
+        half a batch pending for the next caller.
+        """
+        async with self.writer() as connection:
+            try:
+                return await self._with_busy_retry(operation, connection)
+            except Exception:
+                await connection.rollback()
+                raise
+
+    async def _with_busy_retry(self, operation: Callable[[aiosqlite.Connection], Awaitable[T]],
+                               connection: aiosqlite.Connection) -> T:
+        attempt = 0
+        while True:
+            try:
+                return await operation(connection)
+            except aiosqlite.OperationalError as e:
+                message = str(e).lower()
+                if attempt >= self._busy_retries or not ("locked" in message or "busy" in message):
+                    raise
+                attempt += 1
+                self._busy_retry_count += 1
+                if connection is self._writer:
+                    await connection.rollback()
+                await asyncio.sleep(self._busy_backoff * attempt)
+
+    def _record_read_wait(self, waited: float) -> None:
+        self._read_acquisitions += 1
+        self._read_wait_total += waited
+        self._read_wait_max = max(self._read_wait_max, waited)
+        if self.wait_observer:
+            self.wait_observer("read", waited)
+
+    def _record_write_wait(self, waited: float) -> None:
+        self._write_acquisitions += 1
+        self._write_wait_total += waited
+        self._write_wait_max = max(self._write_wait_max, waited)
+        if self.wait_observer:
+            self.wait_observer("write", waited)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "read_pool_size": self._read_pool_size,
+            "read_pool_idle": self._idle_readers.qsize() if self._idle_readers else 0,
+            "read_acquisitions": self._read_acquisitions,
+            "read_wait_seconds_total": self._read_wait_total,
+            "read_wait_seconds_max": self._read_wait_max,
+            "write_acquisitions": self._write_acquisitions,
+            "write_wait_seconds_total": self._write_wait_total,
+            "write_wait_seconds_max": self._write_wait_max,
+            "busy_retries": self._busy_retry_count,
+        }
+
+    async def close(self) -> None:
+        async with self._init_lock:
+            for reader in self._readers:
+                await reader.close()
+            self._readers = []
+            self._idle_readers = None
+            if self._writer:
+                await self._writer.close()
+                self._writer = None
+            self._initialized = False
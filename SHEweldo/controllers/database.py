@@ -1,15 +1,109 @@
 from abc import ABC, abstractmethod
 from SHEweldo.models.entities import SalaryRecord, Company
 from SHEweldo.models.enums import *
+from SHEweldo.controllers.connection import ConnectionManager
+from SHEweldo.controllers.migrations import find_unindexed_queries
+from SHEweldo.controllers.write_queue import WriteBehindQueue
+from SHEweldo.controllers.slow_queries import SlowQueryLog
+from SHEweldo.controllers.versions import COMPANIES_SCOPE, GLOBAL_SCOPE, DataVersion, bump_data_versions
+from SHEweldo.controllers.rollups import (
+    REBUILD_ROLLUPS,
+    REBUILD_SEGMENT_ROLLUPS,
+    ROLLUP_BUCKET_WIDTH,
+    apply_salaries_to_rollups,
+    apply_salary_to_rollups,
+    build_rollup_where_clause_and_params,
+    percentiles_from_buckets,
+    set_company_industries,
+    set_company_industry,
+    supports_range_step,
+)
 import aiosqlite
-from typing import Any, Dict, List, Tuple, TypedDict, Optional
+import json
+import time
+from typing import Any, AsyncIterator, Dict, List, Set, Tuple, TypedDict, Optional
+
+_INSERT_SALARY = """
+    INSERT INTO salaries (
+        id, company_hash, experience_level, salary_amount, gender, 
+        submission_date, is_well_compensated, department, job_title
+    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+_INSERT_COMPANY = """
+    INSERT INTO companies (
+        hash, name, size, industry, country
+    ) VALUES (?, ?, ?, ?, ?)
+"""
+
+def _salary_row(record: SalaryRecord) -> tuple:
+    return (
+        record.id,
+        record.company_hash,
+        record.experience_level.value,
+        record.salary_amount,
+        record.gender.value,
+        record.submission_date,
+        record.is_well_compensated,
+        record.department.value,
+        record.job_title,
+    )
+
+def _company_row(company: Company) -> tuple:
+    return (
+        company.id,
+        company.name,
+        company.size.value,
+        company.industry.value,
+        company.country,
+    )
+
+# Columns a salary export may contain. The salary id doubles as the
+# submitter's cookie and the job title is free text, so neither leaves the
+# database; submission dates are coarsened to the month.
+EXPORT_COLUMNS = (
+    "company_hash", "department", "experience_level", "gender",
+    "salary_amount", "is_well_compensated", "submission_month",
+)
+
+_EXPORT_EXPRESSIONS = {
+    "company_hash": "company_hash",
+    "department": "department",
+    "experience_level": "experience_level",
+    "gender": "gender",
+    "salary_amount": "salary_amount",
+    "is_well_compensated": "is_well_compensated",
+    "submission_month": "substr(submission_date, 1, 7)",
+}
+_EXPORT_TUPLE_COLUMNS = ", ".join(_EXPORT_EXPRESSIONS[column] for column in EXPORT_COLUMNS)
+# The same row as a JSON object, booleans included, rendered by SQLite.
+_EXPORT_JSON_COLUMNS = "json_object('cursor', rowid, {})".format(", ".join(
+    f"'{column}', " + (
+        "json(CASE WHEN is_well_compensated THEN 'true' ELSE 'false' END)"
+        if column == "is_well_compensated" else _EXPORT_EXPRESSIONS[column]
+    )
+    for column in EXPORT_COLUMNS
+))
 
 class FilterParams(TypedDict, total=False):
     company_hash: str
     industry: Industry
     department: Department
     gender: Gender
-    experience: ExperienceLevel
+    experience_level: ExperienceLevel
+
+class InsertListener:
+    """
+    Notified after an insert has been committed. Listeners run on the event
+    loop inside the inserting request, so they must be quick and must not
+    await.
+    """
+
+    def on_salary_inserted(self, record: SalaryRecord, industry: str) -> None:
+        pass
+
+    def on_company_inserted(self, company: Company) -> None:
+        pass
 
 class IDatabaseController(ABC):
     @abstractmethod
@@ -28,6 +122,14 @@ class IDatabaseController(ABC):
     async def insert_company(self, company: Company) -> bool:
         pass
 
+    @abstractmethod
+    async def insert_salary_records(self, records: List[SalaryRecord]) -> List[Tuple[SalaryRecord, str]]:
+        pass
+
+    @abstractmethod
+    async def insert_companies(self, companies: List[Company]) -> List[Tuple[Company, str]]:
+        pass
+
     @abstractmethod
     async def get_salary_record(self, salary_id: str) -> Optional[SalaryRecord]:
         pass
@@ -40,63 +142,133 @@ class IDatabaseController(ABC):
     async def get_filtered_records(self, filters: FilterParams) -> list[SalaryRecord]:
         pass
 
+    @abstractmethod
+    async def get_benchmark_data(self, filters: FilterParams, range_step: int) -> List[Dict[str, Any]]:
+        pass
+
+    @abstractmethod
+    async def get_bar_graph_data(self, filters: FilterParams, range_step: int) -> list[dict]:
+        pass
+
+    @abstractmethod
+    async def get_pie_graph_data(self, filters: FilterParams, id: str = None) -> List[Dict[str, Any]]:
+        pass
+
+    @abstractmethod
+    async def get_graph_summary(self, filters: FilterParams, range_step: int, id: str = None) -> tuple[list[dict], List[Dict[str, Any]], float]:
+        pass
+
+    @abstractmethod
+    async def get_salary_percentiles(self, filters: FilterParams, percentiles: List[float]) -> tuple[int, Dict[float, float]]:
+        pass
+
+    @abstractmethod
+    async def get_pay_gap_cells(self, filters: FilterParams) -> list[tuple[str, str, str, int, float]]:
+        pass
+
+    @abstractmethod
+    async def get_top_companies(self, filters: FilterParams, range_step: int, limit: int = 5) -> List[Dict[str, Any]]:
+        pass
+
+    @abstractmethod
+    def get_data_version(self, scope: str = GLOBAL_SCOPE) -> DataVersion:
+        pass
+
+    @property
+    def slow_query_log(self) -> Optional[SlowQueryLog]:
+        return None
+
+    async def warm(self) -> None:
+        """Opens whatever the first requests would otherwise wait for."""
+
     @abstractmethod
     async def close(self) -> None:
         pass
 
 class DatabaseController(IDatabaseController):
-    def __init__(self, db_name="record.db"):
-        self._db_name = db_name
-        self._connection = None
+    def __init__(self, db_name="record.db", connection_manager: Optional[ConnectionManager] = None,
+                 write_queue: Optional[WriteBehindQueue] = None, slow_query_log: Optional[SlowQueryLog] = None):
+        self._db_name = connection_manager.db_name if connection_manager else db_name
+        self._connections = connection_manager or ConnectionManager(db_name)
+        self._write_queue = write_queue
+        self._slow_query_log = slow_query_log
+        self._listeners: List[InsertListener] = []
+        self._data_versions: Dict[str, DataVersion] = {}
+        # For refresh_data_versions: the global version at the last refresh,
+        # the global versions this controller's own inserts produced since,
+        # and the latest modified_at read back. Own versions are only kept
+        # once something refreshes, so a lone process doesn't collect them.
+        self._versions_synced = 0
+        self._own_versions: Optional[Set[int]] = None
+        self._versions_read_at = 0.0
+
+    @property
+    def connections(self) -> ConnectionManager:
+        return self._connections
+
+    @property
+    def write_queue(self) -> Optional[WriteBehindQueue]:
+        return self._write_queue
+
+    @property
+    def slow_query_log(self) -> Optional[SlowQueryLog]:
+        return self._slow_query_log
 
     async def initialize(self):
         await self._connect()
+        for scope, version, modified_at in await self._fetchall("SELECT scope, version, modified_at FROM data_versions"):
+            self._data_versions[scope] = (version, modified_at)
+            self._versions_read_at = max(self._versions_read_at, modified_at)
+        self._versions_synced = self.get_data_version()[0]
+
+    async def warm(self) -> None:
+        await self._connections.warm()
 
     async def _connect(self):
         try:
-            self._connection = await aiosqlite.connect(self._db_name)
-            await self._create_tables()
+            await self._connections.initialize()
+            if self._write_queue:
+                self._write_queue.start()
             print("Database connection established successfully.")
         except Exception as e:
             print(f"Failed to connect to the database: {e}")
             raise
 
-    async def _create_tables(self):
-        cursor = await self._connection.cursor()
-        await cursor.execute('''
-            CREATE TABLE IF NOT EXISTS companies (
-                id INTEGER PRIMARY KEY,
-                hash TEXT UNIQUE,
-                name TEXT NOT NULL,
-                size TEXT CHECK(size IN ({sizes})),
-                industry TEXT CHECK(industry IN ({industries})),
-                country TEXT NOT NULL
-            )
-        '''.format(
-            sizes=", ".join(f"'{size.value}'" for size in CompanySize),
-            industries=", ".join(f"'{industry.value}'" for industry in Industry)
-        ))
-
-        await cursor.execute('''
-            CREATE TABLE IF NOT EXISTS salaries (
-                id TEXT PRIMARY KEY,
-                company_hash TEXT NOT NULL,
-                experience_level TEXT CHECK(experience_level IN ({experience_levels})),
-                salary_amount REAL CHECK(salary_amount > 0),
-                gender TEXT CHECK(gender IN ({genders})),
-                submission_date TEXT NOT NULL,
-                is_well_compensated BOOLEAN NOT NULL,
-                department TEXT CHECK(department IN ({departments})),
-                job_title TEXT NOT NULL,
-                FOREIGN KEY(company_hash) REFERENCES companies(hash)
-            )
-        '''.format(
-            experience_levels=", ".join(f"'{level.value}'" for level in ExperienceLevel),
-            genders=", ".join(f"'{gender.value}'" for gender in Gender),
-            departments=", ".join(f"'{department.value}'" for department in Department)
-        ))
-
-        await self._connection.commit()
+    async def _fetchall(self, query: str, params=()) -> list[tuple]:
+        async def operation(connection: aiosqlite.Connection):
+            async with connection.execute(query, tuple(params)) as cursor:
+                return await cursor.fetchall()
+        if self._slow_query_log:
+            return await self._connections.run_read(self._logged(operation, query, params, len))
+        return await self._connections.run_read(operation)
+
+    async def _fetchone(self, query: str, params=()) -> Optional[tuple]:
+        async def operation(connection: aiosqlite.Connection):
+            async with connection.execute(query, tuple(params)) as cursor:
+                return await cursor.fetchone()
+        if self._slow_query_log:
+            return await self._connections.run_read(self._logged(operation, query, params, lambda row: int(row is not None)))
+        return await self._connections.run_read(operation)
+
+    def _logged(self, operation, query: str, params, count_rows):
+        """
+        Wraps a read so the slow query log sees its duration and row count.
+        The plan of a slow shape is captured on the same connection, which
+        keeps EXPLAIN out of the log and off the pool.
+        """
+        async def logged(connection: aiosqlite.Connection):
+            started = time.perf_counter()
+            result = await operation(connection)
+            stats = self._slow_query_log.record(query, params, time.perf_counter() - started, count_rows(result))
+            if stats is not None:
+                try:
+                    async with connection.execute(f"EXPLAIN QUERY PLAN {query}", tuple(params)) as cursor:
+                        plan = [row[-1] for row in await cursor.fetchall()]
+                except aiosqlite.Error as e:
+                    plan = [f"unavailable: {e}"]
+                self._slow_query_log.record_plan(stats, plan)
+            return result
+        return logged
 
     async def _build_where_clause_and_params(self, filters: FilterParams) -> tuple[str, List[Any]]:
         where_clause = "WHERE 1=1"
@@ -122,111 +294,336 @@ class DatabaseController(IDatabaseController):
         if not isinstance(hash_val, str):
             raise ValueError("Invalid input: company hash must be a string")
 
-        cursor = await self._connection.cursor()
-        await cursor.execute("SELECT * FROM companies WHERE hash = ?", (hash_val,))
-        row = await cursor.fetchone()
-        return Company(*row) if row else None
+        row = await self._fetchone("SELECT * FROM companies WHERE hash = ?", (hash_val,))
+        return Company.from_row(row) if row else None
     
     async def get_all_companies(self) -> list[tuple[str, str]]:
-        cursor = await self._connection.cursor()
-        await cursor.execute("SELECT name, hash FROM companies")
-        return await cursor.fetchall()
+        return await self._fetchall("SELECT name, hash FROM companies")
     
+    def _search_companies_query(self, prefix: str = "", industry: Optional[Industry] = None,
+                                country: Optional[str] = None, after: Optional[Tuple[str, str]] = None,
+                                limit: int = 20) -> tuple[str, List[Any]]:
+        where_clause = "WHERE 1=1"
+        params = []
+        if prefix:
+            # Everything that starts with the prefix sorts below prefix + U+10FFFF.
+            where_clause += " AND name COLLATE NOCASE >= ? AND name COLLATE NOCASE < ?"
+            params += [prefix, prefix + "\U0010ffff"]
+        if industry:
+            where_clause += " AND industry = ?"
+            params.append(industry.value)
+        if country:
+            where_clause += " AND country = ? COLLATE NOCASE"
+            params.append(country)
+        if after:
+            where_clause += " AND (name COLLATE NOCASE, hash) > (?, ?)"
+            params += list(after)
+
+        query = f"""
+            SELECT name, hash
+            FROM companies
+            {where_clause}
+            ORDER BY name COLLATE NOCASE, hash
+            LIMIT ?
+        """
+        return query, params + [limit]
+
+    async def search_companies(self, prefix: str = "", industry: Optional[Industry] = None,
+                               country: Optional[str] = None, after: Optional[Tuple[str, str]] = None,
+                               limit: int = 20) -> list[tuple[str, str]]:
+        """
+        Returns up to `limit` (name, hash) pairs ordered case-insensitively by
+        name, starting after the (name, hash) keyset cursor `after`. Every
+        combination of filters is served by an index range, so the cost does
+        not grow with the number of companies.
+        """
+        query, params = self._search_companies_query(prefix, industry, country, after, limit)
+        return await self._fetchall(query, params)
+
     async def get_salary_record(self, salary_id: str) -> Optional[SalaryRecord]:
         if not isinstance(salary_id, str):
             raise ValueError("Invalid input: salary_id must be a string")
         
-        cursor = await self._connection.cursor()
-        await cursor.execute("SELECT * FROM salaries WHERE id = ?", (salary_id,))
-        row = await cursor.fetchone()
-        if row is not None:
-            reordered_row = row[1:] + (row[0],)
-            return SalaryRecord(*reordered_row)
-        else:
-            return None
+        row = await self._fetchone("SELECT * FROM salaries WHERE id = ?", (salary_id,))
+        return SalaryRecord.from_row(row) if row is not None else None
 
-    async def get_average_salary(self, company_hash: str) -> float:
-        cursor = await self._connection.cursor()
-        await cursor.execute('''
-            SELECT AVG(salary_amount) 
-            FROM salaries 
+    def _average_salary_query(self, company_hash: str) -> tuple[str, List[Any]]:
+        query = '''
+            SELECT SUM(salary_sum) / SUM(salary_count)
+            FROM salary_rollups
             WHERE company_hash = ?
-        ''', (company_hash,))
+        '''
+        return query, [company_hash]
 
-        result = await cursor.fetchone()
+    async def get_average_salary(self, company_hash: str) -> float:
+        query, params = self._average_salary_query(company_hash)
+        result = await self._fetchone(query, params)
         if result and result[0] is not None:
             return int(float(result[0]))
         else:
             return 0
 
+    async def _apply_salary_insert(self, connection: aiosqlite.Connection, record: SalaryRecord) -> str:
+        await connection.execute(_INSERT_SALARY, _salary_row(record))
+
+        async with connection.execute("SELECT industry FROM companies WHERE hash = ?", (record.company_hash,)) as cursor:
+            row = await cursor.fetchone()
+        industry = row[0] if row and row[0] else ""
+        await apply_salary_to_rollups(connection, record, industry)
+        return industry
+
+    async def _apply_company_insert(self, connection: aiosqlite.Connection, company: Company) -> None:
+        await connection.execute(_INSERT_COMPANY, _company_row(company))
+        await set_company_industry(connection, company.id, company.industry.value)
+
+    async def _apply_salary_batch(self, connection: aiosqlite.Connection, records: List[SalaryRecord]) -> List[str]:
+        company_hashes = json.dumps(sorted({record.company_hash for record in records}))
+        async with connection.execute(
+            "SELECT hash, industry FROM companies WHERE hash IN (SELECT value FROM json_each(?))",
+            (company_hashes,),
+        ) as cursor:
+            industries = {hash_val: industry for hash_val, industry in await cursor.fetchall()}
+
+        await connection.executemany(_INSERT_SALARY, [_salary_row(record) for record in records])
+        await apply_salaries_to_rollups(connection, records, industries)
+        return [industries.get(record.company_hash, "") for record in records]
+
+    async def _apply_company_batch(self, connection: aiosqlite.Connection, companies: List[Company]) -> List[None]:
+        await connection.executemany(_INSERT_COMPANY, [_company_row(company) for company in companies])
+        await set_company_industries(connection, {company.id: company.industry.value for company in companies})
+        return [None] * len(companies)
+
+    async def _write_batch(self, items: list, apply_batch, apply_one, scopes) -> tuple[list, list]:
+        """
+        Writes `items` in one transaction through `apply_batch`. If the batch
+        violates a constraint it is replayed through `apply_one` with a
+        savepoint per item, so only the offending items are dropped. The data
+        versions `scopes(item)` of the inserted items are bumped once each.
+        Returns (inserted, rejected) as lists of (item, result) and
+        (item, reason) pairs.
+        """
+        inserted = []
+        rejected = []
+        versions = {}
+
+        async def operation(connection: aiosqlite.Connection):
+            inserted.clear()
+            rejected.clear()
+            versions.clear()
+            await connection.execute("BEGIN")
+            await connection.execute("SAVEPOINT batch")
+            try:
+                inserted.extend(zip(items, await apply_batch(connection, items)))
+            except aiosqlite.IntegrityError:
+                await connection.execute("ROLLBACK TO batch")
+                for item in items:
+                    await connection.execute("SAVEPOINT item")
+                    try:
+                        result = await apply_one(connection, item)
+                    except aiosqlite.IntegrityError as e:
+                        await connection.execute("ROLLBACK TO item")
+                        rejected.append((item, str(e)))
+                    else:
+                        inserted.append((item, result))
+                    await connection.execute("RELEASE item")
+            if inserted:
+                versions.update(await bump_data_versions(
+                    connection, (scope for item, _ in inserted for scope in scopes(item))
+                ))
+            await connection.execute("RELEASE batch")
+            await connection.commit()
+
+        if items:
+            await self._connections.run_write(operation)
+            self._record_data_versions(versions)
+        return inserted, rejected
+
+    async def _write(self, apply, *args) -> bool:
+        if self._write_queue:
+            return await self._write_queue.submit(lambda connection: apply(connection, *args))
+
+        async def operation(connection: aiosqlite.Connection):
+            await apply(connection, *args)
+            await connection.commit()
+
+        await self._connections.run_write(operation)
+        return True
+
+    def get_data_version(self, scope: str = GLOBAL_SCOPE) -> DataVersion:
+        """
+        Current (version, modified_at) of `scope`, from memory, so callers can
+        tell whether results changed without querying. Versions are bumped in
+        the same transaction as every insert made through this controller.
+        """
+        return self._data_versions.get(scope, (0, 0.0))
+
+    async def refresh_data_versions(self) -> bool:
+        """
+        Reads back versions bumped by other processes writing the same file,
+        which this controller was never told about. Returns whether any were,
+        meaning listeners missed those inserts. Every insert bumps the global
+        scope once, so an unchanged database costs one lookup, and a global
+        version this controller did not produce belongs to another process.
+        """
+        if self._own_versions is None:
+            self._own_versions = set()
+        row = await self._fetchone("SELECT version FROM data_versions WHERE scope = ?", (GLOBAL_SCOPE,))
+        latest = row[0] if row else 0
+        if latest <= self._versions_synced:
+            return False
+        own = sum(1 for version in self._own_versions if version <= latest)
+        foreign = latest - self._versions_synced > own
+        self._own_versions = {version for version in self._own_versions if version > latest}
+        self._versions_synced = latest
+        if not foreign:
+            return False
+
+        # Versions are stamped while the write lock is held, so they arrive
+        # in commit order; the second of slack only covers clock adjustments.
+        rows = await self._fetchall(
+            "SELECT scope, version, modified_at FROM data_versions WHERE modified_at >= ?",
+            (self._versions_read_at - 1.0,),
+        )
+        for scope, version, modified_at in rows:
+            if version > self.get_data_version(scope)[0]:
+                self._data_versions[scope] = (version, modified_at)
+            self._versions_read_at = max(self._versions_read_at, modified_at)
+        return True
+
+    def _record_data_versions(self, versions: Dict[str, DataVersion]) -> None:
+        produced = versions.get(GLOBAL_SCOPE, (0, 0.0))[0]
+        if self._own_versions is not None and produced > self._versions_synced:
+            self._own_versions.add(produced)
+        for scope, version in versions.items():
+            if version[0] > self.get_data_version(scope)[0]:
+                self._data_versions[scope] = version
+
+    @staticmethod
+    def _salary_scopes(record: SalaryRecord) -> tuple[str, ...]:
+        return GLOBAL_SCOPE, record.company_hash
+
+    @staticmethod
+    def _company_scopes(company: Company) -> tuple[str, ...]:
+        return GLOBAL_SCOPE, COMPANIES_SCOPE, company.id
+
+    def add_listener(self, listener: InsertListener) -> None:
+        self._listeners.append(listener)
+
+    def _notify(self, event: str, *args) -> None:
+        for listener in self._listeners:
+            try:
+                getattr(listener, event)(*args)
+            except Exception as e:
+                print(f"Insert listener {type(listener).__name__} failed: {e}")
+
     async def insert_salary_record(self, record: SalaryRecord) -> bool:
-        try:
-            cursor = await self._connection.cursor()
-            await cursor.execute(
-                """
-                INSERT INTO salaries (
-                    id, company_hash, experience_level, salary_amount, gender, 
-                    submission_date, is_well_compensated, department, job_title
-                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-                """,
-                (
-                    record.id,
-                    record.company_hash,
-                    record.experience_level.value,
-                    record.salary_amount,
-                    record.gender.value,
-                    record.submission_date,
-                    record.is_well_compensated,
-                    record.department.value,
-                    record.job_title,
-                )
-            )
-            await self._connection.commit()
-            return True
+        industries = []
+        versions = {}
+
+        async def apply(connection: aiosqlite.Connection):
+            industries.append(await self._apply_salary_insert(connection, record))
+            versions.update(await bump_data_versions(connection, self._salary_scopes(record)))
 
+        try:
+            stored = await self._write(apply)
         except aiosqlite.Error as e:
             print(f"SQLite Error: {e}")
             return False
+
+        if stored:
+            self._record_data_versions(versions)
+            self._notify("on_salary_inserted", record, industries[-1])
+        return stored
     
     async def insert_company(self, company: Company) -> bool:
-        try:
-            cursor = await self._connection.cursor()
-            await cursor.execute(
-                """
-                INSERT INTO companies (
-                    hash, name, size, industry, country
-                ) VALUES (?, ?, ?, ?, ?)
-                """,
-                (
-                    company.id,
-                    company.name,
-                    company.size.value,
-                    company.industry.value,
-                    company.country,
-                )
-            )
-            await self._connection.commit()
-            return True
+        versions = {}
 
+        async def apply(connection: aiosqlite.Connection):
+            await self._apply_company_insert(connection, company)
+            versions.update(await bump_data_versions(connection, self._company_scopes(company)))
+
+        try:
+            stored = await self._write(apply)
         except aiosqlite.Error as e:
             print(f"SQLite Error: {e}")
             return False
 
+        if stored:
+            self._record_data_versions(versions)
+            self._notify("on_company_inserted", company)
+        return stored
+
+    async def insert_salary_records(self, records: List[SalaryRecord]) -> List[Tuple[SalaryRecord, str]]:
+        """
+        Bulk counterpart of insert_salary_record: one transaction and one
+        executemany per batch. Returns the rejected (record, reason) pairs.
+        """
+        inserted, rejected = await self._write_batch(
+            records, self._apply_salary_batch, self._apply_salary_insert, self._salary_scopes
+        )
+        for record, industry in inserted:
+            self._notify("on_salary_inserted", record, industry)
+        return rejected
+
+    async def insert_companies(self, companies: List[Company]) -> List[Tuple[Company, str]]:
+        inserted, rejected = await self._write_batch(
+            companies, self._apply_company_batch, self._apply_company_insert, self._company_scopes
+        )
+        for company, _ in inserted:
+            self._notify("on_company_inserted", company)
+        return rejected
+
     async def get_filtered_records(self, filters: FilterParams) -> List[SalaryRecord]:
         where_clause, params = await self._build_where_clause_and_params(filters)
         query = f"SELECT * FROM salaries {where_clause}"
-        cursor = await self._connection.cursor()
-        await cursor.execute(query, tuple(params))
-        rows = await cursor.fetchall()
-        return [SalaryRecord(*row) for row in rows]
+        rows = await self._fetchall(query, params)
+        return [SalaryRecord.from_row(row) for row in rows]
 
-    async def get_benchmark_data(self, filters: FilterParams, range_step: int) -> List[Dict[str, Any]]:
+    async def _export_chunk_query(self, filters: FilterParams, after: int, limit: int,
+                                  as_json: bool = False) -> tuple[str, List[Any]]:
         where_clause, params = await self._build_where_clause_and_params(filters)
-        
+        columns = _EXPORT_JSON_COLUMNS if as_json else _EXPORT_TUPLE_COLUMNS
+        # The walk must be in rowid order, so each chunk resumes where the
+        # previous one stopped instead of re-sorting every match: through
+        # idx_salaries_company_rowid for one company, so the cost follows
+        # the company's salaries, and through the table itself otherwise.
+        source = "INDEXED BY idx_salaries_company_rowid" if "company_hash" in filters else "NOT INDEXED"
+        query = f"""
+            SELECT rowid, {columns}
+            FROM salaries {source}
+            {where_clause} AND rowid > ?
+            ORDER BY rowid
+            LIMIT ?
+        """
+        return query, params + [after, limit]
+
+    async def iter_filtered_records(self, filters: FilterParams, after: int = 0, chunk_size: int = 1000,
+                                    as_json: bool = False) -> AsyncIterator[List[tuple]]:
+        """
+        Yields the matching salaries `chunk_size` rows at a time, in rowid
+        order, as (rowid, *EXPORT_COLUMNS) tuples. Every chunk is a separate
+        short query resuming after the last rowid, so no pooled reader is held
+        while the caller consumes a chunk and memory is bounded by the chunk.
+
+        With `as_json` each row is (rowid, JSON object text) instead, with the
+        object built by SQLite, so no Python object is created per field.
+        """
+        while True:
+            query, params = await self._export_chunk_query(filters, after, chunk_size, as_json)
+            rows = await self._fetchall(query, params)
+            if rows:
+                yield rows
+            if len(rows) < chunk_size:
+                return
+            after = rows[-1][0]
+
+    async def _benchmark_query(self, filters: FilterParams, range_step: int) -> tuple[str, List[Any]]:
+        where_clause, params = build_rollup_where_clause_and_params(filters)
+
         query = f"""
             WITH company_avg_salaries AS (
-                SELECT company_hash, AVG(salary_amount) AS avg_salary
-                FROM salaries
+                SELECT company_hash, SUM(salary_sum) / SUM(salary_count) AS avg_salary
+                FROM salary_rollups
                 {where_clause}
                 GROUP BY company_hash
             )
@@ -235,15 +632,25 @@ class DatabaseController(IDatabaseController):
             GROUP BY range_start
             ORDER BY range_start DESC
         """
-        params = params + [range_step, range_step]
-        cursor = await self._connection.cursor()
-
-        await cursor.execute(query, tuple(params))
+        return query, params + [range_step, range_step]
 
-        results = await cursor.fetchall()
+    async def get_benchmark_data(self, filters: FilterParams, range_step: int) -> List[Dict[str, Any]]:
+        query, params = await self._benchmark_query(filters, range_step)
+        results = await self._fetchall(query, params)
         return [{"range_start": row[0], "count": row[1]} for row in results]
 
-    async def get_bar_graph_data(self, filters: FilterParams, range_step: int) -> list[dict]:
+    async def _bar_graph_query(self, filters: FilterParams, range_step: int) -> tuple[str, List[Any]]:
+        if supports_range_step(range_step):
+            where_clause, where_params = build_rollup_where_clause_and_params(filters)
+            query = f"""
+                SELECT FLOOR(bucket * ? / ?) * ? AS range_start, SUM(salary_count) AS count
+                FROM salary_rollup_buckets
+                {where_clause}
+                GROUP BY range_start
+                ORDER BY range_start DESC
+            """
+            return query, [float(ROLLUP_BUCKET_WIDTH), range_step, range_step] + where_params
+
         where_clause, where_params = await self._build_where_clause_and_params(filters)
         query = f"""
             SELECT FLOOR(salary_amount / ?) * ? AS range_start, COUNT(*) AS count
@@ -252,56 +659,220 @@ class DatabaseController(IDatabaseController):
             GROUP BY range_start
             ORDER BY range_start DESC
         """
-        params = [range_step, range_step] + where_params
-        cursor = await self._connection.cursor()
-        await cursor.execute(query, tuple(params))
-        rows = await cursor.fetchall()
+        return query, [range_step, range_step] + where_params
+
+    async def get_bar_graph_data(self, filters: FilterParams, range_step: int) -> list[dict]:
+        query, params = await self._bar_graph_query(filters, range_step)
+        rows = await self._fetchall(query, params)
         return [{"range_start": row[0], "count": row[1]} for row in rows]
 
+    async def _pie_graph_query(self, filters: FilterParams, id: str = None) -> tuple[str, List[Any]]:
+        where_clause, where_params = build_rollup_where_clause_and_params(filters)
+
+        if id:
+            where_clause += " AND company_hash = ?"
+            where_params.append(id)
+
+        query = f"""
+            SELECT SUM(salary_count) - SUM(well_compensated_count), SUM(well_compensated_count)
+            FROM salary_rollups
+            {where_clause}
+        """
+        return query, where_params
+
     async def get_pie_graph_data(self, filters: FilterParams, id: str = None) -> List[Dict[str, Any]]:
-        where_clause, where_params = await self._build_where_clause_and_params(filters)
+        query, params = await self._pie_graph_query(filters, id)
+        row = await self._fetchone(query, params)
+        counts = (row[0] or 0, row[1] or 0) if row else (0, 0)
+        return [
+            {"is_well_compensated": is_well_compensated, "count": count}
+            for is_well_compensated, count in enumerate(counts)
+            if count
+        ]
+
+    async def _graph_summary_query(self, filters: FilterParams, range_step: int, id: str = None) -> tuple[str, List[Any]]:
+        if supports_range_step(range_step):
+            where_clause, where_params = build_rollup_where_clause_and_params(filters)
+            if id:
+                where_clause += " AND company_hash = ?"
+                where_params.append(id)
+            query = f"""
+                SELECT FLOOR(bucket * ? / ?) * ? AS range_start,
+                       SUM(salary_count), SUM(well_compensated_count), SUM(salary_sum)
+                FROM salary_rollup_buckets
+                {where_clause}
+                GROUP BY range_start
+                ORDER BY range_start DESC
+            """
+            return query, [float(ROLLUP_BUCKET_WIDTH), range_step, range_step] + where_params
 
+        where_clause, where_params = await self._build_where_clause_and_params(filters)
         if id:
             where_clause += " AND company_hash = ?"
             where_params.append(id)
-            
         query = f"""
-            SELECT is_well_compensated, COUNT(*) AS count
+            SELECT FLOOR(salary_amount / ?) * ? AS range_start,
+                   COUNT(*), SUM(CASE WHEN is_well_compensated THEN 1 ELSE 0 END), SUM(salary_amount)
             FROM salaries
             {where_clause}
-            GROUP BY is_well_compensated
+            GROUP BY range_start
+            ORDER BY range_start DESC
         """
-        cursor = await self._connection.cursor()
-        await cursor.execute(query, tuple(where_params))
-        rows = await cursor.fetchall()
-        return [{"is_well_compensated": row[0], "count": row[1]} for row in rows]
-    
-    async def get_top_companies(self, filters: FilterParams, range_step: int) -> List[Dict[str, Any]]:
+        return query, [range_step, range_step] + where_params
+
+    async def get_graph_summary(self, filters: FilterParams, range_step: int, id: str = None) -> tuple[list[dict], List[Dict[str, Any]], float]:
         """
-        This function works as intended.  
-        However, due to SQLite's limitations, it cannot handle very large datasets efficiently.  
-        For this reason, we did not extend its implementation further.  
+        Returns the bar graph, the pie graph and the average salary of the
+        filtered salaries, all folded from the same grouped scan.
         """
-        where_clause, where_params = await self._build_where_clause_and_params(filters)
+        query, params = await self._graph_summary_query(filters, range_step, id)
+        rows = await self._fetchall(query, params)
+
+        bar_graph = []
+        total = well_compensated = 0
+        salary_sum = 0.0
+        for range_start, count, well_count, amount in rows:
+            bar_graph.append({"range_start": range_start, "count": count})
+            total += count
+            well_compensated += well_count
+            salary_sum += amount
+
+        pie_graph = [
+            {"is_well_compensated": is_well_compensated, "count": count}
+            for is_well_compensated, count in enumerate((total - well_compensated, well_compensated))
+            if count
+        ]
+        return bar_graph, pie_graph, salary_sum / total if total else 0.0
+
+    async def _percentile_buckets_query(self, filters: FilterParams) -> tuple[str, List[Any]]:
+        where_clause, where_params = build_rollup_where_clause_and_params(filters)
+        query = f"""
+            SELECT bucket, SUM(salary_count)
+            FROM salary_rollup_buckets
+            {where_clause}
+            GROUP BY bucket
+            ORDER BY bucket
+        """
+        return query, where_params
 
+    async def get_salary_percentiles(self, filters: FilterParams, percentiles: List[float]) -> tuple[int, Dict[float, float]]:
+        """
+        Returns (salary count, {percentile: estimate}) for the filtered
+        salaries, merged from the bucket rollups. See percentiles_from_buckets
+        for the error bound.
+        """
+        query, params = await self._percentile_buckets_query(filters)
+        buckets = await self._fetchall(query, params)
+        return sum(count for _, count in buckets), percentiles_from_buckets(buckets, percentiles)
+
+    async def _pay_gap_query(self, filters: FilterParams) -> tuple[str, List[Any]]:
+        where_clause, where_params = build_rollup_where_clause_and_params(filters)
+        # Only a company scoped matrix needs the per-company rollups; the
+        # industry-wide segment rollups stay small however much data exists.
+        table = "salary_rollups" if "company_hash" in filters else "salary_segment_rollups"
         query = f"""
-            SELECT c.name, c.hash, AVG(s.salary_amount / ?) * ? AS avg_salary
-            FROM salaries s
-            JOIN companies c ON s.company_hash = c.hash
+            SELECT department, experience_level, gender, SUM(salary_count), SUM(salary_sum)
+            FROM {table}
             {where_clause}
-            GROUP BY c.hash
-            ORDER BY avg_salary DESC
-            LIMIT 5
+            GROUP BY department, experience_level, gender
+            ORDER BY department, experience_level, gender
         """
-        params = [range_step, range_step] + where_params
+        return query, where_params
 
-        async with self._connection.cursor() as cursor:
-            await cursor.execute(query, tuple(params))
-            rows = await cursor.fetchall()
+    async def get_pay_gap_cells(self, filters: FilterParams) -> list[tuple[str, str, str, int, float]]:
+        """
+        (department, experience_level, gender, salary count, salary sum) for
+        every populated cell of the pay gap matrix, in one grouped pass over
+        the rollups. Counts and sums add up, so every marginal can be derived
+        from these cells.
+        """
+        query, params = await self._pay_gap_query(filters)
+        return await self._fetchall(query, params)
+
+    async def _top_companies_query(self, filters: FilterParams, range_step: int, limit: int = 5) -> tuple[str, List[Any]]:
+        where_clause, where_params = build_rollup_where_clause_and_params(filters, alias="r.")
 
+        query = f"""
+            SELECT c.name, c.hash, SUM(r.salary_sum) / SUM(r.salary_count) AS avg_salary
+            FROM salary_rollups r
+            JOIN companies c ON r.company_hash = c.hash
+            {where_clause}
+            GROUP BY c.hash
+            ORDER BY avg_salary DESC, c.hash
+            LIMIT ?
+        """
+        return query, where_params + [limit]
+
+    async def get_top_companies(self, filters: FilterParams, range_step: int, limit: int = 5) -> List[Dict[str, Any]]:
+        """
+        Ranks companies by their average salary using the per-segment rollups,
+        so the cost grows with the number of companies, not salaries. The API
+        serves rankings from the in-memory Leaderboard; this is its fallback
+        and reference.
+        """
+        query, params = await self._top_companies_query(filters, range_step, limit)
+        rows = await self._fetchall(query, params)
         return [{"name": name, "hash": hash_, "average_salary": avg_salary} for name, hash_, avg_salary in rows]
 
+    async def get_company_directory(self) -> list[tuple[str, str, str]]:
+        return await self._fetchall("SELECT hash, name, industry FROM companies")
+
+    async def get_company_segment_totals(self) -> list[tuple[str, str, str, int, float]]:
+        """(company_hash, department, experience_level, salary count, salary sum) per segment."""
+        return await self._fetchall(
+            """
+            SELECT company_hash, department, experience_level, SUM(salary_count), SUM(salary_sum)
+            FROM salary_rollups
+            GROUP BY company_hash, department, experience_level
+            """
+        )
+
+    async def _explainable_queries(self, filters: FilterParams, range_step: int = 1000) -> list[tuple[str, str, List[Any]]]:
+        queries = [
+            ("get_bar_graph_data", *await self._bar_graph_query(filters, range_step)),
+            ("get_bar_graph_data (raw rows)", *await self._bar_graph_query(filters, ROLLUP_BUCKET_WIDTH + 1)),
+            ("get_pie_graph_data", *await self._pie_graph_query(filters)),
+            ("get_graph_summary", *await self._graph_summary_query(filters, range_step)),
+            ("get_benchmark_data", *await self._benchmark_query(filters, range_step)),
+            ("get_top_companies", *await self._top_companies_query(filters, range_step)),
+            ("get_salary_percentiles", *await self._percentile_buckets_query(filters)),
+            ("get_pay_gap_cells", *await self._pay_gap_query(filters)),
+            ("iter_filtered_records", *await self._export_chunk_query(filters, 0, 1000)),
+            ("search_companies", *self._search_companies_query("a", filters.get("industry"), after=("a", ""))),
+            ("search_companies (country)", *self._search_companies_query(country="PH", after=("a", ""))),
+        ]
+        if "company_hash" in filters:
+            queries.append(("get_average_salary", *self._average_salary_query(filters["company_hash"])))
+        return queries
+
+    async def _explain(self, query: str, params: List[Any]) -> list[str]:
+        rows = await self._fetchall(f"EXPLAIN QUERY PLAN {query}", params)
+        return [row[-1] for row in rows]
+
+    async def find_unindexed_queries(self) -> list[tuple[str, dict, str, List[Any]]]:
+        return await find_unindexed_queries(self)
+
+    async def rebuild_rollups(self) -> None:
+        """
+        Regenerates the rollups from the raw rows. Any result may change with
+        them, so the global scope and every company's are bumped, which is how
+        a running server learns to drop what it holds.
+        """
+        versions = {}
+
+        async def operation(connection: aiosqlite.Connection):
+            await connection.execute("BEGIN")
+            for statement in REBUILD_ROLLUPS + REBUILD_SEGMENT_ROLLUPS:
+                await connection.execute(statement)
+            async with connection.execute("SELECT DISTINCT company_hash FROM salary_rollups") as cursor:
+                company_hashes = [row[0] for row in await cursor.fetchall()]
+            versions.update(await bump_data_versions(connection, [GLOBAL_SCOPE, *company_hashes]))
+            await connection.commit()
+
+        await self._connections.run_write(operation)
+        self._record_data_versions(versions)
 
     async def close(self) -> None:
-        if self._connection:
-            await self._connection.close()
\ No newline at end of file
+        if self._write_queue:
+            await self._write_queue.close()
+        await self._connections.close()
\ No newline at end of file
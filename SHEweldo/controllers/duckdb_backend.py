@@ -0,0 +1,334 @@
+import asyncio
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+import duckdb
+import numpy as np
+
+from SHEweldo.models.entities import SalaryRecord, Company
+from SHEweldo.models.enums import *
+from SHEweldo.controllers.database import DatabaseController, FilterParams, IDatabaseController, InsertListener
+from SHEweldo.controllers.rollups import ROLLUP_BUCKET_WIDTH, percentiles_from_buckets
+from SHEweldo.controllers.slow_queries import SlowQueryLog
+from SHEweldo.controllers.versions import GLOBAL_SCOPE, DataVersion
+
+
+def _enum_type(name: str, enum_cls) -> str:
+    return f"CREATE TYPE {name} AS ENUM ({', '.join(repr(member.value) for member in enum_cls)})"
+
+
+# Companies are stored by an integer code assigned on first sight, like the
+# columnar backend, because grouping by a 64 character hash is several times
+# slower; enum columns likewise filter and group faster than VARCHAR.
+_SCHEMA = [
+    _enum_type("industry", Industry),
+    _enum_type("department", Department),
+    _enum_type("experience_level", ExperienceLevel),
+    _enum_type("gender", Gender),
+    "CREATE TABLE companies (code INTEGER, hash VARCHAR, name VARCHAR, industry industry)",
+    """
+    CREATE TABLE salaries (
+        company INTEGER,
+        department department,
+        experience_level experience_level,
+        gender gender,
+        salary_amount DOUBLE,
+        is_well_compensated BOOLEAN
+    )
+    """,
+]
+
+_SALARY_COLUMNS = ("company", "department", "experience_level", "gender", "salary_amount", "is_well_compensated")
+_COMPANY_COLUMNS = ("code", "hash", "name", "industry")
+
+# Rows copied from SQLite per query while catching up.
+SYNC_CHUNK_SIZE = 50000
+
+
+def _pie(not_well_compensated: int, well_compensated: int) -> List[Dict[str, Any]]:
+    return [
+        {"is_well_compensated": is_well_compensated, "count": count}
+        for is_well_compensated, count in enumerate((not_well_compensated, well_compensated))
+        if count
+    ]
+
+
+class DuckDBDatabaseController(IDatabaseController):
+    """
+    Answers the scan-shaped graph queries (histograms, per-company averages,
+    top-N and percentiles) with DuckDB, an embedded column store whose
+    vectorized GROUP BY suits them better than SQLite's row-at-a-time
+    execution. It aggregates the raw salary rows directly.
+
+    SQLite stays the source of truth: writes and point lookups go through
+    `store`, and the in-memory DuckDB copy catches up before a graph read
+    whenever the store's data version moved, by copying the rows past the
+    last SQLite rowid it has seen. That also picks up rows inserted by other
+    processes once their versions are refreshed.
+    """
+
+    def __init__(self, store: Optional[DatabaseController] = None):
+        self._store = store or DatabaseController()
+        self._connection = duckdb.connect()
+        for statement in _SCHEMA:
+            self._connection.execute(statement)
+
+        self._sync_lock = asyncio.Lock()
+        self._synced_version: Optional[DataVersion] = None
+        self._salary_rowid = 0
+        self._company_id = 0
+        self._company_codes: Dict[str, int] = {}
+
+    @property
+    def store(self) -> DatabaseController:
+        return self._store
+
+    @property
+    def slow_query_log(self) -> Optional[SlowQueryLog]:
+        return self._store.slow_query_log
+
+    async def initialize(self):
+        await self._store.initialize()
+        await self._catch_up()
+        print(f"Loaded {await self._count()} salaries into DuckDB.")
+
+    async def _count(self) -> int:
+        return (await self._query("SELECT count(*) FROM salaries"))[0][0]
+
+    async def _catch_up(self) -> None:
+        """Copies rows committed to SQLite since the last catch-up."""
+        if self._store.get_data_version() == self._synced_version:
+            return
+        async with self._sync_lock:
+            # Read first: a write committing meanwhile leaves the version
+            # behind, so the next read catches up again.
+            version = self._store.get_data_version()
+            if version == self._synced_version:
+                return
+
+            companies = await self._store._fetchall(
+                "SELECT id, hash, name, industry FROM companies WHERE id > ? ORDER BY id", (self._company_id,)
+            )
+            if companies:
+                await self._append("companies", _COMPANY_COLUMNS, [
+                    (self._company_code(company_hash), company_hash, name, industry)
+                    for _, company_hash, name, industry in companies
+                ])
+                self._company_id = companies[-1][0]
+
+            while True:
+                rows = await self._store._fetchall(
+                    """
+                    SELECT rowid, company_hash, department, experience_level, gender, salary_amount, is_well_compensated
+                    FROM salaries
+                    WHERE rowid > ?
+                    ORDER BY rowid
+                    LIMIT ?
+                    """,
+                    (self._salary_rowid, SYNC_CHUNK_SIZE),
+                )
+                if rows:
+                    await self._append("salaries", _SALARY_COLUMNS, [
+                        (self._company_code(row[1]),) + row[2:] for row in rows
+                    ])
+                    self._salary_rowid = rows[-1][0]
+                if len(rows) < SYNC_CHUNK_SIZE:
+                    break
+            self._synced_version = version
+
+    def _company_code(self, company_hash: str) -> int:
+        code = self._company_codes.get(company_hash)
+        if code is None:
+            code = self._company_codes[company_hash] = len(self._company_codes)
+        return code
+
+    def _where_clause_and_params(self, filters: FilterParams, company_hash: Optional[str] = None) -> tuple[str, List[Any]]:
+        where_clause = "WHERE true"
+        params = []
+        for hash_val in (filters.get("company_hash"), company_hash):
+            if hash_val:
+                # -1 matches nothing, as no salary names an unseen company.
+                where_clause += " AND company = ?"
+                params.append(self._company_codes.get(hash_val, -1))
+        if "industry" in filters:
+            where_clause += " AND company IN (SELECT code FROM companies WHERE industry = ?)"
+            params.append(filters["industry"].value)
+        for name in ("department", "experience_level", "gender"):
+            if name in filters:
+                where_clause += f" AND {name} = ?"
+                params.append(filters[name].value)
+        return where_clause, params
+
+    async def _append(self, table: str, columns: Tuple[str, ...], rows: List[tuple]) -> None:
+        # A registered dict of NumPy arrays is scanned as one vector per
+        # column; executemany would pay an INSERT per row.
+        arrays = {name: np.array(values) for name, values in zip(columns, zip(*rows))}
+
+        def append():
+            cursor = self._connection.cursor()
+            try:
+                cursor.register("pending_rows", arrays)
+                cursor.execute(f"INSERT INTO {table} SELECT {', '.join(columns)} FROM pending_rows")
+            finally:
+                cursor.close()
+
+        await asyncio.to_thread(append)
+
+    async def _query(self, query: str, params=()) -> list[tuple]:
+        # Each query gets its own cursor, so reads run in parallel threads.
+        def run():
+            cursor = self._connection.cursor()
+            try:
+                return cursor.execute(query, list(params)).fetchall()
+            finally:
+                cursor.close()
+
+        return await asyncio.to_thread(run)
+
+    def add_listener(self, listener: InsertListener) -> None:
+        self._store.add_listener(listener)
+
+    async def get_company_record(self, hash_val: str) -> Optional[Company]:
+        return await self._store.get_company_record(hash_val)
+
+    async def get_all_companies(self) -> list[tuple[str, str]]:
+        return await self._store.get_all_companies()
+
+    async def search_companies(self, prefix: str = "", industry: Optional[Industry] = None,
+                               country: Optional[str] = None, after: Optional[Tuple[str, str]] = None,
+                               limit: int = 20) -> list[tuple[str, str]]:
+        return await self._store.search_companies(prefix, industry, country, after, limit)
+
+    async def insert_salary_record(self, record: SalaryRecord) -> bool:
+        return await self._store.insert_salary_record(record)
+
+    async def insert_company(self, company: Company) -> bool:
+        return await self._store.insert_company(company)
+
+    async def insert_salary_records(self, records: List[SalaryRecord]) -> List[Tuple[SalaryRecord, str]]:
+        return await self._store.insert_salary_records(records)
+
+    async def insert_companies(self, companies: List[Company]) -> List[Tuple[Company, str]]:
+        return await self._store.insert_companies(companies)
+
+    async def get_salary_record(self, salary_id: str) -> Optional[SalaryRecord]:
+        return await self._store.get_salary_record(salary_id)
+
+    async def get_filtered_records(self, filters: FilterParams) -> list[SalaryRecord]:
+        return await self._store.get_filtered_records(filters)
+
+    async def get_company_directory(self) -> list[tuple[str, str, str]]:
+        return await self._store.get_company_directory()
+
+    async def get_company_segment_totals(self) -> list[tuple[str, str, str, int, float]]:
+        return await self._store.get_company_segment_totals()
+
+    # These read a handful of rollup rows, which SQLite answers well inside
+    # DuckDB's fixed cost of about half a millisecond per query.
+    async def get_average_salary(self, company_hash: str) -> float:
+        return await self._store.get_average_salary(company_hash)
+
+    async def get_pie_graph_data(self, filters: FilterParams, id: str = None) -> List[Dict[str, Any]]:
+        return await self._store.get_pie_graph_data(filters, id)
+
+    async def get_pay_gap_cells(self, filters: FilterParams) -> list[tuple[str, str, str, int, float]]:
+        return await self._store.get_pay_gap_cells(filters)
+
+    def iter_filtered_records(self, filters: FilterParams, after: int = 0, chunk_size: int = 1000,
+                              as_json: bool = False) -> AsyncIterator[List[tuple]]:
+        return self._store.iter_filtered_records(filters, after, chunk_size, as_json)
+
+    async def get_benchmark_data(self, filters: FilterParams, range_step: int) -> List[Dict[str, Any]]:
+        # Catch up first: the filters map company hashes to codes.
+        await self._catch_up()
+        where_clause, params = self._where_clause_and_params(filters)
+        rows = await self._query(
+            f"""
+            WITH company_avg_salaries AS (
+                SELECT company, avg(salary_amount) AS avg_salary
+                FROM salaries
+                {where_clause}
+                GROUP BY company
+            )
+            SELECT floor(avg_salary / ?) * ? AS range_start, count(*)
+            FROM company_avg_salaries
+            GROUP BY range_start
+            ORDER BY range_start DESC
+            """,
+            params + [range_step, range_step],
+        )
+        return [{"range_start": range_start, "count": count} for range_start, count in rows]
+
+    async def get_bar_graph_data(self, filters: FilterParams, range_step: int) -> list[dict]:
+        bar_graph, _, _ = await self.get_graph_summary(filters, range_step)
+        return bar_graph
+
+    async def get_graph_summary(self, filters: FilterParams, range_step: int, id: str = None) -> tuple[list[dict], List[Dict[str, Any]], float]:
+        await self._catch_up()
+        where_clause, params = self._where_clause_and_params(filters, id)
+        rows = await self._query(
+            f"""
+            SELECT floor(salary_amount / ?) * ? AS range_start,
+                   count(*), count(*) FILTER (WHERE is_well_compensated), sum(salary_amount)
+            FROM salaries
+            {where_clause}
+            GROUP BY range_start
+            ORDER BY range_start DESC
+            """,
+            [range_step, range_step] + params,
+        )
+        total = sum(row[1] for row in rows)
+        well_compensated = sum(row[2] for row in rows)
+        salary_sum = sum(row[3] for row in rows)
+        bar_graph = [{"range_start": range_start, "count": count} for range_start, count, _, _ in rows]
+        return bar_graph, _pie(total - well_compensated, well_compensated), salary_sum / total if total else 0.0
+
+    async def get_salary_percentiles(self, filters: FilterParams, percentiles: List[float]) -> tuple[int, Dict[float, float]]:
+        # Same buckets and estimator as the rollups, so every backend agrees.
+        await self._catch_up()
+        where_clause, params = self._where_clause_and_params(filters)
+        buckets = await self._query(
+            f"""
+            SELECT CAST(floor(salary_amount / ?) AS BIGINT) AS bucket, count(*)
+            FROM salaries
+            {where_clause}
+            GROUP BY bucket
+            ORDER BY bucket
+            """,
+            [ROLLUP_BUCKET_WIDTH] + params,
+        )
+        return sum(count for _, count in buckets), percentiles_from_buckets(buckets, percentiles)
+
+    async def get_top_companies(self, filters: FilterParams, range_step: int, limit: int = 5) -> List[Dict[str, Any]]:
+        await self._catch_up()
+        where_clause, params = self._where_clause_and_params(filters)
+        # Like the SQLite ranking, only registered companies are ranked.
+        rows = await self._query(
+            f"""
+            SELECT c.name, c.hash, s.avg_salary
+            FROM (
+                SELECT company, avg(salary_amount) AS avg_salary
+                FROM salaries
+                {where_clause}
+                GROUP BY company
+            ) s
+            JOIN companies c ON s.company = c.code
+            ORDER BY s.avg_salary DESC, c.hash
+            LIMIT ?
+            """,
+            params + [limit],
+        )
+        return [{"name": name, "hash": hash_, "average_salary": avg_salary} for name, hash_, avg_salary in rows]
+
+    def get_data_version(self, scope: str = GLOBAL_SCOPE) -> DataVersion:
+        return self._store.get_data_version(scope)
+
+    async def refresh_data_versions(self) -> bool:
+        return await self._store.refresh_data_versions()
+
+    async def warm(self) -> None:
+        await self._store.warm()
+        await self._catch_up()
+
+    async def close(self) -> None:
+        await self._store.close()
+        self._connection.close()
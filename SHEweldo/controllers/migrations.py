@@ -0,0 +1,207 @@
+import itertools
+from typing import Any, List, Tuple
+
+import aiosqlite
+
+from SHEweldo.models.enums import *
+from SHEweldo.controllers.rollups import (
+    ADD_BUCKET_SALARY_SUM_V4,
+    CREATE_ROLLUP_INDEXES_V3,
+    CREATE_ROLLUP_TABLES_V3,
+    CREATE_SEGMENT_ROLLUPS_V6,
+    REBUILD_ROLLUPS_V3,
+    REBUILD_ROLLUPS_V4,
+    REBUILD_SEGMENT_ROLLUPS_V6,
+)
+from SHEweldo.controllers.versions import CREATE_DATA_VERSIONS_V7
+
+_COMPANIES_TABLE = '''
+    CREATE TABLE IF NOT EXISTS companies (
+        id INTEGER PRIMARY KEY,
+        hash TEXT UNIQUE,
+        name TEXT NOT NULL,
+        size TEXT CHECK(size IN ({sizes})),
+        industry TEXT CHECK(industry IN ({industries})),
+        country TEXT NOT NULL
+    )
+'''.format(
+    sizes=", ".join(f"'{size.value}'" for size in CompanySize),
+    industries=", ".join(f"'{industry.value}'" for industry in Industry)
+)
+
+_SALARIES_TABLE = '''
+    CREATE TABLE IF NOT EXISTS salaries (
+        id TEXT PRIMARY KEY,
+        company_hash TEXT NOT NULL,
+        experience_level TEXT CHECK(experience_level IN ({experience_levels})),
+        salary_amount REAL CHECK(salary_amount > 0),
+        gender TEXT CHECK(gender IN ({genders})),
+        submission_date TEXT NOT NULL,
+        is_well_compensated BOOLEAN NOT NULL,
+        department TEXT CHECK(department IN ({departments})),
+        job_title TEXT NOT NULL,
+        FOREIGN KEY(company_hash) REFERENCES companies(hash)
+    )
+'''.format(
+    experience_levels=", ".join(f"'{level.value}'" for level in ExperienceLevel),
+    genders=", ".join(f"'{gender.value}'" for gender in Gender),
+    departments=", ".join(f"'{department.value}'" for department in Department)
+)
+
+# Every salary index ends with salary_amount and is_well_compensated so the
+# graph aggregates are answered from the index alone, without touching the
+# table. The leading columns follow the filters sent by /api/graphs/employee
+# and /api/companies/<hash>: company scoped lookups first, then the segment
+# filters from most to least selective.
+_INDEXES = [
+    '''
+    CREATE INDEX IF NOT EXISTS idx_salaries_company_segment
+    ON salaries (company_hash, department, experience_level, gender, salary_amount, is_well_compensated)
+    ''',
+    '''
+    CREATE INDEX IF NOT EXISTS idx_salaries_department_segment
+    ON salaries (department, experience_level, gender, company_hash, salary_amount, is_well_compensated)
+    ''',
+    '''
+    CREATE INDEX IF NOT EXISTS idx_salaries_experience_segment
+    ON salaries (experience_level, gender, company_hash, salary_amount, is_well_compensated)
+    ''',
+    '''
+    CREATE INDEX IF NOT EXISTS idx_salaries_gender_segment
+    ON salaries (gender, company_hash, salary_amount, is_well_compensated)
+    ''',
+    '''
+    CREATE INDEX IF NOT EXISTS idx_companies_industry
+    ON companies (industry, hash)
+    ''',
+]
+
+# Company typeahead: prefix ranges and keyset pages over (name, hash), with
+# name compared case-insensitively, optionally narrowed to one industry or
+# country first.
+_COMPANY_SEARCH_INDEXES = [
+    '''
+    CREATE INDEX IF NOT EXISTS idx_companies_name
+    ON companies (name COLLATE NOCASE, hash)
+    ''',
+    '''
+    CREATE INDEX IF NOT EXISTS idx_companies_industry_name
+    ON companies (industry, name COLLATE NOCASE, hash)
+    ''',
+    '''
+    CREATE INDEX IF NOT EXISTS idx_companies_country_name
+    ON companies (country COLLATE NOCASE, name COLLATE NOCASE, hash)
+    ''',
+]
+
+# Resumable exports of one company walk its salaries in rowid order. Every
+# index entry ends with the rowid, so an index on company_hash alone keeps
+# each company's salaries in rowid order and a chunk is a range search.
+_EXPORT_INDEXES = [
+    '''
+    CREATE INDEX IF NOT EXISTS idx_salaries_company_rowid
+    ON salaries (company_hash)
+    ''',
+]
+
+# (version, description, statements). Versions are stored in PRAGMA
+# user_version, so an existing record.db is upgraded in place by applying
+# every migration above its current version. Append new migrations; never
+# edit one that has shipped, nor the _V<n> statements it runs.
+MIGRATIONS: List[Tuple[int, str, List[str]]] = [
+    (1, "base tables", [_COMPANIES_TABLE, _SALARIES_TABLE]),
+    (2, "segment and covering indexes", _INDEXES + ["ANALYZE"]),
+    (3, "aggregate rollups", CREATE_ROLLUP_TABLES_V3 + CREATE_ROLLUP_INDEXES_V3 + REBUILD_ROLLUPS_V3 + ["ANALYZE"]),
+    (4, "salary sums on rollup buckets", ADD_BUCKET_SALARY_SUM_V4 + REBUILD_ROLLUPS_V4 + ["ANALYZE"]),
+    (5, "company search indexes", _COMPANY_SEARCH_INDEXES + ["ANALYZE"]),
+    (6, "industry segment rollups", CREATE_SEGMENT_ROLLUPS_V6 + REBUILD_SEGMENT_ROLLUPS_V6),
+    (7, "data versions", CREATE_DATA_VERSIONS_V7),
+    (8, "company export index", _EXPORT_INDEXES + ["ANALYZE"]),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+async def get_schema_version(connection: aiosqlite.Connection) -> int:
+    async with connection.execute("PRAGMA user_version") as cursor:
+        row = await cursor.fetchone()
+    return row[0] if row else 0
+
+
+async def migrate(connection: aiosqlite.Connection) -> int:
+    current = await get_schema_version(connection)
+
+    for version, description, statements in MIGRATIONS:
+        if version <= current:
+            continue
+        try:
+            await connection.execute("BEGIN")
+            for statement in statements:
+                await connection.execute(statement)
+            # PRAGMA does not accept bound parameters.
+            await connection.execute(f"PRAGMA user_version = {int(version)}")
+            await connection.commit()
+        except aiosqlite.Error:
+            await connection.rollback()
+            raise
+        print(f"Applied migration {version}: {description}")
+        current = version
+
+    return current
+
+
+def filter_combinations() -> List[dict]:
+    sample_values = {
+        "company_hash": "0" * 64,
+        "industry": next(iter(Industry)),
+        "department": next(iter(Department)),
+        "experience_level": next(iter(ExperienceLevel)),
+        "gender": next(iter(Gender)),
+    }
+    keys = list(sample_values)
+    combinations = []
+    for size in range(len(keys) + 1):
+        for subset in itertools.combinations(keys, size):
+            combinations.append({key: sample_values[key] for key in subset})
+    return combinations
+
+
+# WITHOUT ROWID tables are stored in their primary key b-tree, so a plain
+# SCAN of them is an index scan in primary key order. That is acceptable when
+# the query has no filters to search on, or when it groups by the leading
+# key column: with low-selectivity filters the planner rightly prefers the
+# ordered walk to an index search followed by a sort.
+_CLUSTERED_TABLES = {
+    "salary_rollups": "company_hash",
+    "salary_rollup_buckets": "company_hash",
+}
+
+_CHECKED_TABLES = ("salaries", "companies") + tuple(_CLUSTERED_TABLES)
+
+
+def _is_unindexed(plan_detail: str, tables: Tuple[str, ...], filtered: bool, query: str = "") -> bool:
+    # "SCAN salaries" walks the table itself; "SCAN salaries USING COVERING
+    # INDEX ..." and every "SEARCH ..." step go through an index.
+    words = plan_detail.split()
+    if len(words) < 2 or words[0] != "SCAN" or words[1] not in tables or "INDEX" in words:
+        return False
+    if words[1] not in _CLUSTERED_TABLES:
+        return True
+    grouped_by_key = f"GROUP BY {_CLUSTERED_TABLES[words[1]]}" in " ".join(query.split())
+    return filtered and not grouped_by_key
+
+
+async def find_unindexed_queries(controller, tables: Tuple[str, ...] = _CHECKED_TABLES) -> List[Tuple[str, dict, str, List[Any]]]:
+    """
+    Runs EXPLAIN QUERY PLAN for every query the controller can generate, over
+    every combination of filters the API sends, and returns
+    (query name, filters, offending plan step, sql params) for each plan that
+    reads one of `tables` without an index.
+    """
+    offenders = []
+    for filters in filter_combinations():
+        for name, query, params in await controller._explainable_queries(filters):
+            for detail in await controller._explain(query, params):
+                if _is_unindexed(detail, tables, bool(filters), query):
+                    offenders.append((name, filters, detail, params))
+    return offenders
@@ -0,0 +1,343 @@
+from typing import Any, Dict, Iterable, List
+
+import aiosqlite
+
+from SHEweldo.models.entities import SalaryRecord
+
+# Width of the fine-grained salary buckets kept in salary_rollup_buckets.
+# Histograms are answered from the rollups whenever the requested range step
+# is a multiple of this width; any other step falls back to the raw rows.
+ROLLUP_BUCKET_WIDTH = 100
+
+_SEGMENT_COLUMNS = "company_hash, industry, department, experience_level, gender"
+
+# Statements suffixed _V<n> are run by migration n and are frozen once it has
+# shipped: a database upgraded through every migration must end up where a
+# fresh one does. A schema change adds statements for a new migration and
+# points the unsuffixed names used at runtime at them.
+
+CREATE_ROLLUP_TABLES_V3 = [
+    '''
+    CREATE TABLE IF NOT EXISTS salary_rollups (
+        company_hash TEXT NOT NULL,
+        industry TEXT NOT NULL DEFAULT '',
+        department TEXT NOT NULL,
+        experience_level TEXT NOT NULL,
+        gender TEXT NOT NULL,
+        salary_count INTEGER NOT NULL,
+        salary_sum REAL NOT NULL,
+        salary_sum_sq REAL NOT NULL,
+        well_compensated_count INTEGER NOT NULL,
+        PRIMARY KEY (company_hash, department, experience_level, gender)
+    ) WITHOUT ROWID
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS salary_rollup_buckets (
+        company_hash TEXT NOT NULL,
+        industry TEXT NOT NULL DEFAULT '',
+        department TEXT NOT NULL,
+        experience_level TEXT NOT NULL,
+        gender TEXT NOT NULL,
+        bucket INTEGER NOT NULL,
+        salary_count INTEGER NOT NULL,
+        well_compensated_count INTEGER NOT NULL,
+        PRIMARY KEY (company_hash, department, experience_level, gender, bucket)
+    ) WITHOUT ROWID
+    ''',
+]
+
+# Shared by migrations 3 and 4; add a new tuple rather than editing this one.
+_INDEXED_SEGMENTS = (
+    ("industry", "industry, department, experience_level, gender"),
+    ("department", "department, experience_level, gender"),
+    ("experience", "experience_level, gender"),
+    ("gender", "gender"),
+)
+
+
+def _segment_indexes(table: str, extra: str) -> List[str]:
+    return [
+        f'''
+        CREATE INDEX IF NOT EXISTS idx_{table}_{name}
+        ON {table} ({columns}{extra})
+        '''
+        for name, columns in _INDEXED_SEGMENTS
+    ]
+
+
+# company_hash lookups use the primary keys; these cover the segment filters.
+CREATE_ROLLUP_INDEXES_V3 = (
+    _segment_indexes("salary_rollups", ", salary_count, salary_sum, well_compensated_count")
+    + _segment_indexes("salary_rollup_buckets", ", bucket, salary_count, well_compensated_count")
+)
+
+# Buckets also carry the salary sum, so a single pass over them answers the
+# histogram, the well-compensated split and the average together.
+ADD_BUCKET_SALARY_SUM_V4 = (
+    ["ALTER TABLE salary_rollup_buckets ADD COLUMN salary_sum REAL NOT NULL DEFAULT 0"]
+    + [f"DROP INDEX IF EXISTS idx_salary_rollup_buckets_{name}" for name, _ in _INDEXED_SEGMENTS]
+    + _segment_indexes("salary_rollup_buckets", ", bucket, salary_count, well_compensated_count, salary_sum")
+)
+
+# Regenerates both rollup tables from the raw rows, as first shipped: the
+# buckets had no salary sum yet.
+REBUILD_ROLLUPS_V3 = [
+    "DELETE FROM salary_rollups",
+    "DELETE FROM salary_rollup_buckets",
+    f'''
+    INSERT INTO salary_rollups (
+        {_SEGMENT_COLUMNS},
+        salary_count, salary_sum, salary_sum_sq, well_compensated_count
+    )
+    SELECT
+        s.company_hash, COALESCE(MAX(c.industry), ''), s.department, s.experience_level, s.gender,
+        COUNT(*), SUM(s.salary_amount), SUM(s.salary_amount * s.salary_amount),
+        SUM(CASE WHEN s.is_well_compensated THEN 1 ELSE 0 END)
+    FROM salaries s
+    LEFT JOIN companies c ON c.hash = s.company_hash
+    GROUP BY s.company_hash, s.department, s.experience_level, s.gender
+    ''',
+    f'''
+    INSERT INTO salary_rollup_buckets (
+        {_SEGMENT_COLUMNS}, bucket,
+        salary_count, well_compensated_count
+    )
+    SELECT
+        s.company_hash, COALESCE(MAX(c.industry), ''), s.department, s.experience_level, s.gender,
+        CAST(FLOOR(s.salary_amount / {ROLLUP_BUCKET_WIDTH}) AS INTEGER) AS bucket,
+        COUNT(*), SUM(CASE WHEN s.is_well_compensated THEN 1 ELSE 0 END)
+    FROM salaries s
+    LEFT JOIN companies c ON c.hash = s.company_hash
+    GROUP BY s.company_hash, s.department, s.experience_level, s.gender, bucket
+    ''',
+]
+
+# Regenerates both rollup tables from the raw rows, with the bucket sums.
+REBUILD_ROLLUPS_V4 = [
+    "DELETE FROM salary_rollups",
+    "DELETE FROM salary_rollup_buckets",
+    f'''
+    INSERT INTO salary_rollups (
+        {_SEGMENT_COLUMNS},
+        salary_count, salary_sum, salary_sum_sq, well_compensated_count
+    )
+    SELECT
+        s.company_hash, COALESCE(MAX(c.industry), ''), s.department, s.experience_level, s.gender,
+        COUNT(*), SUM(s.salary_amount), SUM(s.salary_amount * s.salary_amount),
+        SUM(CASE WHEN s.is_well_compensated THEN 1 ELSE 0 END)
+    FROM salaries s
+    LEFT JOIN companies c ON c.hash = s.company_hash
+    GROUP BY s.company_hash, s.department, s.experience_level, s.gender
+    ''',
+    f'''
+    INSERT INTO salary_rollup_buckets (
+        {_SEGMENT_COLUMNS}, bucket,
+        salary_count, well_compensated_count, salary_sum
+    )
+    SELECT
+        s.company_hash, COALESCE(MAX(c.industry), ''), s.department, s.experience_level, s.gender,
+        CAST(FLOOR(s.salary_amount / {ROLLUP_BUCKET_WIDTH}) AS INTEGER) AS bucket,
+        COUNT(*), SUM(CASE WHEN s.is_well_compensated THEN 1 ELSE 0 END), SUM(s.salary_amount)
+    FROM salaries s
+    LEFT JOIN companies c ON c.hash = s.company_hash
+    GROUP BY s.company_hash, s.department, s.experience_level, s.gender, bucket
+    ''',
+]
+
+# Industry-wide totals per segment: salary_rollups summed over companies. Its
+# size is bounded by the enums (industry x department x experience x gender)
+# however many companies and salaries there are, so scanning it is as cheap
+# as an index search and it needs no secondary indexes.
+CREATE_SEGMENT_ROLLUPS_V6 = [
+    '''
+    CREATE TABLE IF NOT EXISTS salary_segment_rollups (
+        industry TEXT NOT NULL DEFAULT '',
+        department TEXT NOT NULL,
+        experience_level TEXT NOT NULL,
+        gender TEXT NOT NULL,
+        salary_count INTEGER NOT NULL,
+        salary_sum REAL NOT NULL,
+        salary_sum_sq REAL NOT NULL,
+        well_compensated_count INTEGER NOT NULL,
+        PRIMARY KEY (industry, department, experience_level, gender)
+    ) WITHOUT ROWID
+    ''',
+]
+
+REBUILD_SEGMENT_ROLLUPS_V6 = [
+    "DELETE FROM salary_segment_rollups",
+    '''
+    INSERT INTO salary_segment_rollups (
+        industry, department, experience_level, gender,
+        salary_count, salary_sum, salary_sum_sq, well_compensated_count
+    )
+    SELECT
+        industry, department, experience_level, gender,
+        SUM(salary_count), SUM(salary_sum), SUM(salary_sum_sq), SUM(well_compensated_count)
+    FROM salary_rollups
+    GROUP BY industry, department, experience_level, gender
+    ''',
+]
+
+# Used by `python -m SHEweldo.manage rebuild-rollups`.
+REBUILD_ROLLUPS = REBUILD_ROLLUPS_V4
+REBUILD_SEGMENT_ROLLUPS = REBUILD_SEGMENT_ROLLUPS_V6
+
+_UPSERT_ROLLUP = f'''
+    INSERT INTO salary_rollups (
+        {_SEGMENT_COLUMNS},
+        salary_count, salary_sum, salary_sum_sq, well_compensated_count
+    ) VALUES (?, ?, ?, ?, ?, 1, ?, ?, ?)
+    ON CONFLICT (company_hash, department, experience_level, gender) DO UPDATE SET
+        salary_count = salary_count + 1,
+        salary_sum = salary_sum + excluded.salary_sum,
+        salary_sum_sq = salary_sum_sq + excluded.salary_sum_sq,
+        well_compensated_count = well_compensated_count + excluded.well_compensated_count
+'''
+
+_UPSERT_BUCKET = f'''
+    INSERT INTO salary_rollup_buckets (
+        {_SEGMENT_COLUMNS}, bucket,
+        salary_count, well_compensated_count, salary_sum
+    ) VALUES (?, ?, ?, ?, ?, ?, 1, ?, ?)
+    ON CONFLICT (company_hash, department, experience_level, gender, bucket) DO UPDATE SET
+        salary_count = salary_count + 1,
+        well_compensated_count = well_compensated_count + excluded.well_compensated_count,
+        salary_sum = salary_sum + excluded.salary_sum
+'''
+
+
+_UPSERT_SEGMENT = '''
+    INSERT INTO salary_segment_rollups (
+        industry, department, experience_level, gender,
+        salary_count, salary_sum, salary_sum_sq, well_compensated_count
+    ) VALUES (?, ?, ?, ?, 1, ?, ?, ?)
+    ON CONFLICT (industry, department, experience_level, gender) DO UPDATE SET
+        salary_count = salary_count + 1,
+        salary_sum = salary_sum + excluded.salary_sum,
+        salary_sum_sq = salary_sum_sq + excluded.salary_sum_sq,
+        well_compensated_count = well_compensated_count + excluded.well_compensated_count
+'''
+
+
+def salary_bucket(salary_amount: float) -> int:
+    return int(salary_amount // ROLLUP_BUCKET_WIDTH)
+
+
+def supports_range_step(range_step: int) -> bool:
+    return range_step > 0 and range_step % ROLLUP_BUCKET_WIDTH == 0
+
+
+def _rollup_params(record: SalaryRecord, industry: str) -> tuple[tuple, tuple]:
+    segment = (
+        record.company_hash,
+        industry,
+        record.department.value,
+        record.experience_level.value,
+        record.gender.value,
+    )
+    well_compensated = 1 if record.is_well_compensated else 0
+    return (
+        segment + (record.salary_amount, record.salary_amount * record.salary_amount, well_compensated),
+        segment + (salary_bucket(record.salary_amount), well_compensated, record.salary_amount),
+    )
+
+
+async def apply_salary_to_rollups(connection: aiosqlite.Connection, record: SalaryRecord, industry: str) -> None:
+    """
+    Adds one salary to both rollup tables. Must run on the same connection and
+    inside the same transaction as the INSERT into salaries.
+    """
+    rollup_params, bucket_params = _rollup_params(record, industry)
+    await connection.execute(_UPSERT_ROLLUP, rollup_params)
+    await connection.execute(_UPSERT_BUCKET, bucket_params)
+    await connection.execute(_UPSERT_SEGMENT, rollup_params[1:])
+
+
+async def apply_salaries_to_rollups(connection: aiosqlite.Connection, records: Iterable[SalaryRecord],
+                                    industries: Dict[str, str]) -> None:
+    """Batch form of apply_salary_to_rollups; `industries` maps company hash to industry."""
+    params = [_rollup_params(record, industries.get(record.company_hash, "")) for record in records]
+    await connection.executemany(_UPSERT_ROLLUP, [rollup_params for rollup_params, _ in params])
+    await connection.executemany(_UPSERT_BUCKET, [bucket_params for _, bucket_params in params])
+    await connection.executemany(_UPSERT_SEGMENT, [rollup_params[1:] for rollup_params, _ in params])
+
+
+# Moves a company's totals out of its old industry's segment rows and into
+# the new one's, then relabels its own rollup rows. Runs in this order: the
+# moves select the rows whose industry is about to change.
+_MOVE_SEGMENT_TOTALS = [
+    f'''
+    INSERT INTO salary_segment_rollups (
+        industry, department, experience_level, gender,
+        salary_count, salary_sum, salary_sum_sq, well_compensated_count
+    )
+    SELECT {industry}, department, experience_level, gender,
+        {sign}salary_count, {sign}salary_sum, {sign}salary_sum_sq, {sign}well_compensated_count
+    FROM salary_rollups
+    WHERE company_hash = :company_hash AND industry != :industry
+    ON CONFLICT (industry, department, experience_level, gender) DO UPDATE SET
+        salary_count = salary_count + excluded.salary_count,
+        salary_sum = salary_sum + excluded.salary_sum,
+        salary_sum_sq = salary_sum_sq + excluded.salary_sum_sq,
+        well_compensated_count = well_compensated_count + excluded.well_compensated_count
+    '''
+    for industry, sign in (("industry", "-"), (":industry", ""))
+]
+
+_SET_INDUSTRY = _MOVE_SEGMENT_TOTALS + [
+    f"UPDATE {table} SET industry = :industry WHERE company_hash = :company_hash AND industry != :industry"
+    for table in ("salary_rollups", "salary_rollup_buckets")
+]
+
+_DELETE_EMPTY_SEGMENTS = "DELETE FROM salary_segment_rollups WHERE salary_count = 0"
+
+
+async def set_company_industry(connection: aiosqlite.Connection, company_hash: str, industry: str) -> None:
+    # Salaries may be submitted before their company is registered.
+    for statement in _SET_INDUSTRY:
+        await connection.execute(statement, {"industry": industry, "company_hash": company_hash})
+    await connection.execute(_DELETE_EMPTY_SEGMENTS)
+
+
+async def set_company_industries(connection: aiosqlite.Connection, industries: Dict[str, str]) -> None:
+    params = [{"industry": industry, "company_hash": company_hash} for company_hash, industry in industries.items()]
+    for statement in _SET_INDUSTRY:
+        await connection.executemany(statement, params)
+    await connection.execute(_DELETE_EMPTY_SEGMENTS)
+
+
+def percentiles_from_buckets(buckets: List[tuple[int, int]], percentiles: Iterable[float]) -> Dict[float, float]:
+    """
+    Estimates salary percentiles from (bucket, count) pairs sorted by bucket.
+    The bucket that holds the requested rank is found exactly and the value
+    is interpolated linearly inside it, so every estimate is within
+    ROLLUP_BUCKET_WIDTH of the true percentile. Bucket counts from any set of
+    segments can simply be summed first, which is what makes the buckets a
+    mergeable sketch for every filter combination.
+    """
+    total = sum(count for _, count in buckets)
+    if not total:
+        return {}
+
+    estimates = {}
+    for percentile in percentiles:
+        rank = percentile / 100 * total
+        seen = 0
+        for bucket, count in buckets:
+            if seen + count >= rank and count:
+                fraction = (rank - seen) / count
+                estimates[percentile] = (bucket + fraction) * ROLLUP_BUCKET_WIDTH
+                break
+            seen += count
+    return estimates
+
+
+def build_rollup_where_clause_and_params(filters, alias: str = "") -> tuple[str, List[Any]]:
+    where_clause = "WHERE 1=1"
+    params = []
+    for key in ("company_hash", "industry", "department", "experience_level", "gender"):
+        if key in filters:
+            where_clause += f" AND {alias}{key} = ?"
+            params.append(filters[key] if key == "company_hash" else filters[key].value)
+    return where_clause, params
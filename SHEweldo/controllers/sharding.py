@@ -0,0 +1,321 @@
+import asyncio
+import os
+import zlib
+from collections import defaultdict
+from typing import Any, AsyncIterator, Callable, Dict, Iterable, List, Optional, Tuple
+
+from SHEweldo.models.entities import SalaryRecord, Company
+from SHEweldo.models.enums import *
+from SHEweldo.controllers.database import DatabaseController, FilterParams, IDatabaseController, InsertListener
+from SHEweldo.controllers.rollups import percentiles_from_buckets
+from SHEweldo.controllers.slow_queries import SlowQueryLog
+from SHEweldo.controllers.versions import COMPANIES_SCOPE, GLOBAL_SCOPE, DataVersion
+
+# Export cursors carry the shard index above the shard's own rowid, so they
+# keep increasing across the whole export and stay below 2**53 for
+# JavaScript clients.
+_CURSOR_SHIFT = 40
+_ROWID_MASK = (1 << _CURSOR_SHIFT) - 1
+
+
+def shard_paths(db_name: str, shards: int) -> List[str]:
+    """
+    Database files of a layout with `shards` shards. One shard is the plain
+    file; otherwise the count is part of every name, so a layout is never
+    opened with the wrong count by mistake.
+    """
+    if shards < 1:
+        raise ValueError("shards must be at least 1")
+    if shards == 1:
+        return [db_name]
+    root, extension = os.path.splitext(db_name)
+    return [f"{root}.shard{index}-of-{shards}{extension}" for index in range(shards)]
+
+
+def shard_index(company_hash: str, shards: int) -> int:
+    # crc32 rather than hash(), which is salted per process.
+    return zlib.crc32(company_hash.encode()) % shards
+
+
+class _ShardEvents(InsertListener):
+    """
+    Forwards one shard's inserts to the router's listeners. Companies are
+    written to every shard, so only the first shard reports them.
+    """
+
+    def __init__(self, router: "ShardedDatabaseController", index: int):
+        self._router = router
+        self._index = index
+
+    def on_salary_inserted(self, record: SalaryRecord, industry: str) -> None:
+        self._router._notify("on_salary_inserted", record, industry)
+
+    def on_company_inserted(self, company: Company) -> None:
+        if self._index == 0:
+            self._router._notify("on_company_inserted", company)
+
+
+class ShardedDatabaseController(IDatabaseController):
+    """
+    Salaries partitioned by company hash over several SQLite files, each a
+    complete DatabaseController with its own writer, readers and rollups.
+    The companies table, which is small and rarely written, is copied to
+    every shard, so industry filters and company joins stay local.
+
+    Queries naming one company go to its shard. Everything else fans out to
+    all shards in parallel and the partial aggregates are merged: counts
+    and sums add up, and a company's average is complete within its shard,
+    so per-company results need no further merging.
+    """
+
+    def __init__(self, shards: List[DatabaseController]):
+        if not shards:
+            raise ValueError("At least one shard is required")
+        self._shards = shards
+        self._listeners: List[InsertListener] = []
+        for index, shard in enumerate(shards):
+            shard.add_listener(_ShardEvents(self, index))
+
+    @property
+    def shards(self) -> List[DatabaseController]:
+        return self._shards
+
+    @property
+    def slow_query_log(self) -> Optional[SlowQueryLog]:
+        return self._shards[0].slow_query_log
+
+    def _shard(self, company_hash: str) -> DatabaseController:
+        return self._shards[shard_index(company_hash, len(self._shards))]
+
+    def _route(self, filters: FilterParams, company_hash: Optional[str] = None) -> List[DatabaseController]:
+        """The shards that can hold salaries matching `filters`."""
+        hash_val = filters.get("company_hash") or company_hash
+        return [self._shard(hash_val)] if hash_val else self._shards
+
+    @staticmethod
+    async def _gather(shards: Iterable[DatabaseController], call: Callable) -> list:
+        return await asyncio.gather(*(call(shard) for shard in shards))
+
+    async def initialize(self):
+        await self._gather(self._shards, lambda shard: shard.initialize())
+        await self._replicate_companies()
+
+    async def _replicate_companies(self) -> None:
+        """
+        Copies companies missing from a shard, in case a company insert
+        reached the first shard but not all the others.
+        """
+        rows = await self._shards[0]._fetchall("SELECT * FROM companies")
+        for shard in self._shards[1:]:
+            present = {hash_val for hash_val, in await shard._fetchall("SELECT hash FROM companies")}
+            missing = [Company.from_row(row) for row in rows if row[1] not in present]
+            if missing:
+                await shard.insert_companies(missing)
+                print(f"Replicated {len(missing)} missing companies to {shard.connections.db_name}")
+
+    def add_listener(self, listener: InsertListener) -> None:
+        self._listeners.append(listener)
+
+    def _notify(self, event: str, *args) -> None:
+        for listener in self._listeners:
+            try:
+                getattr(listener, event)(*args)
+            except Exception as e:
+                print(f"Insert listener {type(listener).__name__}.{event} failed: {e}")
+
+    async def get_company_record(self, hash_val: str) -> Optional[Company]:
+        return await self._shards[0].get_company_record(hash_val)
+
+    async def get_all_companies(self) -> list[tuple[str, str]]:
+        return await self._shards[0].get_all_companies()
+
+    async def search_companies(self, prefix: str = "", industry: Optional[Industry] = None,
+                               country: Optional[str] = None, after: Optional[Tuple[str, str]] = None,
+                               limit: int = 20) -> list[tuple[str, str]]:
+        return await self._shards[0].search_companies(prefix, industry, country, after, limit)
+
+    async def get_company_directory(self) -> list[tuple[str, str, str]]:
+        return await self._shards[0].get_company_directory()
+
+    async def insert_salary_record(self, record: SalaryRecord) -> bool:
+        return await self._shard(record.company_hash).insert_salary_record(record)
+
+    async def insert_salary_records(self, records: List[SalaryRecord]) -> List[Tuple[SalaryRecord, str]]:
+        by_shard: Dict[int, List[SalaryRecord]] = defaultdict(list)
+        for record in records:
+            by_shard[shard_index(record.company_hash, len(self._shards))].append(record)
+        results = await asyncio.gather(*(
+            self._shards[index].insert_salary_records(group) for index, group in by_shard.items()
+        ))
+        return [rejection for rejected in results for rejection in rejected]
+
+    async def insert_company(self, company: Company) -> bool:
+        # The first shard decides, as it holds the unique index that counts.
+        if not await self._shards[0].insert_company(company):
+            return False
+        await self._gather(self._shards[1:], lambda shard: shard.insert_company(company))
+        return True
+
+    async def insert_companies(self, companies: List[Company]) -> List[Tuple[Company, str]]:
+        rejected = await self._shards[0].insert_companies(companies)
+        rejected_ids = {id(company) for company, _ in rejected}
+        accepted = [company for company in companies if id(company) not in rejected_ids]
+        if accepted:
+            await self._gather(self._shards[1:], lambda shard: shard.insert_companies(accepted))
+        return rejected
+
+    async def get_salary_record(self, salary_id: str) -> Optional[SalaryRecord]:
+        # Salary ids don't say which company they belong to.
+        for record in await self._gather(self._shards, lambda shard: shard.get_salary_record(salary_id)):
+            if record is not None:
+                return record
+        return None
+
+    async def get_average_salary(self, company_hash: str) -> float:
+        return await self._shard(company_hash).get_average_salary(company_hash)
+
+    async def get_filtered_records(self, filters: FilterParams) -> list[SalaryRecord]:
+        parts = await self._gather(self._route(filters), lambda shard: shard.get_filtered_records(filters))
+        return [record for part in parts for record in part]
+
+    async def get_company_segment_totals(self) -> list[tuple[str, str, str, int, float]]:
+        parts = await self._gather(self._shards, lambda shard: shard.get_company_segment_totals())
+        return [row for part in parts for row in part]
+
+    async def iter_filtered_records(self, filters: FilterParams, after: int = 0, chunk_size: int = 1000,
+                                    as_json: bool = False) -> AsyncIterator[List[tuple]]:
+        """
+        Walks the shards one after another. The cursor of every row is
+        (shard index << 40) + rowid, so resuming after it continues in the
+        same shard and then the ones after it.
+        """
+        routed = {id(shard) for shard in self._route(filters)}
+        first = after >> _CURSOR_SHIFT
+        for index in range(first, len(self._shards)):
+            shard = self._shards[index]
+            if id(shard) not in routed:
+                continue
+            base = index << _CURSOR_SHIFT
+            shard_after = after & _ROWID_MASK if index == first else 0
+            async for rows in shard.iter_filtered_records(filters, shard_after, chunk_size, as_json):
+                if as_json:
+                    # Each line starts with the cursor: {"cursor":<rowid>,...
+                    yield [
+                        (base + rowid, f'{{"cursor":{base + rowid}{line[line.index(","):]}')
+                        for rowid, line in rows
+                    ]
+                else:
+                    yield [(base + row[0],) + row[1:] for row in rows]
+
+    async def get_benchmark_data(self, filters: FilterParams, range_step: int) -> List[Dict[str, Any]]:
+        parts = await self._gather(self._route(filters), lambda shard: shard.get_benchmark_data(filters, range_step))
+        return self._merge_histograms(parts)
+
+    async def get_bar_graph_data(self, filters: FilterParams, range_step: int) -> list[dict]:
+        parts = await self._gather(self._route(filters), lambda shard: shard.get_bar_graph_data(filters, range_step))
+        return self._merge_histograms(parts)
+
+    @staticmethod
+    def _merge_histograms(parts: List[List[Dict[str, Any]]]) -> List[Dict[str, Any]]:
+        counts: Dict[float, int] = defaultdict(int)
+        for part in parts:
+            for bucket in part:
+                counts[bucket["range_start"]] += bucket["count"]
+        return [{"range_start": range_start, "count": counts[range_start]} for range_start in sorted(counts, reverse=True)]
+
+    async def get_pie_graph_data(self, filters: FilterParams, id: str = None) -> List[Dict[str, Any]]:
+        parts = await self._gather(self._route(filters, id), lambda shard: shard.get_pie_graph_data(filters, id))
+        counts = [0, 0]
+        for part in parts:
+            for slice_ in part:
+                counts[slice_["is_well_compensated"]] += slice_["count"]
+        return [
+            {"is_well_compensated": is_well_compensated, "count": count}
+            for is_well_compensated, count in enumerate(counts)
+            if count
+        ]
+
+    async def get_graph_summary(self, filters: FilterParams, range_step: int, id: str = None) -> tuple[list[dict], List[Dict[str, Any]], float]:
+        async def partial(shard: DatabaseController) -> list[tuple]:
+            query, params = await shard._graph_summary_query(filters, range_step, id)
+            return await shard._fetchall(query, params)
+
+        # Merge the grouped rows, not the averages, so the mean is exact.
+        buckets: Dict[float, List[float]] = {}
+        for part in await self._gather(self._route(filters, id), partial):
+            for range_start, count, well_count, amount in part:
+                totals = buckets.setdefault(range_start, [0, 0, 0.0])
+                totals[0] += count
+                totals[1] += well_count
+                totals[2] += amount
+
+        bar_graph = [{"range_start": range_start, "count": buckets[range_start][0]} for range_start in sorted(buckets, reverse=True)]
+        total = sum(totals[0] for totals in buckets.values())
+        well_compensated = sum(totals[1] for totals in buckets.values())
+        salary_sum = sum(totals[2] for totals in buckets.values())
+        pie_graph = [
+            {"is_well_compensated": is_well_compensated, "count": count}
+            for is_well_compensated, count in enumerate((total - well_compensated, well_compensated))
+            if count
+        ]
+        return bar_graph, pie_graph, salary_sum / total if total else 0.0
+
+    async def get_salary_percentiles(self, filters: FilterParams, percentiles: List[float]) -> tuple[int, Dict[float, float]]:
+        async def partial(shard: DatabaseController) -> list[tuple]:
+            query, params = await shard._percentile_buckets_query(filters)
+            return await shard._fetchall(query, params)
+
+        counts: Dict[int, int] = defaultdict(int)
+        for part in await self._gather(self._route(filters), partial):
+            for bucket, count in part:
+                counts[bucket] += count
+        buckets = sorted(counts.items())
+        return sum(counts.values()), percentiles_from_buckets(buckets, percentiles)
+
+    async def get_pay_gap_cells(self, filters: FilterParams) -> list[tuple[str, str, str, int, float]]:
+        cells: Dict[tuple, List[float]] = {}
+        for part in await self._gather(self._route(filters), lambda shard: shard.get_pay_gap_cells(filters)):
+            for department, experience_level, gender, count, amount in part:
+                totals = cells.setdefault((department, experience_level, gender), [0, 0.0])
+                totals[0] += count
+                totals[1] += amount
+        return [key + (count, amount) for key, (count, amount) in sorted(cells.items())]
+
+    async def get_top_companies(self, filters: FilterParams, range_step: int, limit: int = 5) -> List[Dict[str, Any]]:
+        # Each shard's top `limit` holds every company that can make the top.
+        parts = await self._gather(self._route(filters), lambda shard: shard.get_top_companies(filters, range_step, limit))
+        ranked = sorted(
+            (company for part in parts for company in part),
+            key=lambda company: (-company["average_salary"], company["hash"]),
+        )
+        return ranked[:limit]
+
+    def get_data_version(self, scope: str = GLOBAL_SCOPE) -> DataVersion:
+        """
+        A company's scope is versioned by its shard. Global scopes add up
+        every shard's version, which grows whenever any shard is written.
+        """
+        if scope not in (GLOBAL_SCOPE, COMPANIES_SCOPE):
+            return self._shard(scope).get_data_version(scope)
+        versions = [shard.get_data_version(scope) for shard in self._shards]
+        return sum(version for version, _ in versions), max(modified_at for _, modified_at in versions)
+
+    async def refresh_data_versions(self) -> bool:
+        return any(await self._gather(self._shards, lambda shard: shard.refresh_data_versions()))
+
+    async def warm(self) -> None:
+        await self._gather(self._shards, lambda shard: shard.warm())
+
+    async def rebuild_rollups(self) -> None:
+        await self._gather(self._shards, lambda shard: shard.rebuild_rollups())
+
+    async def find_unindexed_queries(self) -> list[tuple[str, dict, str, List[Any]]]:
+        """Every shard's offenders, each named after the shard it was found on."""
+        found_per_shard = await self._gather(self._shards, lambda shard: shard.find_unindexed_queries())
+        offenders = []
+        for shard, found in zip(self._shards, found_per_shard):
+            offenders += [(f"{shard.connections.db_name}: {name}", *rest) for name, *rest in found]
+        return offenders
+
+    async def close(self) -> None:
+        await self._gather(self._shards, lambda shard: shard.close())
@@ -0,0 +1,118 @@
+import logging
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Deque, Dict, List, Optional, Sequence
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class QueryShapeStats:
+    shape: str
+    calls: int = 0
+    slow_calls: int = 0
+    total_seconds: float = 0.0
+    max_seconds: float = 0.0
+    rows: int = 0
+    # EXPLAIN QUERY PLAN details, captured the first time the shape is slow.
+    plan: Optional[List[str]] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "shape": self.shape,
+            "calls": self.calls,
+            "slow_calls": self.slow_calls,
+            "total_ms": self.total_seconds * 1000,
+            "mean_ms": self.total_seconds * 1000 / self.calls if self.calls else 0.0,
+            "max_ms": self.max_seconds * 1000,
+            "rows": self.rows,
+            "plan": self.plan,
+        }
+
+
+def param_types(params: Sequence[Any]) -> List[str]:
+    """
+    What is kept of a query's parameters: their types only. Values include
+    salary ids, which identify a submitter, so they are never logged.
+    """
+    return [type(param).__name__ for param in params]
+
+
+@dataclass
+class SlowQuery:
+    shape: str
+    param_types: List[str]
+    seconds: float
+    rows: int
+    at: float = field(default_factory=time.time)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "shape": self.shape,
+            "param_types": self.param_types,
+            "ms": self.seconds * 1000,
+            "rows": self.rows,
+            "at": self.at,
+        }
+
+
+class SlowQueryLog:
+    """
+    Per-shape statistics for every read query plus the most recent queries
+    slower than `threshold_ms`. The SQL is fully parameterized, so its text
+    with whitespace collapsed identifies the shape, and the number of shapes
+    is bounded by the filter combinations the controller can generate.
+    """
+
+    def __init__(self, threshold_ms: float, max_entries: int = 200):
+        self.threshold = threshold_ms / 1000
+        self._shapes: Dict[str, QueryShapeStats] = {}
+        self._recent: Deque[SlowQuery] = deque(maxlen=max_entries)
+
+    @staticmethod
+    def shape(query: str) -> str:
+        return " ".join(query.split())
+
+    def record(self, query: str, params: Sequence[Any], seconds: float, rows: int) -> Optional[QueryShapeStats]:
+        """
+        Records one execution. Returns the shape's stats when the query was
+        slow and its plan is still missing, so the caller can capture it.
+        """
+        shape = self.shape(query)
+        stats = self._shapes.get(shape)
+        if stats is None:
+            stats = self._shapes[shape] = QueryShapeStats(shape)
+        stats.calls += 1
+        stats.total_seconds += seconds
+        stats.max_seconds = max(stats.max_seconds, seconds)
+        stats.rows += rows
+
+        if seconds < self.threshold:
+            return None
+        stats.slow_calls += 1
+        types = param_types(params)
+        self._recent.append(SlowQuery(shape, types, seconds, rows))
+        logger.warning("Slow query (%.1f ms, %d rows): %s param_types=%s", seconds * 1000, rows, shape, types)
+        return stats if stats.plan is None else None
+
+    def record_plan(self, stats: QueryShapeStats, plan: List[str]) -> None:
+        """Keeps the plan captured for a slow shape and logs it with the slow query."""
+        stats.plan = plan
+        logger.warning("Query plan of %s: %s", stats.shape, "; ".join(plan))
+
+    def shapes(self, slow_only: bool = True) -> List[Dict[str, Any]]:
+        """Shape statistics, the most total time first."""
+        shapes = [stats for stats in self._shapes.values() if stats.slow_calls or not slow_only]
+        return [stats.to_dict() for stats in sorted(shapes, key=lambda stats: stats.total_seconds, reverse=True)]
+
+    def recent(self) -> List[Dict[str, Any]]:
+        return [query.to_dict() for query in reversed(self._recent)]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "threshold_ms": self.threshold * 1000,
+            "tracked_shapes": len(self._shapes),
+            "slow_shapes": sum(1 for stats in self._shapes.values() if stats.slow_calls),
+            "slow_queries": sum(stats.slow_calls for stats in self._shapes.values()),
+        }
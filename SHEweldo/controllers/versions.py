@@ -0,0 +1,46 @@
+import json
+import time
+from typing import Dict, Iterable, Tuple
+
+import aiosqlite
+
+# Data version scopes. Every insert bumps GLOBAL_SCOPE, company inserts also
+# bump COMPANIES_SCOPE, and both salary and company inserts bump the scope
+# named by the company hash, so results scoped to one company or to the
+# company list only change version when they can change.
+GLOBAL_SCOPE = ""
+COMPANIES_SCOPE = "companies"
+
+# (version, modified_at as a UNIX timestamp); version 0 means never written.
+DataVersion = Tuple[int, float]
+
+CREATE_DATA_VERSIONS_V7 = [
+    '''
+    CREATE TABLE IF NOT EXISTS data_versions (
+        scope TEXT PRIMARY KEY,
+        version INTEGER NOT NULL,
+        modified_at REAL NOT NULL
+    ) WITHOUT ROWID
+    ''',
+]
+
+# One statement bumps any number of scopes and returns their new versions.
+# The WHERE clause keeps SQLite from reading ON CONFLICT as a join condition.
+_BUMP_VERSIONS = '''
+    INSERT INTO data_versions (scope, version, modified_at)
+    SELECT value, 1, ? FROM json_each(?) WHERE true
+    ON CONFLICT (scope) DO UPDATE SET
+        version = version + 1,
+        modified_at = excluded.modified_at
+    RETURNING scope, version, modified_at
+'''
+
+
+async def bump_data_versions(connection: aiosqlite.Connection, scopes: Iterable[str]) -> Dict[str, DataVersion]:
+    """
+    Increments every scope once and returns their new versions. Must run in
+    the same transaction as the write it versions, so a version is only seen
+    once the data it stands for is committed.
+    """
+    rows = await connection.execute_fetchall(_BUMP_VERSIONS, (time.time(), json.dumps(sorted(set(scopes)))))
+    return {scope: (version, modified_at) for scope, version, modified_at in rows}
@@ -0,0 +1,136 @@
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+import aiosqlite
+
+from SHEweldo.controllers.connection import ConnectionManager
+
+logger = logging.getLogger(__name__)
+
+WriteOperation = Callable[[aiosqlite.Connection], Awaitable[None]]
+
+
+class WriteBehindQueue:
+    """
+    Collects single-row writes and commits them together, so a burst of
+    submissions pays for one fsync per batch instead of one per row.
+
+    A batch is flushed when it reaches `max_batch_size` or when its oldest
+    write has waited `max_latency_ms`. Each write runs inside its own
+    SAVEPOINT, so a constraint failure only rejects that write and every
+    caller still learns whether its own record was stored.
+    """
+
+    def __init__(self, connections: ConnectionManager, max_batch_size: int = 100, max_latency_ms: float = 10.0):
+        if max_batch_size < 1:
+            raise ValueError("max_batch_size must be at least 1")
+
+        self._connections = connections
+        self._max_batch_size = max_batch_size
+        self._max_latency = max_latency_ms / 1000
+        self._queue: Optional[asyncio.Queue] = None
+        self._flusher: Optional[asyncio.Task] = None
+        self._closing = False
+
+        self._batches = 0
+        self._records = 0
+        self._failed_records = 0
+        self._largest_batch = 0
+        self._flush_seconds_total = 0.0
+
+    def start(self) -> None:
+        if self._flusher is None:
+            self._queue = asyncio.Queue()
+            self._closing = False
+            self._flusher = asyncio.create_task(self._run())
+
+    async def submit(self, operation: WriteOperation) -> bool:
+        if self._closing or self._flusher is None:
+            raise RuntimeError("Write queue is not running")
+
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((operation, future))
+        return await future
+
+    async def _run(self) -> None:
+        while True:
+            item = await self._queue.get()
+            if item is None:
+                break
+
+            batch = [item]
+            deadline = time.monotonic() + self._max_latency
+            stop = False
+            while len(batch) < self._max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self._queue.get(), remaining)
+                except asyncio.TimeoutError:
+                    break
+                if item is None:
+                    stop = True
+                    break
+                batch.append(item)
+
+            await self._flush(batch)
+            if stop:
+                break
+
+    async def _flush(self, batch: List[Tuple[WriteOperation, asyncio.Future]]) -> None:
+        started = time.perf_counter()
+        results: List[bool] = []
+
+        async def operation(connection: aiosqlite.Connection):
+            results.clear()
+            await connection.execute("BEGIN")
+            for write, _ in batch:
+                await connection.execute("SAVEPOINT write_behind_row")
+                try:
+                    await write(connection)
+                    results.append(True)
+                except aiosqlite.Error as e:
+                    logger.warning("Write-behind row rejected: %s", e)
+                    await connection.execute("ROLLBACK TO write_behind_row")
+                    results.append(False)
+                await connection.execute("RELEASE write_behind_row")
+            await connection.commit()
+
+        try:
+            await self._connections.run_write(operation)
+        except Exception as e:
+            logger.error("Write-behind batch of %d failed: %s", len(batch), e)
+            results = [False] * len(batch)
+
+        for (_, future), stored in zip(batch, results):
+            if not future.done():
+                future.set_result(stored)
+
+        self._batches += 1
+        self._records += len(batch)
+        self._failed_records += results.count(False)
+        self._largest_batch = max(self._largest_batch, len(batch))
+        self._flush_seconds_total += time.perf_counter() - started
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "max_batch_size": self._max_batch_size,
+            "max_latency_ms": self._max_latency * 1000,
+            "pending": self._queue.qsize() if self._queue else 0,
+            "batches": self._batches,
+            "records": self._records,
+            "failed_records": self._failed_records,
+            "largest_batch": self._largest_batch,
+            "flush_seconds_total": self._flush_seconds_total,
+        }
+
+    async def close(self) -> None:
+        if self._flusher is None:
+            return
+        self._closing = True
+        self._queue.put_nowait(None)
+        await self._flusher
+        self._flusher = None
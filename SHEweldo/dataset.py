@@ -0,0 +1,153 @@
+import itertools
+import math
+import random
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from SHEweldo.models.entities import SalaryRecord, Company
+from SHEweldo.models.enums import *
+from SHEweldo.controllers.database import IDatabaseController
+
+# Relative frequencies of every enum member. Real submissions are far from
+# uniform: most companies are small, a few industries and departments
+# dominate, and seniority thins out towards the top.
+_COMPANY_SIZE_WEIGHTS = {
+    CompanySize.SMALL: 50, CompanySize.MEDIUM: 30, CompanySize.LARGE: 15, CompanySize.ENTERPRISE: 5,
+}
+_INDUSTRY_WEIGHTS = {
+    Industry.TECHNOLOGY: 18, Industry.FINANCE: 12, Industry.HEALTHCARE: 10, Industry.MANUFACTURING: 9,
+    Industry.RETAIL: 9, Industry.EDUCATION: 7, Industry.TELECOMMUNICATIONS: 5, Industry.TRANSPORTATION: 5,
+    Industry.CONSTRUCTION: 4, Industry.HOSPITALITY: 4, Industry.ENERGY: 3, Industry.REAL_ESTATE: 3,
+    Industry.PHARMACEUTICALS: 3, Industry.ENTERTAINMENT: 3, Industry.AGRICULTURE: 2, Industry.OTHER: 3,
+}
+_DEPARTMENT_WEIGHTS = {
+    Department.OPERATIONS: 16, Department.TECHNOLOGY_IT: 15, Department.MARKETING_SALES: 14,
+    Department.CUSTOMER_SERVICE_SUPPORT: 12, Department.FINANCE_ACCOUNTING: 9, Department.PRODUCT_RD: 8,
+    Department.SUPPLY_CHAIN_LOGISTICS: 8, Department.HUMAN_RESOURCES: 6, Department.LEGAL_COMPLIANCE: 4,
+    Department.EXECUTIVE_LEADERSHIP: 3, Department.OTHER: 5,
+}
+_EXPERIENCE_WEIGHTS = {
+    ExperienceLevel.ENTRY_LEVEL: 22, ExperienceLevel.JUNIOR: 28, ExperienceLevel.MID_LEVEL: 25,
+    ExperienceLevel.SENIOR: 15, ExperienceLevel.EXPERT: 7, ExperienceLevel.LEGENDARY: 3,
+}
+_GENDER_WEIGHTS = {Gender.MALE: 52, Gender.FEMALE: 42, Gender.NONBINARY: 3, Gender.OTHER: 3}
+_COUNTRY_WEIGHTS = {"Philippines": 60, "Singapore": 15, "Japan": 10, "United States": 15}
+
+# Log-scale salary offsets: each level, department, industry and company
+# size shifts the median by a factor of exp(offset).
+_EXPERIENCE_OFFSETS = {
+    ExperienceLevel.ENTRY_LEVEL: -0.45, ExperienceLevel.JUNIOR: -0.2, ExperienceLevel.MID_LEVEL: 0.0,
+    ExperienceLevel.SENIOR: 0.3, ExperienceLevel.EXPERT: 0.55, ExperienceLevel.LEGENDARY: 0.8,
+}
+_DEPARTMENT_OFFSETS = {
+    Department.EXECUTIVE_LEADERSHIP: 0.6, Department.TECHNOLOGY_IT: 0.2, Department.PRODUCT_RD: 0.15,
+    Department.LEGAL_COMPLIANCE: 0.15, Department.FINANCE_ACCOUNTING: 0.1,
+}
+_INDUSTRY_OFFSETS = {
+    Industry.TECHNOLOGY: 0.15, Industry.FINANCE: 0.15, Industry.PHARMACEUTICALS: 0.1, Industry.ENERGY: 0.1,
+    Industry.HOSPITALITY: -0.15, Industry.RETAIL: -0.15, Industry.AGRICULTURE: -0.2, Industry.EDUCATION: -0.1,
+}
+_SIZE_OFFSETS = {CompanySize.SMALL: -0.1, CompanySize.LARGE: 0.05, CompanySize.ENTERPRISE: 0.15}
+_GENDER_OFFSETS = {Gender.FEMALE: -0.06, Gender.NONBINARY: -0.04, Gender.OTHER: -0.04}
+
+_MEDIAN_SALARY_LOG = 10.75
+_SALARY_SIGMA = 0.3
+# Company popularity follows Zipf's law: the k-th company gets 1/k**s of the
+# submissions of the first.
+_COMPANY_ZIPF_EXPONENT = 0.8
+
+
+def _cumulative(weights: Dict, members: Sequence) -> Tuple[list, list]:
+    # A KeyError here means an enum gained a member without a weight.
+    return list(members), list(itertools.accumulate(weights[member] for member in members))
+
+
+def generate_companies(count: int, rng: random.Random) -> List[Company]:
+    sizes = _cumulative(_COMPANY_SIZE_WEIGHTS, list(CompanySize))
+    industries = _cumulative(_INDUSTRY_WEIGHTS, list(Industry))
+    countries = _cumulative(_COUNTRY_WEIGHTS, list(_COUNTRY_WEIGHTS))
+    return [
+        Company(
+            name=f"Company {index:05d}",
+            size=rng.choices(sizes[0], cum_weights=sizes[1])[0],
+            industry=rng.choices(industries[0], cum_weights=industries[1])[0],
+            country=rng.choices(countries[0], cum_weights=countries[1])[0],
+        )
+        for index in range(count)
+    ]
+
+
+def generate_salaries(companies: List[Company], count: int, rng: random.Random) -> List[SalaryRecord]:
+    """
+    Salaries spread over companies by Zipf popularity, scaled by company size.
+    Amounts are log-normal around a median set by experience, department,
+    industry, size and a small gender gap.
+    """
+    popularity = list(itertools.accumulate(
+        (1 + 0.5 * list(CompanySize).index(company.size)) / (rank + 1) ** _COMPANY_ZIPF_EXPONENT
+        for rank, company in enumerate(companies)
+    ))
+    levels = _cumulative(_EXPERIENCE_WEIGHTS, list(ExperienceLevel))
+    departments = _cumulative(_DEPARTMENT_WEIGHTS, list(Department))
+    genders = _cumulative(_GENDER_WEIGHTS, list(Gender))
+
+    records = []
+    for company in rng.choices(companies, cum_weights=popularity, k=count):
+        experience_level = rng.choices(levels[0], cum_weights=levels[1])[0]
+        department = rng.choices(departments[0], cum_weights=departments[1])[0]
+        gender = rng.choices(genders[0], cum_weights=genders[1])[0]
+        median_log = (
+            _MEDIAN_SALARY_LOG
+            + _EXPERIENCE_OFFSETS[experience_level]
+            + _DEPARTMENT_OFFSETS.get(department, 0.0)
+            + _INDUSTRY_OFFSETS.get(company.industry, 0.0)
+            + _SIZE_OFFSETS.get(company.size, 0.0)
+            + _GENDER_OFFSETS.get(gender, 0.0)
+        )
+        amount = round(rng.lognormvariate(median_log, _SALARY_SIGMA), 2)
+        records.append(SalaryRecord(
+            company_hash=company.id,
+            experience_level=experience_level,
+            salary_amount=amount,
+            gender=gender,
+            submission_date=f"2025-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+            # People paid above the median for their profile tend to say so.
+            is_well_compensated=rng.random() < 1 / (1 + math.exp(-4 * (math.log(amount) - median_log))),
+            department=department,
+            job_title=rng.choice(["Engineer", "Analyst", "Manager", "Specialist", "Associate"]),
+            entity_id=f"{rng.getrandbits(256):064x}",
+        ))
+    return records
+
+
+def generate_dataset(companies: int, salaries: int, seed: int = 0) -> Tuple[List[Company], List[SalaryRecord]]:
+    """Same seed, same companies and salaries, including the salary ids."""
+    rng = random.Random(seed)
+    generated_companies = generate_companies(companies, rng)
+    return generated_companies, generate_salaries(generated_companies, salaries, rng)
+
+
+async def populate(controller: IDatabaseController, companies: List[Company], salaries: List[SalaryRecord],
+                   chunk_size: Optional[int] = None) -> int:
+    """
+    Inserts the dataset through the controller's normal write path. A tenth
+    of the companies are registered only after their salaries, the way
+    submissions can arrive before the company does. With `chunk_size` the
+    rows go through the bulk insert path, `chunk_size` per transaction.
+    """
+    late = len(companies) // 10
+    if chunk_size:
+        await controller.insert_companies(companies[late:])
+        rejected = 0
+        for start in range(0, len(salaries), chunk_size):
+            rejected += len(await controller.insert_salary_records(salaries[start:start + chunk_size]))
+        await controller.insert_companies(companies[:late])
+        return len(salaries) - rejected
+
+    stored = 0
+    for company in companies[late:]:
+        await controller.insert_company(company)
+    for record in salaries:
+        stored += await controller.insert_salary_record(record)
+    for company in companies[:late]:
+        await controller.insert_company(company)
+    return stored
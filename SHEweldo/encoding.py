@@ -0,0 +1,95 @@
+import json
+from abc import ABC, abstractmethod
+from itertools import chain
+from operator import itemgetter
+from typing import Any, Dict, List
+
+# Response shapes. "records" is the default list-of-objects layout; "columnar"
+# turns every list of objects into one list per key, which is smaller on the
+# wire and cheaper to encode.
+SHAPES = ("records", "columnar")
+
+
+class ResponseEncoder(ABC):
+    name: str
+
+    @abstractmethod
+    def encode(self, value: Any) -> bytes:
+        pass
+
+
+class JSONEncoder(ResponseEncoder):
+    name = "json"
+
+    def encode(self, value: Any) -> bytes:
+        return json.dumps(value, separators=(",", ":"), default=str).encode()
+
+
+class OrjsonEncoder(ResponseEncoder):
+    """Several times faster than the standard library; requires orjson."""
+
+    name = "orjson"
+
+    def __init__(self):
+        import orjson
+
+        self._dumps = orjson.dumps
+
+    def encode(self, value: Any) -> bytes:
+        return self._dumps(value, default=str)
+
+
+def make_encoder(name: str = "auto") -> ResponseEncoder:
+    """'json', 'orjson', or 'auto' for orjson when it is installed."""
+    if name == "json":
+        return JSONEncoder()
+    if name == "orjson":
+        return OrjsonEncoder()
+    if name == "auto":
+        try:
+            return OrjsonEncoder()
+        except ImportError:
+            return JSONEncoder()
+    raise ValueError(f"Unknown JSON encoder {name!r}; expected 'auto', 'json' or 'orjson'")
+
+
+_CONTAINERS = {dict, list, tuple}
+
+
+def _column(records: List[Dict[str, Any]], key: str, strict: bool) -> List[Any]:
+    if strict:
+        column = list(map(itemgetter(key), records))
+    else:
+        column = [record.get(key) for record in records]
+    if _CONTAINERS & set(map(type, column)):
+        column = [to_columnar(item) for item in column]
+    return column
+
+
+def _records_to_columns(records: List[Dict[str, Any]]) -> Dict[str, List[Any]]:
+    # Responses can hold thousands of records, so the common case of records
+    # sharing one set of keys avoids collecting the union of their keys: equal
+    # sizes plus every key of the first record means identical keys.
+    keys = list(records[0])
+    if set(map(len, records)) == {len(keys)}:
+        try:
+            return {key: _column(records, key, strict=True) for key in keys}
+        except KeyError:
+            pass
+    return {key: _column(records, key, strict=False) for key in dict.fromkeys(chain.from_iterable(records))}
+
+
+def to_columnar(value: Any) -> Any:
+    """
+    Rewrites every list of objects in `value` as an object of lists, e.g.
+    [{"range_start": 0, "count": 2}, ...] -> {"range_start": [0, ...], "count": [2, ...]}.
+    Keys missing from some objects are filled with null; empty lists stay
+    empty lists.
+    """
+    if isinstance(value, dict):
+        return {key: to_columnar(item) for key, item in value.items()}
+    if isinstance(value, list) and value and set(map(type, value)) == {dict}:
+        return _records_to_columns(value)
+    if isinstance(value, (list, tuple)):
+        return [to_columnar(item) for item in value]
+    return value
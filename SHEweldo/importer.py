@@ -0,0 +1,147 @@
+import csv
+import itertools
+import json
+import os
+from dataclasses import dataclass
+from typing import Any, Dict, Iterator, List, Optional, TextIO, Tuple
+
+from SHEweldo.services import CompanyService, SalaryService
+
+# Row numbers are 1-based lines in the input; CSV rows start after the header.
+Row = Tuple[int, Dict[str, Any]]
+
+
+class _MalformedRow(dict):
+    """Stands in for a line that could not be parsed, so it can be reported."""
+
+    def __init__(self, line: str, error: str):
+        super().__init__(raw=line)
+        self.error = error
+
+
+def _read_jsonl(stream: TextIO) -> Iterator[Row]:
+    for line_number, line in enumerate(stream, start=1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except json.JSONDecodeError as e:
+            yield line_number, _MalformedRow(line.rstrip("\n"), f"Invalid JSON: {e}")
+            continue
+        if not isinstance(row, dict):
+            yield line_number, _MalformedRow(line.rstrip("\n"), "Expected a JSON object")
+            continue
+        yield line_number, row
+
+
+def _read_csv(stream: TextIO) -> Iterator[Row]:
+    for line_number, row in enumerate(csv.DictReader(stream), start=2):
+        # Empty cells mean "not provided", the same as a missing JSON key.
+        yield line_number, {key: value for key, value in row.items() if value not in (None, "")}
+
+
+_READERS = {
+    ".csv": _read_csv,
+    ".jsonl": _read_jsonl,
+    ".ndjson": _read_jsonl,
+}
+
+
+def _parse_bool(value: Any) -> bool:
+    if isinstance(value, str):
+        return value.strip().lower() in ("1", "true", "yes", "y")
+    return bool(value)
+
+
+def _coerce_salary(row: Dict[str, Any]) -> Dict[str, Any]:
+    # CSV cells are strings; JSON already carries numbers and booleans.
+    row = dict(row)
+    if isinstance(row.get("salary_amount"), str):
+        row["salary_amount"] = float(row["salary_amount"])
+    if "is_well_compensated" in row:
+        row["is_well_compensated"] = _parse_bool(row["is_well_compensated"])
+    return row
+
+
+@dataclass
+class ImportSummary:
+    read: int = 0
+    imported: int = 0
+    rejected: int = 0
+
+
+class _RejectReport:
+    """Streams rejected rows to a CSV file as they are found."""
+
+    def __init__(self, path: Optional[str]):
+        self._file = open(path, "w", newline="", encoding="utf-8") if path else None
+        self._writer = csv.writer(self._file) if self._file else None
+        if self._writer:
+            self._writer.writerow(["line", "reason", "row"])
+
+    def add(self, line_number: int, reason: str, row: Dict[str, Any]) -> None:
+        if self._writer:
+            self._writer.writerow([line_number, reason, json.dumps(row, default=str)])
+
+    def close(self) -> None:
+        if self._file:
+            self._file.close()
+
+
+async def import_file(controller, path: str, kind: str, chunk_size: int = 5000,
+                      report_path: Optional[str] = None, file_format: Optional[str] = None) -> ImportSummary:
+    """
+    Streams `path` (CSV or JSON Lines) into the database `chunk_size` rows at
+    a time. Rows are normalized by the same code as the submit endpoints,
+    each valid chunk is written in one transaction, and every rejected row is
+    written to `report_path` with its line number and reason. Only one chunk
+    is held in memory at a time.
+    """
+    if kind == "salaries":
+        build, coerce, insert = SalaryService(controller)._build_record, _coerce_salary, controller.insert_salary_records
+    elif kind == "companies":
+        build, coerce, insert = CompanyService(controller)._build_record, dict, controller.insert_companies
+    else:
+        raise ValueError(f"Unknown import kind {kind!r}; expected 'salaries' or 'companies'")
+
+    extension = file_format or os.path.splitext(path)[1].lower()
+    reader = _READERS.get(extension if extension.startswith(".") else f".{extension}")
+    if reader is None:
+        raise ValueError(f"Unsupported file format {extension!r}; expected one of {sorted(_READERS)}")
+
+    summary = ImportSummary()
+    report = _RejectReport(report_path)
+    try:
+        with open(path, newline="", encoding="utf-8") as stream:
+            rows = reader(stream)
+            while chunk := list(itertools.islice(rows, chunk_size)):
+                summary.read += len(chunk)
+                valid: List[Tuple[int, Dict[str, Any], Any]] = []
+
+                for line_number, row in chunk:
+                    if isinstance(row, _MalformedRow):
+                        report.add(line_number, row.error, row)
+                        summary.rejected += 1
+                        continue
+                    try:
+                        entity, failure = build(coerce(row))
+                    except Exception as e:
+                        entity, failure = None, {"message": "Processing failed", "error": str(e)}
+                    if failure:
+                        reason = failure["message"] + (f": {failure['error']}" if "error" in failure else "")
+                        report.add(line_number, reason, row)
+                        summary.rejected += 1
+                        continue
+                    valid.append((line_number, row, entity))
+
+                rejected = {id(entity): reason for entity, reason in await insert([entity for _, _, entity in valid])}
+                for line_number, row, entity in valid:
+                    if id(entity) in rejected:
+                        report.add(line_number, rejected[id(entity)], row)
+                        summary.rejected += 1
+                    else:
+                        summary.imported += 1
+    finally:
+        report.close()
+
+    return summary
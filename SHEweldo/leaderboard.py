@@ -0,0 +1,146 @@
+from bisect import bisect_left, insort
+from itertools import product
+from typing import Any, Dict, List, Optional, Tuple
+
+from SHEweldo.controllers.database import FilterParams, InsertListener
+from SHEweldo.models.entities import Company, SalaryRecord
+
+# (industry, department, experience_level); None means "any".
+SegmentKey = Tuple[Optional[str], Optional[str], Optional[str]]
+
+
+class _Segment:
+    """
+    Running salary totals per company plus their ranking. The ranking is a
+    sorted list of (-average, company_hash), so the top k is its first k
+    entries and an update is one removal and one insertion by bisection.
+    """
+
+    __slots__ = ("totals", "ranking")
+
+    def __init__(self):
+        self.totals: Dict[str, List[float]] = {}
+        self.ranking: List[Tuple[float, str]] = []
+
+    def _key(self, company_hash: str) -> Tuple[float, str]:
+        count, amount = self.totals[company_hash]
+        return -amount / count, company_hash
+
+    def add(self, company_hash: str, count: int, amount: float, ranked: bool) -> None:
+        totals = self.totals.get(company_hash)
+        if totals is None:
+            totals = self.totals[company_hash] = [0, 0.0]
+        elif ranked:
+            self.unrank(company_hash)
+
+        totals[0] += count
+        totals[1] += amount
+        if ranked:
+            self.rank(company_hash)
+
+    def rank(self, company_hash: str) -> None:
+        insort(self.ranking, self._key(company_hash))
+
+    def unrank(self, company_hash: str) -> None:
+        del self.ranking[bisect_left(self.ranking, self._key(company_hash))]
+
+
+class Leaderboard(InsertListener):
+    """
+    Companies ranked by average salary for every combination of industry,
+    department and experience level, kept current from committed inserts.
+
+    Reading the top k slices a presorted list, so it costs O(k) no matter how
+    many salaries or companies exist. As in the SQL ranking only registered
+    companies are ranked; salaries submitted before their company is
+    registered are counted and join the ranking once it is.
+    """
+
+    def __init__(self, max_k: int = 100):
+        self.max_k = max_k
+        self._segments: Dict[SegmentKey, _Segment] = {}
+        self._names: Dict[str, str] = {}
+        self._industries: Dict[str, str] = {}
+        # company_hash -> (department, experience_level) -> [count, sum]
+        self._company_totals: Dict[str, Dict[Tuple[str, str], List[float]]] = {}
+
+    async def load(self, controller) -> None:
+        for company_hash, name, industry in await controller.get_company_directory():
+            self._register(company_hash, name, industry)
+        for company_hash, department, experience_level, count, amount in await controller.get_company_segment_totals():
+            self._add(company_hash, department, experience_level, count, amount)
+
+    async def reload(self, controller) -> None:
+        """
+        Rebuilds the rankings from the database, for inserts made by another
+        process. Readers keep the old rankings until the new ones are done.
+        """
+        fresh = Leaderboard(self.max_k)
+        await fresh.load(controller)
+        self._segments, self._names = fresh._segments, fresh._names
+        self._industries, self._company_totals = fresh._industries, fresh._company_totals
+
+    @staticmethod
+    def _segment_keys(industry: Optional[str], department: str, experience_level: str) -> List[SegmentKey]:
+        industries = (None, industry) if industry else (None,)
+        return list(product(industries, (None, department), (None, experience_level)))
+
+    def _add(self, company_hash: str, department: str, experience_level: str, count: int, amount: float) -> None:
+        totals = self._company_totals.setdefault(company_hash, {}).setdefault((department, experience_level), [0, 0.0])
+        totals[0] += count
+        totals[1] += amount
+
+        ranked = company_hash in self._names
+        for key in self._segment_keys(self._industries.get(company_hash), department, experience_level):
+            segment = self._segments.get(key)
+            if segment is None:
+                segment = self._segments[key] = _Segment()
+            segment.add(company_hash, count, amount, ranked)
+
+    def _register(self, company_hash: str, name: str, industry: str) -> None:
+        if company_hash in self._names:
+            return
+        self._names[company_hash] = name
+        self._industries[company_hash] = industry
+
+        # Salaries that arrived first are only in the industry-less segments.
+        keys = set()
+        for (department, experience_level), (count, amount) in self._company_totals.get(company_hash, {}).items():
+            for key in self._segment_keys(industry, department, experience_level):
+                keys.add(key)
+                if key[0] is not None:
+                    segment = self._segments.get(key)
+                    if segment is None:
+                        segment = self._segments[key] = _Segment()
+                    segment.add(company_hash, count, amount, ranked=False)
+        for key in keys:
+            self._segments[key].rank(company_hash)
+
+    def on_salary_inserted(self, record: SalaryRecord, industry: str) -> None:
+        self._add(record.company_hash, record.department.value, record.experience_level.value, 1, record.salary_amount)
+
+    def on_company_inserted(self, company: Company) -> None:
+        self._register(company.id, company.name, company.industry.value)
+
+    def top(self, filters: FilterParams, k: int = 5) -> List[Dict[str, Any]]:
+        if not 1 <= k <= self.max_k:
+            raise ValueError(f"'k' must be between 1 and {self.max_k}")
+
+        key = tuple(
+            filters[name].value if name in filters else None
+            for name in ("industry", "department", "experience_level")
+        )
+        segment = self._segments.get(key)
+        if segment is None:
+            return []
+        return [
+            {"name": self._names[company_hash], "hash": company_hash, "average_salary": -negative_average}
+            for negative_average, company_hash in segment.ranking[:k]
+        ]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "segments": len(self._segments),
+            "ranked_companies": len(self._names),
+            "max_k": self.max_k,
+        }
@@ -0,0 +1,293 @@
+import asyncio
+import math
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from SHEweldo.controllers.database import FilterParams, InsertListener
+from SHEweldo.encoding import ResponseEncoder, make_encoder
+from SHEweldo.models.entities import Company, SalaryRecord
+
+# The fields a live view can filter on, in the order of its key.
+_VIEW_FIELDS = ("company_hash", "industry", "department", "experience_level", "gender")
+
+# (company_hash, industry, department, experience_level, gender, range_step);
+# None means "any".
+ViewKey = Tuple[Optional[str], Optional[str], Optional[str], Optional[str], Optional[str], int]
+
+# Events a subscriber may fall behind by before its backlog is replaced by
+# one snapshot.
+_QUEUE_SIZE = 64
+# A load that saw inserts while it ran is retried this many times at most.
+_LOAD_ATTEMPTS = 3
+
+_KEEPALIVE = b": keepalive\n\n"
+
+
+def _event(name: str, data: bytes) -> bytes:
+    return b"event: " + name.encode() + b"\ndata: " + data + b"\n\n"
+
+
+class LiveSubscription:
+    """One client's queue of encoded Server-Sent Events."""
+
+    def __init__(self, view: "_View"):
+        self.view = view
+        self._queue: asyncio.Queue = asyncio.Queue(_QUEUE_SIZE)
+
+    def push(self, event: bytes) -> None:
+        if self._queue.full():
+            # Too slow to keep up: its pending deltas are replaced by the
+            # state they add up to.
+            self.reset(self.view.snapshot_event())
+        else:
+            self._queue.put_nowait(event)
+
+    def reset(self, event: Optional[bytes]) -> None:
+        """Drops everything queued and queues `event`; None ends the stream."""
+        while not self._queue.empty():
+            self._queue.get_nowait()
+        self._queue.put_nowait(event)
+
+    async def next(self, keepalive: float) -> Optional[bytes]:
+        """The next event, a keepalive comment after `keepalive` idle seconds, or None at the end."""
+        try:
+            return await asyncio.wait_for(self._queue.get(), keepalive)
+        except asyncio.TimeoutError:
+            return _KEEPALIVE
+
+
+class _View:
+    """
+    The salary bar and pie graph of one set of filters and range step, as
+    counts per bucket, shared by every subscriber to it.
+    """
+
+    def __init__(self, key: ViewKey, filters: FilterParams, encoder: ResponseEncoder):
+        self.key = key
+        self.wanted = key[:-1]
+        self.range_step = key[-1]
+        self.filters = filters
+        self.encoder = encoder
+        self.bars: Dict[float, int] = {}
+        # [poorly compensated, well compensated]
+        self.pie = [0, 0]
+        self.changed: Set[float] = set()
+        self.subscribers: Set[LiveSubscription] = set()
+        self.loading = False
+        # Set when a matching insert arrives while loading.
+        self.missed = False
+
+    def matches(self, values: Tuple[str, ...]) -> bool:
+        return all(value is None or value == part for value, part in zip(self.wanted, values))
+
+    def add(self, amount: float, well_compensated: bool) -> None:
+        range_start = math.floor(amount / self.range_step) * float(self.range_step)
+        self.bars[range_start] = self.bars.get(range_start, 0) + 1
+        self.pie[well_compensated] += 1
+        self.changed.add(range_start)
+
+    def _pie_graph(self) -> List[Dict[str, Any]]:
+        return [
+            {"is_well_compensated": is_well_compensated, "count": count}
+            for is_well_compensated, count in enumerate(self.pie)
+            if count
+        ]
+
+    def snapshot_event(self) -> bytes:
+        bar_graph = [
+            {"range_start": range_start, "count": self.bars[range_start]}
+            for range_start in sorted(self.bars, reverse=True)
+        ]
+        return _event("snapshot", self.encoder.encode({"bar_graph": bar_graph, "pie_graph": self._pie_graph()}))
+
+    def delta_event(self) -> bytes:
+        """The buckets changed since the last event, with their new counts."""
+        bar_graph = [
+            {"range_start": range_start, "count": self.bars[range_start]}
+            for range_start in sorted(self.changed, reverse=True)
+        ]
+        self.changed.clear()
+        return _event("delta", self.encoder.encode({"bar_graph": bar_graph, "pie_graph": self._pie_graph()}))
+
+
+class LiveHub(InsertListener):
+    """
+    Pushes salary graph updates to subscribed clients as committed inserts
+    arrive.
+
+    Clients subscribing to the same filters and range step share one view,
+    which is loaded with a single graph query and then kept current from
+    insert events alone. An insert touches each view once, however many
+    clients follow it, and the inserts of one event loop turn (a batch
+    submit, say) reach each view's clients as one delta, encoded once.
+
+    A view's first state is sent as a "snapshot" event; every later event
+    is a "delta" holding only the buckets that changed, with their new
+    counts, and the whole pie. A view is loaded again, and its clients sent
+    a new snapshot, when its counts can no longer follow from events: a
+    company registered after its salaries moves them into an industry, and
+    inserts by other workers reach this process through reload().
+    """
+
+    def __init__(self, controller, encoder: Optional[ResponseEncoder] = None, max_subscribers: int = 1000):
+        self._controller = controller
+        self._encoder = encoder or make_encoder()
+        self.max_subscribers = max_subscribers
+        self._views: Dict[ViewKey, _View] = {}
+        self._subscribers = 0
+        self._pending: Set[_View] = set()
+        self._flush_scheduled = False
+        self._loads: Set[asyncio.Task] = set()
+        self._events_sent = 0
+        self._snapshots = 0
+
+    def subscribe(self, filters: FilterParams, range_step: int) -> LiveSubscription:
+        """
+        Follows the view of `filters` and `range_step`. Its snapshot is the
+        subscription's first event, queued now if the view is loaded or once
+        its load finishes. Raises RuntimeError when the hub is full.
+        """
+        if self._subscribers >= self.max_subscribers:
+            raise RuntimeError("Too many live subscribers")
+
+        key = (
+            filters.get("company_hash"),
+            *(filters[name].value if name in filters else None for name in _VIEW_FIELDS[1:]),
+            range_step,
+        )
+        view = self._views.get(key)
+        if view is None:
+            view = self._views[key] = _View(key, dict(filters), self._encoder)
+            self._resync(view)
+
+        subscription = LiveSubscription(view)
+        view.subscribers.add(subscription)
+        self._subscribers += 1
+        if not view.loading:
+            subscription.push(view.snapshot_event())
+        return subscription
+
+    def unsubscribe(self, subscription: LiveSubscription) -> None:
+        view = subscription.view
+        if subscription not in view.subscribers:
+            return
+        view.subscribers.discard(subscription)
+        self._subscribers -= 1
+        if not view.subscribers:
+            self._views.pop(view.key, None)
+            self._pending.discard(view)
+
+    def _resync(self, view: _View) -> None:
+        if view.loading:
+            view.missed = True
+            return
+        view.loading = True
+        task = asyncio.get_running_loop().create_task(self._load(view, self._controller))
+        self._loads.add(task)
+        task.add_done_callback(self._loads.discard)
+
+    async def _load(self, view: _View, controller) -> None:
+        """
+        Loads the view and sends its subscribers the snapshot. Whether an
+        insert whose event arrives mid-query made it into the result is
+        unknown, so such a load is retried; if inserts keep arriving, the
+        last attempt is kept and may be off by those until the next load.
+        """
+        try:
+            for _ in range(_LOAD_ATTEMPTS):
+                view.missed = False
+                bar_graph, pie_graph, _ = await controller.get_graph_summary(view.filters, view.range_step)
+                if not view.missed:
+                    break
+        except Exception as e:
+            print(f"Live view load failed: {e}")
+            view.loading = False
+            for subscription in list(view.subscribers):
+                subscription.reset(None)
+                self.unsubscribe(subscription)
+            return
+
+        view.bars = {entry["range_start"]: entry["count"] for entry in bar_graph}
+        view.pie = [0, 0]
+        for entry in pie_graph:
+            view.pie[entry["is_well_compensated"]] = entry["count"]
+        view.changed.clear()
+        view.loading = False
+        self._pending.discard(view)
+
+        snapshot = view.snapshot_event()
+        for subscription in view.subscribers:
+            subscription.reset(snapshot)
+        self._snapshots += 1
+
+    async def reload(self, controller) -> None:
+        """Loads every view again, for inserts made by another process."""
+        for view in list(self._views.values()):
+            if view.loading:
+                view.missed = True
+            else:
+                view.loading = True
+                await self._load(view, controller)
+
+    def _flush(self) -> None:
+        self._flush_scheduled = False
+        pending, self._pending = self._pending, set()
+        for view in pending:
+            if view.loading or not view.changed:
+                continue
+            event = view.delta_event()
+            for subscription in view.subscribers:
+                subscription.push(event)
+            self._events_sent += len(view.subscribers)
+
+    def on_salary_inserted(self, record: SalaryRecord, industry: str) -> None:
+        if not self._views:
+            return
+
+        values = (
+            record.company_hash, industry, record.department.value, record.experience_level.value,
+            record.gender.value,
+        )
+        for view in self._views.values():
+            if not view.matches(values):
+                continue
+            if view.loading:
+                view.missed = True
+                continue
+            view.add(record.salary_amount, bool(record.is_well_compensated))
+            self._pending.add(view)
+
+        if self._pending and not self._flush_scheduled:
+            self._flush_scheduled = True
+            asyncio.get_running_loop().call_soon(self._flush)
+
+    def on_company_inserted(self, company: Company) -> None:
+        industry = company.industry.value
+        if not any(view.wanted[1] == industry for view in self._views.values()):
+            return
+        task = asyncio.get_running_loop().create_task(self._resync_registered(company.id, industry))
+        self._loads.add(task)
+        task.add_done_callback(self._loads.discard)
+
+    async def _resync_registered(self, company_hash: str, industry: str) -> None:
+        """
+        Reloads the industry's views if the company already had salaries,
+        which its registration moves into the industry. Asking the database
+        keeps no per-company state here, however many hashes are submitted.
+        """
+        try:
+            if not await self._controller.get_average_salary(company_hash):
+                return
+        except Exception as e:
+            print(f"Live company check failed: {e}")
+            return
+        for view in list(self._views.values()):
+            if view.wanted[1] == industry:
+                self._resync(view)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "views": len(self._views),
+            "subscribers": self._subscribers,
+            "events_sent": self._events_sent,
+            "snapshots": self._snapshots,
+        }
@@ -0,0 +1,543 @@
+import argparse
+import asyncio
+import dataclasses
+import json
+import math
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.append(".")
+
+from SHEweldo.benchmark import compare_to_baseline, load_results, run_benchmark, save_results
+from SHEweldo.config import Settings
+from SHEweldo.controllers.database import EXPORT_COLUMNS, DatabaseController
+from SHEweldo.controllers.sharding import ShardedDatabaseController, shard_paths
+from SHEweldo.controllers.migrations import LATEST_VERSION, filter_combinations, get_schema_version
+from SHEweldo.dataset import generate_dataset, populate
+from SHEweldo.importer import import_file
+from SHEweldo.models.entities import Company, SalaryRecord
+from SHEweldo.models.enums import Department, ExperienceLevel, Gender, Industry
+from SHEweldo.sampling import CONFIDENCE, StratifiedSampler
+
+
+async def migrate_command(args) -> int:
+    controllers, layout = _open_layout(args.db, args.shards)
+    await layout.initialize()
+    try:
+        for controller in controllers:
+            version = await controller.connections.run_read(get_schema_version)
+            print(f"{controller.connections.db_name} is at schema version {version} (latest {LATEST_VERSION})")
+    finally:
+        await layout.close()
+    return 0
+
+
+async def check_indexes_command(args) -> int:
+    _, controller = _open_layout(args.db, args.shards)
+    await controller.initialize()
+    try:
+        offenders = await controller.find_unindexed_queries()
+    finally:
+        await controller.close()
+
+    for name, filters, detail, params in offenders:
+        print(f"{name} filters={sorted(filters)}: {detail}")
+    print(f"{len(offenders)} unindexed query plan(s) found")
+    return 1 if offenders else 0
+
+
+async def rebuild_rollups_command(args) -> int:
+    _, controller = _open_layout(args.db, args.shards)
+    await controller.initialize()
+    try:
+        await controller.rebuild_rollups()
+        print("Rollup tables rebuilt from raw salary rows")
+    finally:
+        await controller.close()
+    return 0
+
+
+async def seed_command(args) -> int:
+    companies, salaries = generate_dataset(args.companies, args.salaries, args.seed)
+    _, controller = _open_layout(args.db, args.shards)
+    await controller.initialize()
+    try:
+        stored = await populate(controller, companies, salaries, chunk_size=args.chunk_size or None)
+    finally:
+        await controller.close()
+    print(f"Inserted {len(companies)} companies and {stored} salaries (seed {args.seed})")
+    return 0
+
+
+def _same_result(expected, actual) -> bool:
+    if isinstance(expected, float) or isinstance(actual, float):
+        return math.isclose(expected, actual, rel_tol=1e-9, abs_tol=1e-6)
+    if isinstance(expected, (list, tuple)):
+        return len(expected) == len(actual) and all(map(_same_result, expected, actual))
+    if isinstance(expected, dict):
+        return expected.keys() == actual.keys() and all(_same_result(expected[key], actual[key]) for key in expected)
+    return expected == actual
+
+
+def _open_layout(db: str, shards: int):
+    controllers = [DatabaseController(path) for path in shard_paths(db, shards)]
+    return controllers, ShardedDatabaseController(controllers) if shards > 1 else controllers[0]
+
+
+def _analytics_backend(name: str, db: str, shards: int):
+    if name == "sharded":
+        return _open_layout(db, shards)[1]
+    if name == "duckdb":
+        from SHEweldo.controllers.duckdb_backend import DuckDBDatabaseController
+
+        return DuckDBDatabaseController(DatabaseController(db))
+    from SHEweldo.controllers.columnar import ColumnarDatabaseController
+
+    return ColumnarDatabaseController(DatabaseController(db))
+
+
+def _comparison_calls(filters: dict, companies: list) -> list:
+    """(controller method, arguments) of every analytics read, for one set of filters."""
+    calls = [
+        ("get_pie_graph_data", (filters,)),
+        ("get_salary_percentiles", (filters, [0, 25, 50, 75, 90, 99, 100])),
+        ("get_pay_gap_cells", (filters,)),
+    ]
+    for range_step in (1000, 2500, 1234):
+        calls += [
+            ("get_bar_graph_data", (filters, range_step)),
+            ("get_benchmark_data", (filters, range_step)),
+            ("get_graph_summary", (filters, range_step)),
+            ("get_top_companies", (filters, range_step)),
+        ]
+    for company_hash in companies:
+        calls += [
+            ("get_pie_graph_data", (filters, company_hash)),
+            ("get_graph_summary", (filters, 1000, company_hash)),
+            ("get_average_salary", (company_hash,)),
+        ]
+    return calls
+
+
+async def compare_backends_command(args) -> int:
+    sqlite = DatabaseController(args.db)
+    other = _analytics_backend(args.backend, args.db, args.shards)
+    await sqlite.initialize()
+    await other.initialize()
+    # call name -> [SQLite seconds, other backend seconds]
+    timings = {}
+    try:
+        companies = [hash_val for _, hash_val in await sqlite.get_all_companies()][:3]
+        checks = 0
+        mismatches = 0
+        for filters in filter_combinations():
+            if "company_hash" in filters:
+                if not companies:
+                    continue
+                filters["company_hash"] = companies[0]
+            for name, call_args in _comparison_calls(filters, companies):
+                started = time.perf_counter()
+                expected = await getattr(sqlite, name)(*call_args)
+                between = time.perf_counter()
+                actual = await getattr(other, name)(*call_args)
+                timing = timings.setdefault(name, [0.0, 0.0])
+                timing[0] += between - started
+                timing[1] += time.perf_counter() - between
+                checks += 1
+                if not _same_result(expected, actual):
+                    mismatches += 1
+                    print(f"{name} filters={sorted(filters)} args={call_args[1:]}: {expected!r} != {actual!r}")
+    finally:
+        await other.close()
+        await sqlite.close()
+
+    print(f"{'call':<24} {'sqlite ms':>10} {args.backend + ' ms':>12} {'ratio':>7}")
+    for name, (sqlite_seconds, other_seconds) in sorted(timings.items()):
+        print(
+            f"{name:<24} {sqlite_seconds * 1000:10.1f} {other_seconds * 1000:12.1f} "
+            f"{other_seconds / sqlite_seconds if sqlite_seconds else 0.0:7.2f}"
+        )
+    print(f"{checks} results compared, {mismatches} mismatch(es)")
+    return 1 if mismatches else 0
+
+
+async def import_command(args) -> int:
+    _, controller = _open_layout(args.db, args.shards)
+    await controller.initialize()
+    try:
+        summary = await import_file(
+            controller, args.file, args.kind,
+            chunk_size=args.chunk_size, report_path=args.report, file_format=args.format,
+        )
+    finally:
+        await controller.close()
+
+    print(f"Read {summary.read} rows: {summary.imported} imported, {summary.rejected} rejected")
+    if summary.rejected and args.report:
+        print(f"Rejected rows written to {args.report}")
+    return 1 if summary.rejected else 0
+
+
+async def reshard_command(args) -> int:
+    """
+    Copies a layout of --from shards into a new layout of --to shards. The
+    source files are left as they are, so the copy can be checked before
+    SHEWELDO_SHARDS is switched over and the old files are removed.
+    """
+    missing = [path for path in shard_paths(args.db, args.from_shards) if not os.path.exists(path)]
+    if missing:
+        print(f"Missing source shard(s): {', '.join(missing)}")
+        return 1
+    targets = shard_paths(args.db, args.to_shards)
+    existing = [path for path in targets if os.path.exists(path)]
+    if existing:
+        print(f"Refusing to overwrite {', '.join(existing)}")
+        return 1
+
+    sources, source = _open_layout(args.db, args.from_shards)
+    target_shards, target = _open_layout(args.db, args.to_shards)
+    await source.initialize()
+    await target.initialize()
+    try:
+        company_rows = await sources[0]._fetchall("SELECT * FROM companies ORDER BY id")
+        rejected = 0
+        for start in range(0, len(company_rows), args.chunk_size):
+            chunk = company_rows[start:start + args.chunk_size]
+            rejected += len(await target.insert_companies([Company.from_row(row) for row in chunk]))
+
+        copied = 0
+        for shard in sources:
+            after = 0
+            while True:
+                rows = await shard._fetchall(
+                    "SELECT rowid, * FROM salaries WHERE rowid > ? ORDER BY rowid LIMIT ?", (after, args.chunk_size)
+                )
+                if not rows:
+                    break
+                after = rows[-1][0]
+                records = [SalaryRecord.from_row(row[1:]) for row in rows]
+                rejected += len(await target.insert_salary_records(records))
+                copied += len(records)
+            print(f"Copied salaries of {shard.connections.db_name}")
+
+        # Every version of the new layout starts above anything the old one
+        # could have served, so no client's ETag is mistaken for current.
+        offset = source.get_data_version()[0]
+
+        async def raise_versions(connection):
+            await connection.execute("UPDATE data_versions SET version = version + ?", (offset,))
+            await connection.commit()
+
+        for shard in target_shards:
+            await shard.connections.run_write(raise_versions)
+    finally:
+        await source.close()
+        await target.close()
+
+    print(
+        f"Copied {len(company_rows)} companies and {copied} salaries into {len(targets)} shard(s): "
+        f"{', '.join(targets)}; {rejected} row(s) rejected"
+    )
+    return 1 if rejected else 0
+
+
+def _interval_errors(exact: list, estimated: list, label: str) -> tuple[float, int, int]:
+    """
+    (summed absolute count error, labels inside their interval, labels) for
+    one estimated graph against the exact one. A label missing from either
+    side counts as zero there.
+    """
+    exact_counts = {item[label]: item["count"] for item in exact}
+    bounds = {item[label]: item for item in estimated}
+    error = covered = 0
+    for key in exact_counts.keys() | bounds.keys():
+        count = exact_counts.get(key, 0)
+        estimate = bounds.get(key, {"count": 0, "low": 0, "high": 0})
+        error += abs(estimate["count"] - count)
+        covered += estimate["low"] <= count <= estimate["high"]
+    return error, covered, len(exact_counts.keys() | bounds.keys())
+
+
+async def check_approx_command(args) -> int:
+    controller = DatabaseController(args.db)
+    await controller.initialize()
+    sampler = StratifiedSampler(args.sample_size, args.company_sample_size, seed=args.seed)
+    # graph -> [calls, summed relative error, worst relative error, covered, labels, exact s, approximate s]
+    results = {graph: [0, 0.0, 0.0, 0, 0, 0.0, 0.0] for graph in ("bar_graph", "pie_graph", "benchmark")}
+    try:
+        started = time.perf_counter()
+        await sampler.load(controller)
+        stats = sampler.stats()
+        print(
+            f"Sampled {stats['sampled_salaries']} salaries in {stats['salary_strata']} strata and "
+            f"{stats['sampled_companies']} companies in {time.perf_counter() - started:.2f}s"
+        )
+
+        # No filter and every single filter: the broad queries the samples are for.
+        filter_sets = [{}] + [
+            {name: member}
+            for name, enum_cls in (
+                ("industry", Industry), ("department", Department),
+                ("experience_level", ExperienceLevel), ("gender", Gender),
+            )
+            for member in enum_cls
+        ]
+        for filters in filter_sets:
+            for range_step in args.range_steps:
+                started = time.perf_counter()
+                exact_bar, exact_pie, _ = await controller.get_graph_summary(filters, range_step)
+                between = time.perf_counter()
+                bar, pie, _ = sampler.estimate_salaries(filters, range_step)
+                salary_times = (between - started, time.perf_counter() - between)
+
+                started = time.perf_counter()
+                exact_benchmark = await controller.get_benchmark_data(filters, range_step)
+                between = time.perf_counter()
+                benchmark, _ = sampler.estimate_benchmark(filters, range_step)
+                benchmark_times = (between - started, time.perf_counter() - between)
+
+                for graph, exact, estimated, label, (exact_seconds, approx_seconds) in (
+                    ("bar_graph", exact_bar, bar, "range_start", salary_times),
+                    ("pie_graph", exact_pie, pie, "is_well_compensated", salary_times),
+                    ("benchmark", exact_benchmark, benchmark, "range_start", benchmark_times),
+                ):
+                    total = sum(item["count"] for item in exact)
+                    if not total:
+                        continue
+                    error, covered, labels = _interval_errors(exact, estimated, label)
+                    result = results[graph]
+                    result[0] += 1
+                    result[1] += error / total
+                    result[2] = max(result[2], error / total)
+                    result[3] += covered
+                    result[4] += labels
+                    result[5] += exact_seconds
+                    result[6] += approx_seconds
+    finally:
+        await controller.close()
+
+    # Relative error is the summed count error over the true total, so a
+    # histogram that is off by 5% of its salaries in all has error 0.05.
+    print(f"{'graph':<10} {'calls':>6} {'mean error':>11} {'max error':>10} {'coverage':>9} {'exact ms':>9} {'approx ms':>10}")
+    lowest_coverage = 1.0
+    for graph, (calls, error, worst, covered, labels, exact_seconds, approx_seconds) in results.items():
+        if not calls:
+            continue
+        coverage = covered / labels if labels else 1.0
+        lowest_coverage = min(lowest_coverage, coverage)
+        print(
+            f"{graph:<10} {calls:>6} {error / calls:>11.2%} {worst:>10.2%} {coverage:>9.1%} "
+            f"{exact_seconds * 1000 / calls:>9.2f} {approx_seconds * 1000 / calls:>10.2f}"
+        )
+    print(f"Lowest interval coverage {lowest_coverage:.1%} for a nominal {CONFIDENCE:.0%}")
+    return 1 if lowest_coverage < args.min_coverage else 0
+
+
+async def _measure(operation):
+    """
+    Returns (seconds, peak bytes allocated) for awaiting `operation()`. Tracing
+    allocations slows Python down severalfold, so time and memory are taken
+    from separate runs.
+    """
+    started = time.perf_counter()
+    await operation()
+    seconds = time.perf_counter() - started
+
+    tracemalloc.start()
+    try:
+        await operation()
+        return seconds, tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+async def bench_rows_command(args) -> int:
+    controller = DatabaseController(args.db)
+    await controller.initialize()
+    try:
+        rows = await controller._fetchall("SELECT * FROM salaries LIMIT ?", (args.rows,))
+        if not rows:
+            print("No salaries to benchmark; run `seed` first")
+            return 1
+
+        async def entities():
+            return [SalaryRecord.from_row(row) for row in rows]
+
+        async def tuples():
+            return [tuple(row) for row in rows]
+
+        columns = ("cursor",) + EXPORT_COLUMNS
+
+        async def ndjson_from_dicts():
+            chunks = []
+            async for chunk in controller.iter_filtered_records({}, chunk_size=args.rows):
+                chunks.append("".join(
+                    json.dumps(dict(zip(columns, row[:6] + (bool(row[6]),) + row[7:]))) + "\n" for row in chunk
+                ))
+                break
+            return chunks
+
+        async def ndjson_from_sqlite():
+            chunks = []
+            async for chunk in controller.iter_filtered_records({}, chunk_size=args.rows, as_json=True):
+                chunks.append("".join(line + "\n" for _, line in chunk))
+                break
+            return chunks
+
+        print(f"{len(rows)} rows")
+        for name, operation in (
+            ("SalaryRecord.from_row", entities),
+            ("row tuples", tuples),
+            ("export rows -> dicts -> json.dumps", ndjson_from_dicts),
+            ("export rows rendered by SQLite", ndjson_from_sqlite),
+        ):
+            seconds, peak = await _measure(operation)
+            print(f"{name:<36} {seconds / len(rows) * 1e6:8.2f} us/row {peak / len(rows):8.0f} B/row peak")
+    finally:
+        await controller.close()
+    return 0
+
+
+async def bench_command(args) -> int:
+    settings = Settings.from_env()
+    with tempfile.TemporaryDirectory() as directory:
+        settings = dataclasses.replace(
+            settings,
+            db_name=os.path.join(directory, "bench.db"),
+            backend=args.backend or settings.backend,
+            cache_enabled=settings.cache_enabled and not args.no_cache,
+        )
+        results = await run_benchmark(
+            settings, args.companies, args.salaries, args.seed,
+            requests=args.requests, concurrency=args.concurrency, warmup=args.warmup, only=args.only,
+        )
+
+    save_results(results, args.output)
+    print(f"Results written to {args.output}")
+    if not args.baseline:
+        return 0
+
+    lines, regressions = compare_to_baseline(results, load_results(args.baseline), args.tolerance)
+    print(f"Compared with {args.baseline}:")
+    for line in lines:
+        print(line)
+    print(f"{len(regressions)} endpoint(s) regressed by more than {args.tolerance:.0%}")
+    return 1 if regressions else 0
+
+
+_DB_ARGUMENT = (("--db",), {"default": "record.db", "help": "Path to the SQLite database"})
+
+# Commands that write or inspect the database go through every shard of the
+# layout the server runs on.
+_SHARDS_ARGUMENT = (("--shards",), {
+    "type": int, "default": Settings.from_env().shards, "help": "Shard count of the layout, SHEWELDO_SHARDS by default",
+})
+
+_SEED_ARGUMENTS = (
+    (("--companies",), {"type": int, "default": 50, "help": "Number of companies to generate"}),
+    (("--salaries",), {"type": int, "default": 5000, "help": "Number of salaries to generate"}),
+    (("--seed",), {"type": int, "default": 0, "help": "Random seed; the same seed yields the same dataset"}),
+    (("--chunk-size",), {
+        "type": int, "default": 5000, "help": "Rows written per transaction; 0 writes and commits one row at a time",
+    }),
+    _SHARDS_ARGUMENT,
+)
+
+_IMPORT_ARGUMENTS = (
+    (("kind",), {"choices": ["companies", "salaries"], "help": "What the file contains"}),
+    (("file",), {"help": "CSV or JSON Lines file; columns match the submit endpoints' JSON fields"}),
+    (("--format",), {"choices": ["csv", "jsonl"], "help": "Override the format implied by the file extension"}),
+    (("--chunk-size",), {"type": int, "default": 5000, "help": "Rows validated and written per transaction"}),
+    (("--report",), {"default": "rejected.csv", "help": "Where to write rejected rows with their reasons"}),
+    _SHARDS_ARGUMENT,
+)
+
+_COMPARE_ARGUMENTS = (
+    (("--backend",), {"choices": ["columnar", "duckdb", "sharded"], "default": "columnar", "help": "Backend to check against SQLite"}),
+    (("--shards",), {"type": int, "default": 2, "help": "Shard count of the sharded layout, made with reshard"}),
+)
+
+_RESHARD_ARGUMENTS = (
+    (("--from",), {"dest": "from_shards", "type": int, "required": True, "help": "Shard count of the existing layout"}),
+    (("--to",), {"dest": "to_shards", "type": int, "required": True, "help": "Shard count of the new layout"}),
+    (("--chunk-size",), {"type": int, "default": 5000, "help": "Rows read and written per transaction"}),
+)
+
+_CHECK_APPROX_ARGUMENTS = (
+    (("--sample-size",), {"type": int, "default": Settings.approx_sample_size, "help": "Salaries sampled per stratum"}),
+    (("--company-sample-size",), {
+        "type": int, "default": Settings.approx_company_sample_size, "help": "Companies sampled per industry",
+    }),
+    (("--range-steps",), {"type": int, "nargs": "+", "default": [1000, 5000], "help": "Histogram bucket widths"}),
+    (("--seed",), {"type": int, "default": 0, "help": "Random seed of the samples"}),
+    (("--min-coverage",), {"type": float, "default": 0.9, "help": "Fail below this share of counts inside their interval"}),
+)
+
+_BENCH_ROWS_ARGUMENTS = (
+    (("--rows",), {"type": int, "default": 50000, "help": "Number of salary rows to read"}),
+)
+
+_BENCH_ARGUMENTS = (
+    (("--companies",), {"type": int, "default": 200, "help": "Number of companies to generate"}),
+    (("--salaries",), {"type": int, "default": 20000, "help": "Number of salaries to generate"}),
+    (("--seed",), {"type": int, "default": 0, "help": "Random seed for the dataset and the requests"}),
+    (("--requests",), {"type": int, "default": 200, "help": "Measured requests per endpoint"}),
+    (("--concurrency",), {"type": int, "default": 8, "help": "Requests in flight at once"}),
+    (("--warmup",), {"type": int, "default": 20, "help": "Unmeasured requests per endpoint before measuring"}),
+    (("--backend",), {"choices": ["sqlite", "columnar", "duckdb"], "help": "Override SHEWELDO_BACKEND"}),
+    (("--no-cache",), {"action": "store_true", "help": "Disable the result and response caches"}),
+    (("--only",), {"nargs": "+", "help": "Only endpoints whose name contains one of these strings"}),
+    (("--output",), {"default": "bench.json", "help": "Where to write the results as JSON"}),
+    (("--baseline",), {"help": "Results JSON of an earlier run to compare against"}),
+    (("--tolerance",), {"type": float, "default": 0.1, "help": "Allowed relative slowdown before failing"}),
+)
+
+COMMANDS = {
+    "migrate": (migrate_command, "Upgrade the database schema in place", (_SHARDS_ARGUMENT,)),
+    "check-indexes": (
+        check_indexes_command, "Fail if any generated query scans a table without an index", (_SHARDS_ARGUMENT,)
+    ),
+    "rebuild-rollups": (
+        rebuild_rollups_command, "Regenerate the aggregate rollup tables from the raw rows", (_SHARDS_ARGUMENT,)
+    ),
+    "seed": (seed_command, "Fill the database with a deterministic synthetic dataset", _SEED_ARGUMENTS),
+    "compare-backends": (
+        compare_backends_command, "Fail if an analytics backend disagrees with SQLite, and time both", _COMPARE_ARGUMENTS
+    ),
+    "import": (
+        import_command,
+        "Stream a CSV or JSON Lines file of companies or salaries into the database. A running server picks "
+        "the rows up within SHEWELDO_WORKER_SYNC_MS; one on the columnar backend only once restarted",
+        _IMPORT_ARGUMENTS,
+    ),
+    "reshard": (reshard_command, "Copy the database into a layout with a different number of shards", _RESHARD_ARGUMENTS),
+    "check-approx": (
+        check_approx_command, "Measure approximate graphs against exact ones, and time both", _CHECK_APPROX_ARGUMENTS
+    ),
+    "bench-rows": (bench_rows_command, "Measure per-row time and memory of the salary read paths", _BENCH_ROWS_ARGUMENTS),
+    # Runs on a fresh temporary database; --db is not used.
+    "bench": (bench_command, "Benchmark every route on a generated dataset and compare with a baseline", _BENCH_ARGUMENTS),
+}
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="python -m SHEweldo.manage")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    for name, (_, help_text, arguments) in COMMANDS.items():
+        subparser = subparsers.add_parser(name, help=help_text)
+        for flags, options in (_DB_ARGUMENT,) + arguments:
+            subparser.add_argument(*flags, **options)
+    return parser
+
+
+def main(argv=None) -> int:
+    args = build_parser().parse_args(argv)
+    handler, _, _ = COMMANDS[args.command]
+    return asyncio.run(handler(args))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
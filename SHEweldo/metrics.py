@@ -0,0 +1,265 @@
+import asyncio
+import inspect
+import json
+import os
+import time
+from bisect import bisect_left
+from functools import wraps
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+# Upper bounds in seconds, from half a millisecond to ten seconds.
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+LOOP_LAG_INTERVAL = 0.5
+# How often a worker sharing its metrics writes its snapshot, in loop lag
+# intervals; other workers' series lag a scrape by at most this much.
+SNAPSHOT_EVERY = 10
+
+
+def _format_labels(names: Sequence[str], values: Sequence[Any], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    return repr(value) if isinstance(value, float) else str(int(value))
+
+
+class Counter:
+    def __init__(self, name: str, help: str, label_names: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(label_names)
+        self._values: Dict[Tuple, float] = {}
+
+    def inc(self, *labels, amount: float = 1) -> None:
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def snapshot(self) -> list:
+        return [[list(labels), value] for labels, value in self._values.items()]
+
+    def merge(self, snapshot: list) -> None:
+        for labels, value in snapshot:
+            self.inc(*labels, amount=value)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for labels, value in sorted(self._values.items()):
+            lines.append(f"{self.name}{_format_labels(self.label_names, labels)} {_format_value(value)}")
+        return lines
+
+
+class Histogram:
+    """
+    Fixed-bucket histogram with one series per label combination. An
+    observation is a dictionary lookup and a bisection, so it is cheap enough
+    to record on every request and query.
+    """
+
+    def __init__(self, name: str, help: str, label_names: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(sorted(buckets))
+        # labels -> [per-bucket counts with +Inf last, sum]
+        self._series: Dict[Tuple, list] = {}
+
+    def observe(self, value: float, *labels) -> None:
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1] += value
+
+    def count(self, *labels) -> int:
+        series = self._series.get(labels)
+        return sum(series[0]) if series else 0
+
+    def snapshot(self) -> list:
+        return [[list(labels), counts, total] for labels, (counts, total) in self._series.items()]
+
+    def merge(self, snapshot: list) -> None:
+        for labels, counts, total in snapshot:
+            series = self._series.setdefault(tuple(labels), [[0] * (len(self.buckets) + 1), 0.0])
+            series[0] = [mine + theirs for mine, theirs in zip(series[0], counts)]
+            series[1] += total
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        bounds = [_format_value(bound) for bound in self.buckets] + ["+Inf"]
+        for labels, (counts, total) in sorted(self._series.items()):
+            cumulative = 0
+            for bound, count in zip(bounds, counts):
+                cumulative += count
+                label_text = _format_labels(self.label_names, labels, f'le="{bound}"')
+                lines.append(f"{self.name}_bucket{label_text} {cumulative}")
+            label_text = _format_labels(self.label_names, labels)
+            lines.append(f"{self.name}_sum{label_text} {_format_value(total)}")
+            lines.append(f"{self.name}_count{label_text} {cumulative}")
+        return lines
+
+
+class Metrics:
+    """
+    Process-wide metrics rendered in the Prometheus text format: latency
+    histograms for routes, database controller calls and connection waits,
+    event-loop lag, and gauges read from the components' stats() at scrape
+    time.
+
+    Every Hypercorn worker keeps its own, and a scrape reaches whichever
+    worker accepts it. With `snapshot_dir` each worker writes its counters,
+    histograms and gauges there as <pid>.json, and a scrape adds up every
+    worker's counters and histograms and labels each worker's gauges with
+    worker="<pid>". A stopped worker's counts stay in the sum, so the
+    totals never go down; its gauges are dropped.
+    """
+
+    def __init__(self, snapshot_dir: Optional[str] = None):
+        self.request_latency = Histogram(
+            "sheweldo_http_request_duration_seconds", "Time spent answering HTTP requests.",
+            ("method", "route", "status"),
+        )
+        self.db_latency = Histogram(
+            "sheweldo_db_call_duration_seconds", "Time spent in database controller calls.", ("call",),
+        )
+        self.db_errors = Counter(
+            "sheweldo_db_call_errors_total", "Database controller calls that raised.", ("call",),
+        )
+        self.connection_wait = Histogram(
+            "sheweldo_db_connection_wait_seconds", "Time spent waiting for a pooled SQLite connection.", ("mode",),
+        )
+        self.loop_lag = Histogram(
+            "sheweldo_event_loop_lag_seconds",
+            f"How late a {LOOP_LAG_INTERVAL}s sleep on the event loop wakes up.",
+        )
+        self._stats: List[Tuple[str, Callable[[], Dict[str, Any]]]] = []
+        self._loop_monitor: Optional[asyncio.Task] = None
+        self._snapshot_dir = snapshot_dir
+
+    def _metrics(self) -> tuple:
+        return self.request_latency, self.db_latency, self.db_errors, self.connection_wait, self.loop_lag
+
+    def add_stats(self, prefix: str, stats: Callable[[], Dict[str, Any]]) -> None:
+        """Exports every numeric value of `stats()` as gauge sheweldo_<prefix>_<key>."""
+        self._stats.append((prefix, stats))
+
+    def instrument_controller(self, controller) -> None:
+        """
+        Times every public coroutine method of `controller` by wrapping it on
+        the instance, so any IDatabaseController can be instrumented.
+        """
+        for name in dir(type(controller)):
+            if name.startswith("_"):
+                continue
+            method = getattr(controller, name)
+            if inspect.iscoroutinefunction(method):
+                setattr(controller, name, self._timed(method, name))
+
+    def _timed(self, method, name: str):
+        latency, errors = self.db_latency, self.db_errors
+
+        @wraps(method)
+        async def timed(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return await method(*args, **kwargs)
+            except Exception:
+                errors.inc(name)
+                raise
+            finally:
+                latency.observe(time.perf_counter() - started, name)
+        return timed
+
+    def observe_connection_wait(self, mode: str, seconds: float) -> None:
+        self.connection_wait.observe(seconds, mode)
+
+    def start_loop_monitor(self) -> None:
+        if self._loop_monitor is None:
+            self._loop_monitor = asyncio.get_running_loop().create_task(self._monitor_loop())
+
+    async def stop_loop_monitor(self) -> None:
+        if self._loop_monitor is not None:
+            self._loop_monitor.cancel()
+            try:
+                await self._loop_monitor
+            except asyncio.CancelledError:
+                pass
+            self._loop_monitor = None
+        if self._snapshot_dir:
+            # The counts outlive the worker; its gauges would go stale.
+            self.write_snapshot(gauges=False)
+
+    async def _monitor_loop(self) -> None:
+        wakeups = 0
+        while True:
+            started = time.perf_counter()
+            await asyncio.sleep(LOOP_LAG_INTERVAL)
+            self.loop_lag.observe(max(0.0, time.perf_counter() - started - LOOP_LAG_INTERVAL))
+            wakeups += 1
+            if self._snapshot_dir and wakeups % SNAPSHOT_EVERY == 0:
+                self.write_snapshot()
+
+    def _gauges(self) -> Dict[str, float]:
+        gauges = {}
+        for prefix, stats in self._stats:
+            try:
+                values = stats()
+            except Exception as e:
+                print(f"Metrics stats for {prefix} failed: {e}")
+                continue
+            for key, value in values.items():
+                if isinstance(value, (int, float)):
+                    gauges[f"sheweldo_{prefix}_{key}"] = value
+        return gauges
+
+    def write_snapshot(self, gauges: bool = True) -> None:
+        snapshot = {
+            "metrics": {metric.name: metric.snapshot() for metric in self._metrics()},
+            "gauges": self._gauges() if gauges else {},
+        }
+        path = os.path.join(self._snapshot_dir, f"{os.getpid()}.json")
+        # Written aside and renamed, so a scrape never reads half a file.
+        with open(path + ".tmp", "w") as file:
+            json.dump(snapshot, file)
+        os.replace(path + ".tmp", path)
+
+    def _read_snapshots(self) -> List[Tuple[str, dict]]:
+        snapshots = []
+        for file_name in sorted(os.listdir(self._snapshot_dir)):
+            if not file_name.endswith(".json"):
+                continue
+            try:
+                with open(os.path.join(self._snapshot_dir, file_name)) as file:
+                    snapshots.append((file_name[:-len(".json")], json.load(file)))
+            except (OSError, ValueError) as e:
+                print(f"Skipping metrics snapshot {file_name}: {e}")
+        return snapshots
+
+    def render(self) -> str:
+        if not self._snapshot_dir:
+            metrics = self._metrics()
+            gauges = {name: [("", value)] for name, value in self._gauges().items()}
+        else:
+            self.write_snapshot()
+            metrics = Metrics()._metrics()
+            gauges = {}
+            for worker, snapshot in self._read_snapshots():
+                for metric in metrics:
+                    metric.merge(snapshot["metrics"].get(metric.name, []))
+                for name, value in snapshot["gauges"].items():
+                    gauges.setdefault(name, []).append((_format_labels(("worker",), (worker,)), value))
+
+        lines = []
+        for metric in metrics:
+            lines += metric.render()
+        for name, values in gauges.items():
+            lines.append(f"# TYPE {name} gauge")
+            lines += [f"{name}{labels} {_format_value(value)}" for labels, value in values]
+        return "\n".join(lines) + "\n"
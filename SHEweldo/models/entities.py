@@ -3,28 +3,62 @@ from abc import ABC, abstractmethod
 from typing import Optional
 from SHEweldo.models.enums import *
 
+# Stored value -> member; a dict lookup is several times cheaper than calling
+# the enum class, which matters when building entities from many rows.
+_COMPANY_SIZES = {member.value: member for member in CompanySize}
+_INDUSTRIES = {member.value: member for member in Industry}
+_EXPERIENCE_LEVELS = {member.value: member for member in ExperienceLevel}
+_GENDERS = {member.value: member for member in Gender}
+_DEPARTMENTS = {member.value: member for member in Department}
+
 class BaseEntity(ABC):
-    def __init__(self, entity_id: str):
+    # Slotted, so an entity has no per-instance __dict__. The id is a SHA-256
+    # hash computed on first use: entities read back from the database
+    # already carry theirs, and many are never asked for it at all.
+    __slots__ = ("_entity_id",)
+
+    def __init__(self, entity_id: Optional[str] = None):
         self._entity_id = entity_id
 
     @property
     def entity_id(self) -> str:
+        if self._entity_id is None:
+            self._entity_id = self._generate_hash()
         return self._entity_id
-    
+
+    @property
+    def id(self) -> str:
+        return self.entity_id
+
+    @abstractmethod
+    def _generate_hash(self) -> str:
+        pass
+
     @abstractmethod
     def validate(self) -> bool:
         pass
 
 class Company(BaseEntity):
-    def __init__(self, name: str, size: CompanySize, industry: Industry, country: str):
+    __slots__ = ("_name", "_size", "_industry", "_country")
+
+    def __init__(self, name: str, size: CompanySize, industry: Industry, country: str,
+                 entity_id: Optional[str] = None):
         self._name = name.strip()
         self._size = size
         self._industry = industry
         self._country = country.strip()
-
-        entity_id = self._generate_hash()
         super().__init__(entity_id)
 
+    @classmethod
+    def from_row(cls, row: tuple) -> "Company":
+        """Builds a company from a `SELECT * FROM companies` row."""
+        # Stored rows are already normalised, so __init__ is skipped.
+        company = cls.__new__(cls)
+        (_, company._entity_id, company._name, size, industry, company._country) = row
+        company._size = _COMPANY_SIZES[size]
+        company._industry = _INDUSTRIES[industry]
+        return company
+
     def validate(self) -> bool:
         return all([
             isinstance(self._size, CompanySize),
@@ -32,10 +66,6 @@ class Company(BaseEntity):
             isinstance(self._industry, Industry),
             len(self._country) > 0
         ])
-    
-    @property
-    def id(self):
-        return self._entity_id
 
     @property
     def name(self):
@@ -58,8 +88,13 @@ class Company(BaseEntity):
         return hashlib.sha256(hash_input).hexdigest()
 
 class SalaryRecord(BaseEntity):
+    __slots__ = (
+        "_company_hash", "_experience_level", "_salary_amount", "_gender",
+        "_submission_date", "_is_well_compensated", "_department", "_job_title",
+    )
+
     def __init__(self, company_hash: str, experience_level: ExperienceLevel, salary_amount: float, gender: Gender,
-                 submission_date: str, is_well_compensated: bool, 
+                 submission_date: str, is_well_compensated: bool,
                  department: Department, job_title: str, entity_id: Optional[str] = None):
         self._company_hash = company_hash
         self._experience_level = experience_level
@@ -69,10 +104,20 @@ class SalaryRecord(BaseEntity):
         self._is_well_compensated = is_well_compensated
         self._department = department
         self._job_title = job_title.strip()
-
-        entity_id = entity_id if entity_id is not None else self._generate_hash()
         super().__init__(entity_id)
 
+    @classmethod
+    def from_row(cls, row: tuple) -> "SalaryRecord":
+        """Builds a salary from a `SELECT * FROM salaries` row."""
+        record = cls.__new__(cls)
+        (record._entity_id, record._company_hash, experience_level, record._salary_amount, gender,
+         record._submission_date, is_well_compensated, department, record._job_title) = row
+        record._experience_level = _EXPERIENCE_LEVELS[experience_level]
+        record._gender = _GENDERS[gender]
+        record._is_well_compensated = bool(is_well_compensated)
+        record._department = _DEPARTMENTS[department]
+        return record
+
     def validate(self) -> bool:
         return all([
             len(self._company_hash) > 0,
@@ -83,10 +128,6 @@ class SalaryRecord(BaseEntity):
             len(self._job_title) > 0
         ])
 
-    @property
-    def id(self):
-        return self._entity_id
-    
     @property
     def company_hash(self):
         return self._company_hash
@@ -0,0 +1,305 @@
+import asyncio
+import math
+import random
+from collections import Counter
+from typing import Any, Dict, Hashable, Iterable, List, Optional, Tuple
+
+from SHEweldo.controllers.database import FilterParams, InsertListener
+from SHEweldo.models.entities import Company, SalaryRecord
+
+# Salaries are stratified by every enum a graph can filter on, so any filter
+# selects whole strata. Industry is "" until the company is registered.
+_SALARY_STRATUM = ("industry", "department", "experience_level", "gender")
+# A company's salaries are totalled by the salary-level enums.
+_COMPANY_SEGMENT = ("department", "experience_level", "gender")
+
+SalaryStratum = Tuple[str, str, str, str]
+
+CONFIDENCE = 0.95
+_Z = 1.959964
+
+
+class _Reservoir:
+    """A uniform sample of at most `size` of the `population` items offered so far."""
+
+    __slots__ = ("population", "items")
+
+    def __init__(self):
+        self.population = 0
+        self.items: List[Any] = []
+
+    def offer(self, item: Any, size: int, rng: random.Random) -> Tuple[bool, Any]:
+        """
+        Algorithm R. Returns (whether the item was kept, the item it replaced
+        or None).
+        """
+        self.population += 1
+        if len(self.items) < size:
+            self.items.append(item)
+            return True, None
+        slot = rng.randrange(self.population)
+        if slot >= size:
+            return False, None
+        replaced, self.items[slot] = self.items[slot], item
+        return True, replaced
+
+
+class _CompanyTotals:
+    """
+    One company's salary count and sum, overall, per value of each segment
+    field and per segment, so the filters a dashboard uses most, none or
+    one, are a dictionary lookup.
+    """
+
+    __slots__ = ("overall", "by_field", "segments")
+
+    def __init__(self):
+        self.overall = [0, 0.0]
+        self.by_field: Dict[Tuple[int, str], List[float]] = {}
+        self.segments: Dict[Tuple[str, str, str], List[float]] = {}
+
+    def add(self, segment: Tuple[str, str, str], amount: float) -> None:
+        for totals in (
+            self.overall,
+            *(self.by_field.setdefault((index, value), [0, 0.0]) for index, value in enumerate(segment)),
+            self.segments.setdefault(segment, [0, 0.0]),
+        ):
+            totals[0] += 1
+            totals[1] += amount
+
+    def get(self, wanted: Tuple[Optional[str], ...]) -> Tuple[int, float]:
+        fields = [(index, value) for index, value in enumerate(wanted) if value is not None]
+        if not fields:
+            return self.overall
+        if len(fields) == 1:
+            return self.by_field.get(fields[0], (0, 0.0))
+        count = amount = 0
+        for segment, (segment_count, segment_amount) in self.segments.items():
+            if _matches(wanted, segment):
+                count += segment_count
+                amount += segment_amount
+        return count, amount
+
+
+class _Estimates:
+    """
+    Stratified estimates of how many items carry each label, added up one
+    stratum at a time: the sampled count scaled up to the stratum, with the
+    variance of that scaled count under sampling without replacement. A
+    stratum sampled completely is exact and adds no variance.
+
+    A label missing from a stratum's sample may still occur in the stratum.
+    Such strata are given the variance of one pseudo-sample spread by the
+    label's overall share, which keeps rare labels from getting intervals
+    narrower than the data supports.
+    """
+
+    def __init__(self):
+        # label -> [estimate, variance, unseen variance already counted]
+        self._labels: Dict[Hashable, List[float]] = {}
+        self._unseen = 0.0
+        self.population = 0
+        self.sample_size = 0
+
+    def add(self, population: int, sample_size: int, counts: Dict[Hashable, int]) -> None:
+        self.population += population
+        self.sample_size += sample_size
+        weight = population / sample_size
+        scale = population * (population - sample_size) / max(sample_size - 1, 1)
+        unseen = scale / (sample_size + 1)
+        self._unseen += unseen
+        for label, count in counts.items():
+            share = count / sample_size
+            # One sampled item says nothing about the spread; assume the worst.
+            spread = share * (1 - share) if sample_size > 1 else 0.25
+            totals = self._labels.get(label)
+            if totals is None:
+                totals = self._labels[label] = [0.0, 0.0, 0.0]
+            totals[0] += weight * count
+            totals[1] += scale * spread
+            totals[2] += unseen
+
+    def results(self, label_name: str, labels: Optional[Iterable[Hashable]] = None) -> List[Dict[str, Any]]:
+        """One {label_name, count, low, high} per label, in the order of `labels`."""
+        results = []
+        for label in self._labels if labels is None else labels:
+            totals = self._labels.get(label)
+            if totals is None:
+                continue
+            estimate, variance, seen = totals
+            variance += estimate / self.population * (self._unseen - seen)
+            margin = _Z * math.sqrt(variance)
+            results.append({
+                label_name: label,
+                "count": round(estimate),
+                "low": max(0, math.floor(estimate - margin)),
+                "high": math.ceil(estimate + margin),
+            })
+        return results
+
+    def histogram(self) -> List[Dict[str, Any]]:
+        return self.results("range_start", sorted(self._labels, reverse=True))
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "approximate": True,
+            "confidence": CONFIDENCE,
+            "population": self.population,
+            "sample_size": self.sample_size,
+        }
+
+
+def _wanted(filters: FilterParams, names: Iterable[str]) -> Tuple[Optional[str], ...]:
+    return tuple(filters[name].value if name in filters else None for name in names)
+
+
+def _matches(wanted: Tuple[Optional[str], ...], key: Tuple[str, ...]) -> bool:
+    return all(value is None or value == part for value, part in zip(wanted, key))
+
+
+class StratifiedSampler(InsertListener):
+    """
+    Bounded random samples for approximate graphs, kept current from
+    committed inserts.
+
+    Salaries are sampled per (industry, department, experience_level,
+    gender) stratum, `salary_sample_size` each, for the salary histogram
+    and pie. Companies are sampled per industry, `company_sample_size`
+    each, together with their salary totals per segment, for the histogram
+    of company averages. An estimate reads at most one sample per stratum,
+    so its cost depends on the sample sizes, not on the number of rows.
+
+    Counts are estimated per stratum and added up, each with a 95%
+    confidence interval from the normal approximation (see _Estimates).
+    Strata smaller than their sample are held completely and are exact.
+    """
+
+    def __init__(self, salary_sample_size: int = 32, company_sample_size: int = 256, seed: Optional[int] = None):
+        self.salary_sample_size = salary_sample_size
+        self.company_sample_size = company_sample_size
+        self._rng = random.Random(seed)
+        self._salaries: Dict[SalaryStratum, _Reservoir] = {}
+        self._companies: Dict[str, _Reservoir] = {}
+        # Salary totals of the sampled companies only.
+        self._company_totals: Dict[str, _CompanyTotals] = {}
+        # Every company with salaries -> the industry it is sampled under.
+        self._company_industries: Dict[str, str] = {}
+        # Set when a company that already has salaries is registered, which
+        # moves them into an industry, or when another process has written;
+        # refresh() then reloads.
+        self.stale = False
+        self._reload_lock = asyncio.Lock()
+
+    async def load(self, controller) -> None:
+        industries = {company_hash: industry for company_hash, _, industry in await controller.get_company_directory()}
+        async for rows in controller.iter_filtered_records({}, chunk_size=10000):
+            for _, company_hash, department, experience_level, gender, amount, well_compensated, _ in rows:
+                self._add(
+                    company_hash, industries.get(company_hash, ""), department, experience_level, gender,
+                    amount, bool(well_compensated),
+                )
+
+    async def refresh(self, controller) -> None:
+        """
+        Rebuilds the samples from the database if they are stale. Like
+        Leaderboard.reload, inserts committed while it runs may be missed.
+        """
+        async with self._reload_lock:
+            if not self.stale:
+                return
+            self.stale = False
+            await self.reload(controller)
+
+    async def reload(self, controller) -> None:
+        """Rebuilds the samples; readers keep the old ones until it is done."""
+        fresh = StratifiedSampler(self.salary_sample_size, self.company_sample_size)
+        fresh._rng = self._rng
+        await fresh.load(controller)
+        self._salaries, self._companies = fresh._salaries, fresh._companies
+        self._company_totals, self._company_industries = fresh._company_totals, fresh._company_industries
+
+    def _add(self, company_hash: str, industry: str, department: str, experience_level: str, gender: str,
+             amount: float, well_compensated: bool) -> None:
+        stratum = (industry, department, experience_level, gender)
+        reservoir = self._salaries.get(stratum)
+        if reservoir is None:
+            reservoir = self._salaries[stratum] = _Reservoir()
+        reservoir.offer((amount, well_compensated), self.salary_sample_size, self._rng)
+
+        # A company joins its industry's population with its first salary.
+        if company_hash not in self._company_industries:
+            self._company_industries[company_hash] = industry
+            companies = self._companies.get(industry)
+            if companies is None:
+                companies = self._companies[industry] = _Reservoir()
+            kept, replaced = companies.offer(company_hash, self.company_sample_size, self._rng)
+            if replaced is not None:
+                del self._company_totals[replaced]
+            if kept:
+                self._company_totals[company_hash] = _CompanyTotals()
+
+        totals = self._company_totals.get(company_hash)
+        if totals is not None:
+            totals.add((department, experience_level, gender), amount)
+
+    def on_salary_inserted(self, record: SalaryRecord, industry: str) -> None:
+        self._add(
+            record.company_hash, industry, record.department.value, record.experience_level.value,
+            record.gender.value, record.salary_amount, record.is_well_compensated,
+        )
+
+    def on_company_inserted(self, company: Company) -> None:
+        if self._company_industries.get(company.id) == "":
+            self.stale = True
+
+    def estimate_salaries(self, filters: FilterParams,
+                          range_step: int) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]], Dict[str, Any]]:
+        """
+        Estimated bar graph and pie graph of the filtered salaries, shaped
+        like the exact ones plus a `low` and `high` bound on every count, and
+        a summary of the sample they came from.
+        """
+        wanted = _wanted(filters, _SALARY_STRATUM)
+        bars = _Estimates()
+        slices = _Estimates()
+        for stratum, reservoir in self._salaries.items():
+            if not _matches(wanted, stratum):
+                continue
+            items = reservoir.items
+            bars.add(reservoir.population, len(items), Counter(
+                [math.floor(amount / range_step) * float(range_step) for amount, _ in items]
+            ))
+            well_compensated = sum(1 for _, well in items if well)
+            slices.add(reservoir.population, len(items), {
+                label: count for label, count in enumerate((len(items) - well_compensated, well_compensated)) if count
+            })
+        return bars.histogram(), slices.results("is_well_compensated", (0, 1)), bars.summary()
+
+    def estimate_benchmark(self, filters: FilterParams, range_step: int) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+        """
+        Estimated histogram of company average salaries under `filters`,
+        with bounds as in estimate_salaries. Companies with no salary in the
+        filtered segments are sampled but not counted, as in the exact query.
+        """
+        industry = filters["industry"].value if "industry" in filters else None
+        wanted = _wanted(filters, _COMPANY_SEGMENT)
+        bars = _Estimates()
+        for stratum, reservoir in self._companies.items():
+            if industry is not None and stratum != industry:
+                continue
+            counts = Counter()
+            for company_hash in reservoir.items:
+                count, amount = self._company_totals[company_hash].get(wanted)
+                if count:
+                    counts[math.floor(amount / count / range_step) * float(range_step)] += 1
+            bars.add(reservoir.population, len(reservoir.items), counts)
+        return bars.histogram(), bars.summary()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "salary_strata": len(self._salaries),
+            "sampled_salaries": sum(len(reservoir.items) for reservoir in self._salaries.values()),
+            "sampled_companies": len(self._company_totals),
+            "salary_sample_size": self.salary_sample_size,
+            "company_sample_size": self.company_sample_size,
+        }
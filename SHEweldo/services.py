@@ -1,15 +1,27 @@
+import asyncio
+import base64
+import binascii
+import csv
+import io
+import json
 from abc import ABC, abstractmethod
 from enum import Enum
-from typing import Dict, Any, Optional, Type
+from typing import AsyncIterator, Dict, Any, List, Optional, Type
 
 from SHEweldo.models.entities import SalaryRecord, Company
-from SHEweldo.controllers.database import DatabaseController, FilterParams
+from SHEweldo.controllers.database import DatabaseController, IDatabaseController, FilterParams, EXPORT_COLUMNS
+from SHEweldo.controllers.rollups import ROLLUP_BUCKET_WIDTH
 from SHEweldo.models.enums import *
+from SHEweldo.cache import ResultCache
+from SHEweldo.leaderboard import Leaderboard
+from SHEweldo.live import LiveHub
+from SHEweldo.sampling import StratifiedSampler
 
 class Service(ABC):
     
-    def __init__(self):
-        self.db_controller = DatabaseController()
+    def __init__(self, db_controller: Optional[IDatabaseController] = None, cache: Optional[ResultCache] = None):
+        self.db_controller = db_controller or DatabaseController()
+        self.cache = cache
 
     async def initialize(self):
         await self.db_controller.initialize()
@@ -26,17 +38,60 @@ class Service(ABC):
             raise ValueError("Either 'filters' or 'id' must be provided.")
 
         if id:
-            filters = FilterParams()
-            salary_record = await self.db_controller.get_salary_record(id)
-            filters["company_hash"] = salary_record.company_hash
-            filters["department"] = Department(salary_record.department)
-            filters["experience"] = ExperienceLevel(salary_record.experience_level)
-            filters["gender"] = Gender(salary_record.gender)
+            filters = await self.salary_filters(id)
 
-        bargraph_data = await self.db_controller.get_bar_graph_data(filters, salary_range_step)
-        piegraph_data = await self.db_controller.get_pie_graph_data(filters)
+        async def compute():
+            bargraph_data, piegraph_data, _ = await self.db_controller.get_graph_summary(filters, salary_range_step)
+            return bargraph_data, piegraph_data
 
-        return bargraph_data, piegraph_data
+        key = ResultCache.make_key("salary", filters, salary_range_step)
+        return await self._cached(key, filters, (), compute)
+
+    async def salary_filters(self, id: str) -> FilterParams:
+        """The filters of a salary's own segment: its company, department, experience level and gender."""
+        filters = FilterParams()
+        salary_record = await self.db_controller.get_salary_record(id)
+        filters["company_hash"] = salary_record.company_hash
+        filters["department"] = Department(salary_record.department)
+        filters["experience_level"] = ExperienceLevel(salary_record.experience_level)
+        filters["gender"] = Gender(salary_record.gender)
+        return filters
+
+    DEFAULT_PERCENTILES = (25.0, 50.0, 75.0, 90.0)
+    MAX_PERCENTILES = 20
+
+    async def fetch_percentiles(self, filters: FilterParams, percentiles: Optional[List[float]] = None) -> Dict[str, Any]:
+        """
+        Salary percentiles for the filtered salaries. Each value is within
+        `max_error` (the rollup bucket width) of the exact percentile.
+        """
+        percentiles = sorted(set(percentiles or self.DEFAULT_PERCENTILES))
+        if len(percentiles) > self.MAX_PERCENTILES or not all(0 <= p <= 100 for p in percentiles):
+            raise ValueError(f"Up to {self.MAX_PERCENTILES} percentiles between 0 and 100 are supported")
+
+        async def compute():
+            count, estimates = await self.db_controller.get_salary_percentiles(filters, percentiles)
+            return {
+                "count": count,
+                "percentiles": {f"{p:g}": estimates[p] for p in percentiles if p in estimates},
+                "max_error": ROLLUP_BUCKET_WIDTH,
+            }
+
+        scope = ",".join(f"{p:g}" for p in percentiles)
+        key = ResultCache.make_key("percentiles", filters, 0, scope=scope)
+        return await self._cached(key, filters, (), compute)
+
+    async def _cached(self, key, filters: FilterParams, companies, compute):
+        if self.cache is None:
+            return await compute()
+
+        hit, value = self.cache.get(key)
+        if hit:
+            return value
+
+        value = await compute()
+        self.cache.put(key, value, filters, companies)
+        return value
     
     def _build_filters(self, request_args, param_config: list[tuple[str, type | None]]) -> FilterParams:
         filters: FilterParams = {}
@@ -58,6 +113,48 @@ class Service(ABC):
     async def add(self, data: Dict[str, Any]) -> tuple[Dict[str, Any], int]:
         pass
 
+    @abstractmethod
+    def _build_record(self, data: Dict[str, Any]) -> tuple[Optional[Any], Optional[Dict[str, Any]]]:
+        pass
+
+    @abstractmethod
+    async def _insert_many(self, entities: List[Any]) -> List[tuple[Any, str]]:
+        pass
+
+    async def add_many(self, items: List[Any]) -> List[Dict[str, Any]]:
+        """
+        Validates every item the way `add` does and writes all valid ones in
+        one transaction. Returns one result per item, in order: its index and
+        "status" "created" with the new id, or "rejected" with the reason.
+        Items that failed to parse may be passed as the ValueError raised.
+        """
+        results: List[Optional[Dict[str, Any]]] = [None] * len(items)
+        valid = []
+        for index, data in enumerate(items):
+            if isinstance(data, ValueError):
+                failure = {"message": "Invalid JSON", "error": str(data)}
+            elif not isinstance(data, dict):
+                failure = {"message": "Expected a JSON object"}
+            else:
+                try:
+                    entity, failure = self._build_record(data)
+                except Exception as e:
+                    failure = {"message": "Processing failed", "error": str(e)}
+            if failure:
+                results[index] = {"index": index, "status": "rejected", "message": failure["message"],
+                                  **({"error": failure["error"]} if "error" in failure else {})}
+            else:
+                valid.append((index, entity))
+
+        rejected = {id(entity): reason for entity, reason in await self._insert_many([entity for _, entity in valid])}
+        for index, entity in valid:
+            if id(entity) in rejected:
+                results[index] = {"index": index, "status": "rejected", "message": "Failed to save",
+                                  "error": rejected[id(entity)]}
+            else:
+                results[index] = {"index": index, "status": "created", "id": entity.id}
+        return results
+
     @abstractmethod
     async def get_all(self) -> list[tuple[str, str]]:
         pass
@@ -72,33 +169,59 @@ class SalaryService(Service):
         (float('inf'), ExperienceLevel.LEGENDARY)
     )
 
-    def __init__(self):
-        super().__init__()
+    def __init__(self, db_controller: Optional[IDatabaseController] = None, cache: Optional[ResultCache] = None,
+                 sampler: Optional[StratifiedSampler] = None, live: Optional[LiveHub] = None):
+        super().__init__(db_controller, cache)
+        self.sampler = sampler
+        self.live = live
+
+    async def fetch_approximate_records(self, salary_range_step: int, filters: FilterParams):
+        """
+        Bar and pie graph estimated from the sampler, with bounds on every
+        count, plus a summary of the estimate. A single company's salaries
+        are few enough to count exactly, as is everything without a sampler.
+        """
+        if self.sampler is None or "company_hash" in filters:
+            bargraph_data, piegraph_data = await self.fetch_filtered_records(salary_range_step, filters)
+            return bargraph_data, piegraph_data, {"approximate": False}
+
+        async def compute():
+            await self.sampler.refresh(self.db_controller)
+            return self.sampler.estimate_salaries(filters, salary_range_step)
+
+        key = ResultCache.make_key("salary-approx", filters, salary_range_step)
+        return await self._cached(key, filters, (), compute)
+
+    def _build_record(self, data: Dict[str, Any]) -> tuple[Optional[SalaryRecord], Optional[Dict[str, Any]]]:
+        if not (company_hash := data.get("company_hash")):
+            return None, {"message": "Missing company identifier"}
 
-    async def add(self, data: Dict[str, Any]) -> tuple[Dict[str, Any], int]:
         try:
-            if not (company_hash := data.get("company_hash")):
-                return {"message": "Missing company identifier"}
-
-            try:
-                years_at_company = int(data["years_at_the_company"])
-                total_experience = int(data["total_experience"])
-            except (KeyError, ValueError) as e:
-                return {"message": "Invalid experience data", "error": str(e)}
-
-            salary_record = SalaryRecord(
-                company_hash=company_hash,
-                experience_level=self._merge_experience(years_at_company, total_experience),
-                salary_amount=data.get("salary_amount", 0.0),
-                gender=self._str_to_gender(data.get("gender")),
-                submission_date=data.get("submission_date"),
-                is_well_compensated=data.get("is_well_compensated", False),
-                department=self._str_to_department(data.get("department")),
-                job_title=data.get("job_title")
-            )
+            years_at_company = int(data["years_at_the_company"])
+            total_experience = int(data["total_experience"])
+        except (KeyError, ValueError) as e:
+            return None, {"message": "Invalid experience data", "error": str(e)}
+
+        salary_record = SalaryRecord(
+            company_hash=company_hash,
+            experience_level=self._merge_experience(years_at_company, total_experience),
+            salary_amount=data.get("salary_amount", 0.0),
+            gender=self._str_to_gender(data.get("gender")),
+            submission_date=data.get("submission_date"),
+            is_well_compensated=data.get("is_well_compensated", False),
+            department=self._str_to_department(data.get("department")),
+            job_title=data.get("job_title")
+        )
 
-            if not salary_record.validate():
-                return {"message": "Invalid salary data", "data": data}
+        if not salary_record.validate():
+            return None, {"message": "Invalid salary data", "data": data}
+        return salary_record, None
+
+    async def add(self, data: Dict[str, Any]) -> tuple[Dict[str, Any], int]:
+        try:
+            salary_record, failure = self._build_record(data)
+            if failure:
+                return failure
             
             if await self.db_controller.insert_salary_record(salary_record):
                 return {"message": "Salary submitted successfully", "id": salary_record.id, "salary": salary_record.salary_amount}
@@ -107,10 +230,144 @@ class SalaryService(Service):
 
         except Exception as e:
             return {"message": "Processing failed", "error": str(e)}
+
+    async def _insert_many(self, records: List[SalaryRecord]) -> List[tuple[SalaryRecord, str]]:
+        return await self.db_controller.insert_salary_records(records)
         
     async def get_all(self) -> list[tuple[str, str]]:
         return await self.db_controller.get_all_companies()
 
+    _EXPORT_MIMETYPES = {
+        "ndjson": "application/x-ndjson",
+        "csv": "text/csv",
+    }
+    # Exported rows are (cursor, *EXPORT_COLUMNS).
+    _WELL_COMPENSATED_FIELD = 1 + EXPORT_COLUMNS.index("is_well_compensated")
+
+    def export_records(self, filters: FilterParams, export_format: str = "ndjson", after: int = 0,
+                       limit: Optional[int] = None, chunk_size: int = 1000) -> tuple[AsyncIterator[str], str]:
+        """
+        Returns (body, mimetype) for streaming the matching salaries. The body
+        yields one serialized chunk at a time. Every row carries a `cursor`;
+        passing the last one received as `after` resumes the export there.
+        """
+        if export_format not in self._EXPORT_MIMETYPES:
+            raise ValueError(f"Unsupported export format '{export_format}'")
+        if after < 0 or (limit is not None and limit <= 0):
+            raise ValueError("'after' must not be negative and 'limit' must be positive")
+
+        if limit is not None:
+            chunk_size = min(chunk_size, limit)
+        return self._export_chunks(filters, export_format, after, limit, chunk_size), self._EXPORT_MIMETYPES[export_format]
+
+    async def _export_chunks(self, filters: FilterParams, export_format: str, after: int,
+                             limit: Optional[int], chunk_size: int) -> AsyncIterator[str]:
+        columns = ("cursor",) + EXPORT_COLUMNS
+        if export_format == "csv":
+            yield self._to_csv([columns])
+
+        remaining = limit
+        # NDJSON lines come pre-rendered by the database.
+        as_json = export_format == "ndjson"
+        async for rows in self.db_controller.iter_filtered_records(filters, after, chunk_size, as_json):
+            if remaining is not None:
+                rows = rows[:remaining]
+                remaining -= len(rows)
+
+            if as_json:
+                yield "".join(line + "\n" for _, line in rows)
+            else:
+                index = self._WELL_COMPENSATED_FIELD
+                yield self._to_csv([row[:index] + (bool(row[index]),) + row[index + 1:] for row in rows])
+
+            if remaining == 0:
+                return
+
+    @staticmethod
+    def _to_csv(rows: List[tuple]) -> str:
+        buffer = io.StringIO()
+        csv.writer(buffer).writerows(rows)
+        return buffer.getvalue()
+
+    async def fetch_pay_gap(self, filters: FilterParams, reference: Gender = Gender.MALE) -> Dict[str, Any]:
+        """
+        Salary count and mean per gender for every department and experience
+        level, each row with its pay gap: how far each gender's mean falls
+        below the `reference` gender's, as a percentage of the reference mean.
+        The totals and per-department and per-experience rows are summed from
+        the same cells, so the whole response costs one grouped query.
+        """
+        if "gender" in filters:
+            raise ValueError("The pay gap compares genders, so it cannot be filtered by gender")
+
+        async def compute():
+            cells = await self.db_controller.get_pay_gap_cells(filters)
+            total: Dict[str, list] = {}
+            departments: Dict[str, Dict[str, list]] = {}
+            experience_levels: Dict[str, Dict[str, list]] = {}
+            matrix: Dict[tuple[str, str], Dict[str, list]] = {}
+
+            for department, experience_level, gender, count, amount in cells:
+                for genders in (
+                    total,
+                    departments.setdefault(department, {}),
+                    experience_levels.setdefault(experience_level, {}),
+                    matrix.setdefault((department, experience_level), {}),
+                ):
+                    totals = genders.setdefault(gender, [0, 0.0])
+                    totals[0] += count
+                    totals[1] += amount
+
+            return {
+                "reference": reference.value,
+                "total": self._pay_gap_row({}, total, reference),
+                "department": [
+                    self._pay_gap_row({"department": key}, genders, reference)
+                    for key, genders in departments.items()
+                ],
+                "experience_level": [
+                    self._pay_gap_row({"experience_level": key}, genders, reference)
+                    for key, genders in experience_levels.items()
+                ],
+                "matrix": [
+                    self._pay_gap_row({"department": department, "experience_level": experience_level}, genders, reference)
+                    for (department, experience_level), genders in matrix.items()
+                ],
+            }
+
+        key = ResultCache.make_key("pay_gap", filters, 0, scope=reference.value)
+        return await self._cached(key, filters, (), compute)
+
+    async def prewarm(self) -> int:
+        """
+        Computes the percentiles and pay gap unfiltered and for every single
+        industry, department and experience level, the graphs opened first.
+        Returns how many results were computed.
+        """
+        filter_sets: List[FilterParams] = [FilterParams()] + [
+            {name: member}
+            for name, enum_cls in (("industry", Industry), ("department", Department), ("experience_level", ExperienceLevel))
+            for member in enum_cls
+        ]
+        for filters in filter_sets:
+            await asyncio.gather(self.fetch_percentiles(filters), self.fetch_pay_gap(filters))
+        return 2 * len(filter_sets)
+
+    @staticmethod
+    def _pay_gap_row(row: Dict[str, Any], genders: Dict[str, list], reference: Gender) -> Dict[str, Any]:
+        row["genders"] = {
+            gender: {"count": count, "mean": amount / count}
+            for gender, (count, amount) in genders.items()
+        }
+        reference_mean = row["genders"].get(reference.value, {}).get("mean")
+        # None when the reference gender has no salaries to compare against.
+        row["gap"] = {
+            gender: round((reference_mean - stats["mean"]) / reference_mean * 100, 2) if reference_mean else None
+            for gender, stats in row["genders"].items()
+            if gender != reference.value
+        }
+        return row
+
     def _merge_experience(self, years_at_company: int, total_experience: int) -> ExperienceLevel:
         weighted = (years_at_company * 1.5) + total_experience
         for threshold, level in self._EXP_THRESHOLDS:
@@ -132,38 +389,77 @@ class CompanyService(Service):
         (float('inf'), CompanySize.ENTERPRISE)
     )
 
-    def __init__(self):
-        super().__init__()
+    def __init__(self, db_controller: Optional[IDatabaseController] = None, cache: Optional[ResultCache] = None,
+                 leaderboard: Optional[Leaderboard] = None, sampler: Optional[StratifiedSampler] = None):
+        super().__init__(db_controller, cache)
+        self.leaderboard = leaderboard
+        self.sampler = sampler
 
     async def fetch_filtered_records(self, salary_range_step: int, filters: FilterParams = FilterParams(), id: str = None):
         if filters is None and id is None:
             raise ValueError("Either 'filters' or 'id' must be provided.")
 
-        benchmark_data = await self.db_controller.get_benchmark_data(filters, salary_range_step)
-        current_average = (await self.db_controller.get_average_salary(id) // salary_range_step) * salary_range_step
+        async def compute():
+            # Independent queries, each served by its own pooled reader.
+            benchmark_data, average_salary, pie_graph_data = await asyncio.gather(
+                self.db_controller.get_benchmark_data(filters, salary_range_step),
+                self.db_controller.get_average_salary(id),
+                self.db_controller.get_pie_graph_data(filters, id),
+            )
+            current_average = (average_salary // salary_range_step) * salary_range_step
+
+            return benchmark_data, current_average, pie_graph_data
 
-        pie_graph_data = await self.db_controller.get_pie_graph_data(filters, id)
+        key = ResultCache.make_key("company", filters, salary_range_step, scope=id)
+        return await self._cached(key, filters, (id,), compute)
 
-        return benchmark_data, current_average, pie_graph_data
+    async def fetch_approximate_records(self, salary_range_step: int, filters: FilterParams, id: str):
+        """
+        fetch_filtered_records with the histogram of company averages
+        estimated from the sampler, plus a summary of the estimate. The
+        company's own average and pie stay exact.
+        """
+        if self.sampler is None:
+            return *await self.fetch_filtered_records(salary_range_step, filters, id), {"approximate": False}
 
-    async def add(self, data: Dict[str, Any]) -> tuple[Dict[str, Any], int]:
-        try:
-            if not (name := data.get("company_name")):
-                return {"message": "Company name required"}
-            try:
-                size = self._int_to_company_size(int(data["company_size"]))
-            except (KeyError, ValueError) as e:
-                return {"message": "Invalid company size", "error": str(e)}
-
-            company = Company(
-                name=name,
-                size=size,
-                industry=self._str_to_industry(data.get("company_industry")),
-                country=data.get("country")
+        async def compute():
+            await self.sampler.refresh(self.db_controller)
+            average_salary, pie_graph_data = await asyncio.gather(
+                self.db_controller.get_average_salary(id),
+                self.db_controller.get_pie_graph_data(filters, id),
             )
+            benchmark_data, approximation = self.sampler.estimate_benchmark(filters, salary_range_step)
+            current_average = (average_salary // salary_range_step) * salary_range_step
+
+            return benchmark_data, current_average, pie_graph_data, approximation
 
-            if not company.validate():
-                return {"message": "Invalid company data", "data": data}
+        key = ResultCache.make_key("company-approx", filters, salary_range_step, scope=id)
+        return await self._cached(key, filters, (id,), compute)
+
+    def _build_record(self, data: Dict[str, Any]) -> tuple[Optional[Company], Optional[Dict[str, Any]]]:
+        if not (name := data.get("company_name")):
+            return None, {"message": "Company name required"}
+        try:
+            size = self._int_to_company_size(int(data["company_size"]))
+        except (KeyError, ValueError) as e:
+            return None, {"message": "Invalid company size", "error": str(e)}
+
+        company = Company(
+            name=name,
+            size=size,
+            industry=self._str_to_industry(data.get("company_industry")),
+            country=data.get("country")
+        )
+
+        if not company.validate():
+            return None, {"message": "Invalid company data", "data": data}
+        return company, None
+
+    async def add(self, data: Dict[str, Any]) -> tuple[Dict[str, Any], int]:
+        try:
+            company, failure = self._build_record(data)
+            if failure:
+                return failure
             
             if await self.db_controller.insert_company(company):
                 return {"message": "Company registered successfully"}
@@ -171,10 +467,56 @@ class CompanyService(Service):
 
         except Exception as e:
             return {"message": "Processing failed", "error": str(e)}
+
+    async def _insert_many(self, companies: List[Company]) -> List[tuple[Company, str]]:
+        return await self.db_controller.insert_companies(companies)
         
     async def get_all(self) -> list[tuple[str, str]]:
         return await self.db_controller.get_all_companies()
 
+    async def top_companies(self, filters: FilterParams, k: int = 5) -> list[Dict[str, Any]]:
+        if self.leaderboard is not None:
+            return self.leaderboard.top(filters, k)
+
+        if k < 1:
+            raise ValueError("'k' must be positive")
+        return await self.db_controller.get_top_companies(filters, 0, k)
+
+    SEARCH_MAX_LIMIT = 50
+
+    async def search(self, prefix: str = "", industry: Optional[Industry] = None, country: Optional[str] = None,
+                     after: Optional[str] = None, limit: int = 20) -> Dict[str, Any]:
+        """
+        One page of companies whose name starts with `prefix`, ordered by name.
+        `next` is an opaque cursor for the following page, or None on the last.
+        """
+        if not 1 <= limit <= self.SEARCH_MAX_LIMIT:
+            raise ValueError(f"'limit' must be between 1 and {self.SEARCH_MAX_LIMIT}")
+
+        cursor = self._decode_cursor(after) if after else None
+        rows = await self.db_controller.search_companies(
+            prefix.strip(), industry, country.strip() if country else None, cursor, limit + 1
+        )
+        page = rows[:limit]
+        return {
+            "companies": [{"name": name, "hash": hash_val} for name, hash_val in page],
+            "next": self._encode_cursor(page[-1]) if len(rows) > limit else None,
+        }
+
+    @staticmethod
+    def _encode_cursor(row: tuple[str, str]) -> str:
+        return base64.urlsafe_b64encode(json.dumps(list(row)).encode()).decode()
+
+    @staticmethod
+    def _decode_cursor(cursor: str) -> tuple[str, str]:
+        try:
+            name, hash_val = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        except (binascii.Error, UnicodeDecodeError, ValueError, TypeError):
+            raise ValueError("Invalid 'after' cursor")
+        if not isinstance(name, str) or not isinstance(hash_val, str):
+            raise ValueError("Invalid 'after' cursor")
+        return name, hash_val
+
     def _str_to_industry(self, industry_str: Optional[str]) -> Industry:
         return self._str_to_enum(Industry, industry_str, Industry.OTHER)
 
@@ -1,5 +1,6 @@
 let barChart = null;
 let pieChart = null;
+let liveSource = null;
 
 $(document).ready(async function () {
   $("#companyFilter").select2({
@@ -124,15 +125,37 @@ async function fetchData() {
     const response = await fetch(`/api/graphs/employee${parameter}`);
     const data = await response.json();
     updateCharts(data);
+    followLive(parameter, data);
   } catch (error) {
     console.error("Error fetching data:", error);
   }
 }
 
-function updateCharts(data) {
-  if (barChart) barChart.destroy();
-  if (pieChart) pieChart.destroy();
+// Keeps the charts current: the stream starts with a snapshot of both
+// graphs and then sends only the buckets that changed.
+function followLive(parameter, data) {
+  if (liveSource) liveSource.close();
+  if (!window.EventSource) return;
+
+  liveSource = new EventSource(`/api/graphs/employee/live${parameter}`);
+  liveSource.addEventListener("snapshot", (event) => {
+    const snapshot = JSON.parse(event.data);
+    data.bar_graph = snapshot.bar_graph;
+    data.pie_graph = snapshot.pie_graph;
+    updateCharts(data);
+  });
+  liveSource.addEventListener("delta", (event) => {
+    const delta = JSON.parse(event.data);
+    const counts = new Map(data.bar_graph.map((b) => [b.range_start, b.count]));
+    delta.bar_graph.forEach((b) => counts.set(b.range_start, b.count));
+    data.bar_graph = Array.from(counts, ([range_start, count]) => ({ range_start, count }))
+      .sort((a, b) => b.range_start - a.range_start);
+    data.pie_graph = delta.pie_graph;
+    updateCharts(data);
+  });
+}
 
+function updateCharts(data) {
   const barData = data.bar_graph;
   const currentValue = data.current;
   const labels = barData.map((b) => b.range_start.toString());
@@ -140,39 +163,48 @@ function updateCharts(data) {
   let highlightIndex = barData.findIndex((b) => currentValue >= b.range_start);
   if (highlightIndex === -1) highlightIndex = barData.length - 1;
 
-  const barCtx = document.getElementById("barChart").getContext("2d");
-  barChart = new Chart(barCtx, {
-    type: "bar",
-    data: {
-      labels: labels,
-      datasets: [
-        {
-          label: "People with this salary range",
-          data: counts,
-          backgroundColor: counts.map((_, index) =>
-            index === highlightIndex ? "#7b63b8 " : "#4b4b4b"
-          ),
-          borderWidth: 0,
-        },
-      ],
-    },
-    options: {
-      scales: {
-        y: {
-          beginAtZero: true,
-          title: { display: true, text: "No. of People" },
+  const barColors = counts.map((_, index) =>
+    index === highlightIndex ? "#7b63b8 " : "#4b4b4b"
+  );
+
+  if (barChart) {
+    barChart.data.labels = labels;
+    barChart.data.datasets[0].data = counts;
+    barChart.data.datasets[0].backgroundColor = barColors;
+    barChart.update();
+  } else {
+    const barCtx = document.getElementById("barChart").getContext("2d");
+    barChart = new Chart(barCtx, {
+      type: "bar",
+      data: {
+        labels: labels,
+        datasets: [
+          {
+            label: "People with this salary range",
+            data: counts,
+            backgroundColor: barColors,
+            borderWidth: 0,
+          },
+        ],
+      },
+      options: {
+        scales: {
+          y: {
+            beginAtZero: true,
+            title: { display: true, text: "No. of People" },
+          },
+          x: {
+            title: { display: true, text: "Salary Range" },
+            ticks: { autoSkip: false, maxRotation: 90, minRotation: 90 },
+          },
         },
-        x: {
-          title: { display: true, text: "Salary Range" },
-          ticks: { autoSkip: false, maxRotation: 90, minRotation: 90 },
+        plugins: {
+          legend: { display: false },
+          tooltip: { enabled: true },
         },
       },
-      plugins: {
-        legend: { display: false },
-        tooltip: { enabled: true },
-      },
-    },
-  });
+    });
+  }
 
   const pieData = data.pie_graph;
   const compensated =
@@ -180,6 +212,12 @@ function updateCharts(data) {
   const notCompensated =
     pieData.find((p) => p.is_well_compensated === 0)?.count || 0;
 
+  if (pieChart) {
+    pieChart.data.datasets[0].data = [compensated, notCompensated];
+    pieChart.update();
+    return;
+  }
+
   const pieCtx = document.getElementById("pieChart").getContext("2d");
   pieChart = new Chart(pieCtx, {
     type: "pie",
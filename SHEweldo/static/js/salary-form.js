@@ -4,17 +4,36 @@ document.addEventListener("DOMContentLoaded", function () {
     }, 100);
 });
 
-async function populateCompanies() {
+const COMPANY_PAGE_SIZE = 20;
+let companySearchTimer = null;
+let companySearchRequest = 0;
+
+async function populateCompanies(query = "") {
+    const requestId = ++companySearchRequest;
     try {
-        const response = await fetch("/api/companies");
-        const companies = await response.json();
+        const params = new URLSearchParams({ q: query, limit: COMPANY_PAGE_SIZE });
+        const response = await fetch(`/api/companies?${params}`);
+        const page = await response.json();
+
+        // A slower, older search must not overwrite a newer one.
+        if (requestId !== companySearchRequest) {
+            return;
+        }
+
         const filter = document.getElementById("company");
+        const selected = filter.selectedOptions[0];
+        const companies = page.companies.map((company) => ({ hash: company.hash, name: company.name }));
+        // A company already chosen stays chosen when a new search leaves it out.
+        if (selected && selected.value && !companies.some((company) => company.hash === selected.value)) {
+            companies.unshift({ hash: selected.value, name: selected.textContent });
+        }
 
-        companies.sort((a, b) => a.name.localeCompare(b.name));
+        filter.innerHTML = '<option value="">Select Company</option>';
         companies.forEach((company) => {
             const option = document.createElement("option");
             option.value = company.hash;
             option.textContent = company.name;
+            option.selected = selected !== undefined && company.hash === selected.value;
             filter.appendChild(option);
         });
     } catch (error) {
@@ -22,6 +41,11 @@ async function populateCompanies() {
     }
 }
 
+document.getElementById("companySearch").addEventListener("input", (e) => {
+    clearTimeout(companySearchTimer);
+    companySearchTimer = setTimeout(() => populateCompanies(e.target.value), 200);
+});
+
 function populateDepartments() {
     const departments = [
         "executive_leadership",
@@ -50,7 +74,7 @@ function populateDepartments() {
 
 document.addEventListener("DOMContentLoaded", populateDepartments);
 
-document.addEventListener("DOMContentLoaded", populateCompanies);
+document.addEventListener("DOMContentLoaded", () => populateCompanies());
 
 document.getElementById("addCompanyBtn").addEventListener("click", () => {
     window.location.href = "/company/submit";
@@ -0,0 +1,74 @@
+import asyncio
+import os
+import sys
+
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from SHEweldo.controllers.migrations import filter_combinations
+from SHEweldo.dataset import generate_dataset, populate
+from SHEweldo.manage import _comparison_calls, _open_layout, _same_result
+
+# Enough rows for every filter combination to match some salaries, few
+# enough to seed a database in about a second.
+DATASET_COMPANIES = 30
+DATASET_SALARIES = 3000
+
+
+async def _seed(db_name: str, shards: int, companies: list, salaries: list) -> None:
+    _, controller = _open_layout(db_name, shards)
+    await controller.initialize()
+    try:
+        await populate(controller, companies, salaries, chunk_size=500)
+    finally:
+        await controller.close()
+
+
+@pytest.fixture(scope="session")
+def dataset():
+    """The (companies, salaries) every test database is seeded with."""
+    return generate_dataset(DATASET_COMPANIES, DATASET_SALARIES, seed=0)
+
+
+@pytest.fixture(scope="session")
+def seeded_db(tmp_path_factory, dataset):
+    """
+    A database seeded with `dataset`, both as one file and as a layout of
+    two shards named after it, the way compare-backends expects them. Shared
+    by the whole session, so tests must not write to it.
+    """
+    db_name = str(tmp_path_factory.mktemp("seeded") / "record.db")
+    asyncio.run(_seed(db_name, 1, *dataset))
+    asyncio.run(_seed(db_name, 2, *dataset))
+    return db_name
+
+
+@pytest.fixture
+def fresh_db(tmp_path, dataset):
+    """A single-file database seeded with `dataset` for one test to write to."""
+    db_name = str(tmp_path / "record.db")
+    asyncio.run(_seed(db_name, 1, *dataset))
+    return db_name
+
+
+@pytest.fixture
+def mismatched_calls():
+    """
+    Runs every analytics read of compare-backends on two controllers and
+    returns the calls whose results differ.
+    """
+    async def compare(expected_controller, actual_controller) -> list[str]:
+        companies = [hash_val for _, hash_val in await expected_controller.get_all_companies()][:3]
+        mismatches = []
+        for filters in filter_combinations():
+            if "company_hash" in filters:
+                filters["company_hash"] = companies[0]
+            for name, call_args in _comparison_calls(filters, companies):
+                expected = await getattr(expected_controller, name)(*call_args)
+                actual = await getattr(actual_controller, name)(*call_args)
+                if not _same_result(expected, actual):
+                    mismatches.append(f"{name} filters={sorted(filters)} args={call_args[1:]}")
+        return mismatches
+
+    return compare
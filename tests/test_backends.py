@@ -0,0 +1,38 @@
+import asyncio
+
+import pytest
+
+from SHEweldo.controllers.database import DatabaseController
+from SHEweldo.manage import _analytics_backend, _open_layout
+
+
+@pytest.mark.parametrize("backend, requirement", [("columnar", "numpy"), ("duckdb", "duckdb"), ("sharded", None)])
+def test_backend_matches_sqlite(seeded_db, mismatched_calls, backend, requirement):
+    if requirement:
+        pytest.importorskip(requirement)
+
+    async def compare():
+        sqlite = DatabaseController(seeded_db)
+        other = _analytics_backend(backend, seeded_db, 2)
+        await sqlite.initialize()
+        await other.initialize()
+        try:
+            return await mismatched_calls(sqlite, other)
+        finally:
+            await other.close()
+            await sqlite.close()
+
+    assert asyncio.run(compare()) == []
+
+
+@pytest.mark.parametrize("shards", [1, 2])
+def test_every_generated_query_uses_an_index(seeded_db, shards):
+    async def offenders():
+        _, controller = _open_layout(seeded_db, shards)
+        await controller.initialize()
+        try:
+            return await controller.find_unindexed_queries()
+        finally:
+            await controller.close()
+
+    assert asyncio.run(offenders()) == []
@@ -0,0 +1,32 @@
+import asyncio
+import json
+
+import pytest
+
+from SHEweldo.app import create_app
+from SHEweldo.config import Settings
+
+_COMPANY = {"company_name": "Batch Co", "company_size": 20, "company_industry": "finance", "country": "Philippines"}
+
+
+async def _post(db_name: str, data: str, content_type: str):
+    app = create_app(Settings(db_name=db_name, prewarm=False))
+    async with app.test_app() as test_app:
+        response = await test_app.test_client().post(
+            "/api/company/submit/batch", data=data, headers={"Content-Type": content_type}
+        )
+        return response.status_code, await response.get_json()
+
+
+@pytest.mark.parametrize("body", ['[{"company_name": ', '{"company_name": "Batch Co"}', "not json"])
+def test_batch_that_is_not_a_json_array_is_refused(tmp_path, body):
+    status, response = asyncio.run(_post(str(tmp_path / "record.db"), body, "application/json"))
+    assert status == 400
+    assert response == {"error": "Expected a JSON array of records"}
+
+
+def test_malformed_json_line_is_rejected_on_its_own(tmp_path):
+    body = "\n".join(['{"company_name": ', json.dumps(_COMPANY)])
+    status, response = asyncio.run(_post(str(tmp_path / "record.db"), body, "application/x-ndjson"))
+    assert status == 207
+    assert (response["created"], response["rejected"]) == (1, 1)
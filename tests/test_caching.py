@@ -0,0 +1,174 @@
+import asyncio
+
+import pytest
+
+from SHEweldo.app import create_app
+from SHEweldo.config import Settings
+from SHEweldo.controllers.database import DatabaseController
+from SHEweldo.models.entities import Company, SalaryRecord
+from SHEweldo.models.enums import CompanySize, Department, ExperienceLevel, Gender, Industry
+
+# How long a test waits for the server to notice another process's write.
+_SYNC_TIMEOUT = 5.0
+
+
+def _settings(db_name: str, **overrides) -> Settings:
+    return Settings(db_name=db_name, prewarm=False, worker_sync_ms=20, **overrides)
+
+
+async def _get(client, path: str, etag: str = None):
+    response = await client.get(path, headers={"If-None-Match": etag} if etag else {})
+    body = await response.get_json() if response.status_code == 200 else None
+    return response.status_code, response.headers.get("ETag"), body
+
+
+async def _etags(client, paths: list) -> dict:
+    etags = {}
+    for path in paths:
+        status, etags[path], _ = await _get(client, path)
+        assert status == 200
+        assert (await _get(client, path, etags[path]))[0] == 304
+    return etags
+
+
+async def _changed(client, path: str, etag: str) -> tuple:
+    """Polls `path` with `etag` until it stops answering 304 Not Modified."""
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + _SYNC_TIMEOUT
+    while True:
+        status, new_etag, body = await _get(client, path, etag)
+        if status != 304 or loop.time() > deadline:
+            return status, new_etag, body
+        await asyncio.sleep(0.02)
+
+
+def _salary(company_hash: str, salary_amount: float) -> SalaryRecord:
+    return SalaryRecord(
+        company_hash=company_hash,
+        experience_level=ExperienceLevel.JUNIOR,
+        salary_amount=salary_amount,
+        gender=Gender.FEMALE,
+        submission_date="2025-01-01",
+        is_well_compensated=True,
+        department=Department.OPERATIONS,
+        job_title="Analyst",
+    )
+
+
+@pytest.mark.parametrize("write_behind", [False, True])
+def test_submissions_invalidate_etags(fresh_db, dataset, write_behind):
+    companies, _ = dataset
+    submitted, untouched = companies[-1].id, companies[-2].id
+    submitted_path = f"/api/graphs/percentiles?company_hash={submitted}"
+    untouched_path = f"/api/graphs/percentiles?company_hash={untouched}"
+    paths = ["/api/companies", "/api/graphs/percentiles", submitted_path, untouched_path]
+
+    async def run():
+        app = create_app(_settings(fresh_db, write_behind=write_behind))
+        async with app.test_app() as test_app:
+            client = test_app.test_client()
+            etags = await _etags(client, paths)
+
+            response = await client.post("/api/employee/submit", json={
+                "company_hash": submitted, "years_at_the_company": 1, "total_experience": 2,
+                "salary_amount": 45000.0, "gender": "female", "submission_date": "2025-01-01",
+                "department": "operations", "job_title": "Analyst",
+            })
+            assert response.status_code == 201
+            for path in ("/api/graphs/percentiles", submitted_path):
+                status, etag, _ = await _get(client, path, etags[path])
+                assert status == 200 and etag != etags[path], path
+            # A salary leaves the company list and other companies' results alone.
+            for path in ("/api/companies", untouched_path):
+                assert (await _get(client, path, etags[path]))[0] == 304, path
+
+            response = await client.post("/api/company/submit", json={
+                "company_name": "Submitted Co", "company_size": 20, "company_industry": "finance",
+                "country": "Philippines",
+            })
+            assert response.status_code == 201
+            status, _, body = await _get(client, "/api/companies", etags["/api/companies"])
+            assert status == 200
+            assert "Submitted Co" in str(body)
+
+    asyncio.run(run())
+
+
+def test_external_writes_invalidate_etags(fresh_db):
+    paths = ["/api/companies", "/api/graphs/percentiles"]
+
+    async def run():
+        # One worker, as nothing but the sync loop tells it about manage.py writes.
+        app = create_app(_settings(fresh_db, workers=1))
+        async with app.test_app() as test_app:
+            client = test_app.test_client()
+            etags = await _etags(client, paths)
+
+            writer = DatabaseController(fresh_db)
+            await writer.initialize()
+            try:
+                company = Company("Outside Writer Co", CompanySize.SMALL, Industry.FINANCE, "Philippines")
+                await writer.insert_company(company)
+                await writer.insert_salary_records([_salary(company.id, 60000.0 + i) for i in range(5)])
+            finally:
+                await writer.close()
+
+            status, _, body = await _changed(client, "/api/companies", etags["/api/companies"])
+            assert status == 200
+            assert "Outside Writer Co" in str(body)
+            status, etag, _ = await _changed(client, "/api/graphs/percentiles", etags["/api/graphs/percentiles"])
+            assert status == 200 and etag != etags["/api/graphs/percentiles"]
+
+    asyncio.run(run())
+
+
+def test_external_rollup_rebuild_invalidates_etags(fresh_db, dataset):
+    companies, _ = dataset
+    paths = ["/api/graphs/percentiles", f"/api/graphs/percentiles?company_hash={companies[0].id}"]
+
+    async def run():
+        app = create_app(_settings(fresh_db))
+        async with app.test_app() as test_app:
+            client = test_app.test_client()
+            etags = await _etags(client, paths)
+
+            writer = DatabaseController(fresh_db)
+            await writer.initialize()
+            try:
+                await writer.rebuild_rollups()
+            finally:
+                await writer.close()
+
+            for path in paths:
+                assert (await _changed(client, path, etags[path]))[0] == 200, path
+
+    asyncio.run(run())
+
+
+def test_external_writes_reach_approximate_graphs(fresh_db):
+    path = "/api/graphs/employee?approx=true&gender=female"
+
+    async def run():
+        app = create_app(_settings(fresh_db))
+        async with app.test_app() as test_app:
+            client = test_app.test_client()
+            client.set_cookie("localhost", "salary_amount", "50000")
+            status, etag, body = await _get(client, path)
+            assert status == 200
+            population = body["approximation"]["population"]
+
+            writer = DatabaseController(fresh_db)
+            await writer.initialize()
+            try:
+                company = Company("Outside Writer Co", CompanySize.SMALL, Industry.FINANCE, "Philippines")
+                await writer.insert_company(company)
+                await writer.insert_salary_records([_salary(company.id, 60000.0 + i) for i in range(5)])
+            finally:
+                await writer.close()
+
+            # The samples are rebuilt by this request, not by the sync loop.
+            status, _, body = await _changed(client, path, etag)
+            assert status == 200
+            assert body["approximation"]["population"] == population + 5
+
+    asyncio.run(run())
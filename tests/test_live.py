@@ -0,0 +1,66 @@
+import asyncio
+
+from SHEweldo.controllers.database import DatabaseController
+from SHEweldo.live import LiveHub
+from SHEweldo.models.entities import Company, SalaryRecord
+from SHEweldo.models.enums import CompanySize, Department, ExperienceLevel, Gender, Industry
+
+
+def _salary(company_hash: str) -> SalaryRecord:
+    return SalaryRecord(
+        company_hash=company_hash,
+        experience_level=ExperienceLevel.JUNIOR,
+        salary_amount=55000.0,
+        gender=Gender.MALE,
+        submission_date="2025-01-01",
+        is_well_compensated=False,
+        department=Department.OPERATIONS,
+        job_title="Clerk",
+    )
+
+
+async def _drain(subscription) -> list:
+    events = []
+    while (event := await subscription.next(0.2)) != b": keepalive\n\n":
+        events.append(event)
+    return events
+
+
+async def _count(controller, filters) -> int:
+    bar_graph, _, _ = await controller.get_graph_summary(filters, 1000)
+    return sum(entry["count"] for entry in bar_graph)
+
+
+def test_company_registered_after_its_salaries_resyncs_its_industry(fresh_db):
+    filters = {"industry": Industry.AGRICULTURE}
+
+    async def run():
+        controller = DatabaseController(fresh_db)
+        await controller.initialize()
+        hub = LiveHub(controller)
+        controller.add_listener(hub)
+        try:
+            subscription = hub.subscribe(filters, 1000)
+            await _drain(subscription)
+            before = await _count(controller, filters)
+
+            late = Company("Late Farms", CompanySize.SMALL, Industry.AGRICULTURE, "Philippines")
+            await controller.insert_salary_records([_salary(late.id) for _ in range(3)])
+            # Salaries for hashes that are never registered leave nothing behind.
+            await controller.insert_salary_records([_salary(f"unknown-{i}") for i in range(50)])
+            assert await _drain(subscription) == []
+
+            await controller.insert_company(late)
+            events = await _drain(subscription)
+            assert len(events) == 1 and events[0].startswith(b"event: snapshot")
+            assert sum(subscription.view.bars.values()) == await _count(controller, filters) == before + 3
+
+            # Registering a company without salaries reloads nothing.
+            snapshots = hub.stats()["snapshots"]
+            await controller.insert_company(Company("New Farms", CompanySize.SMALL, Industry.AGRICULTURE, "Japan"))
+            assert await _drain(subscription) == []
+            assert hub.stats()["snapshots"] == snapshots
+        finally:
+            await controller.close()
+
+    asyncio.run(run())
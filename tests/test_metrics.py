@@ -0,0 +1,34 @@
+import os
+
+from SHEweldo.metrics import Metrics
+
+
+def test_workers_metrics_are_merged_on_scrape(tmp_path):
+    # Two workers; the first has stopped, so its file is renamed out of the
+    # way of the second, which runs in this same process.
+    stopped, serving = Metrics(str(tmp_path)), Metrics(str(tmp_path))
+    for metrics, requests in ((stopped, 3), (serving, 4)):
+        metrics.add_stats("live", lambda: {"subscribers": 1})
+        for _ in range(requests):
+            metrics.request_latency.observe(0.002, "GET", "/api/companies", 200)
+        metrics.db_errors.inc("get_top_companies")
+    stopped.write_snapshot(gauges=False)
+    os.replace(tmp_path / f"{os.getpid()}.json", tmp_path / "1.json")
+
+    text = serving.render()
+    route = 'method="GET",route="/api/companies",status="200"'
+    assert f"sheweldo_http_request_duration_seconds_count{{{route}}} 7" in text
+    assert 'sheweldo_db_call_errors_total{call="get_top_companies"} 2' in text
+    # Only the serving worker's gauges are left.
+    assert f'sheweldo_live_subscribers{{worker="{os.getpid()}"}} 1' in text
+    assert 'worker="1"' not in text
+
+
+def test_single_worker_metrics_stay_in_memory():
+    metrics = Metrics()
+    metrics.add_stats("live", lambda: {"subscribers": 2})
+    metrics.request_latency.observe(0.002, "GET", "/api/companies", 200)
+
+    text = metrics.render()
+    assert 'sheweldo_http_request_duration_seconds_count{method="GET",route="/api/companies",status="200"} 1' in text
+    assert "sheweldo_live_subscribers 2" in text
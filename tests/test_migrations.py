@@ -0,0 +1,47 @@
+import asyncio
+import sqlite3
+
+from SHEweldo.controllers.database import DatabaseController
+from SHEweldo.controllers.migrations import LATEST_VERSION, MIGRATIONS, get_schema_version
+
+
+def _baseline_copy(source: str, target: str) -> None:
+    """
+    Copies the rows of `source` into a database laid out the way the app
+    left it before it had migrations: migration 1's two tables, no indexes
+    or rollups, and user_version 0.
+    """
+    connection = sqlite3.connect(target)
+    try:
+        for statement in MIGRATIONS[0][2]:
+            connection.execute(statement)
+        connection.execute("ATTACH DATABASE ? AS source", (source,))
+        connection.execute("INSERT INTO companies SELECT * FROM source.companies")
+        connection.execute("INSERT INTO salaries SELECT * FROM source.salaries")
+        connection.commit()
+    finally:
+        connection.close()
+
+
+def test_baseline_database_is_upgraded_in_place(seeded_db, tmp_path, mismatched_calls):
+    baseline = str(tmp_path / "baseline.db")
+    _baseline_copy(seeded_db, baseline)
+
+    async def upgrade():
+        upgraded = DatabaseController(baseline)
+        reference = DatabaseController(seeded_db)
+        await upgraded.initialize()
+        await reference.initialize()
+        try:
+            version = await upgraded.connections.run_read(get_schema_version)
+            offenders = await upgraded.find_unindexed_queries()
+            return version, offenders, await mismatched_calls(reference, upgraded)
+        finally:
+            await upgraded.close()
+            await reference.close()
+
+    version, offenders, mismatches = asyncio.run(upgrade())
+    assert version == LATEST_VERSION
+    assert offenders == []
+    # The rollups built by the migrations agree with those kept up by inserts.
+    assert mismatches == []
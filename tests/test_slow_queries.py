@@ -0,0 +1,28 @@
+import asyncio
+import logging
+
+from SHEweldo.controllers.database import DatabaseController
+from SHEweldo.controllers.slow_queries import SlowQueryLog
+
+
+def test_slow_queries_are_logged_without_their_parameters(fresh_db, dataset, caplog):
+    companies, _ = dataset
+    company_hash = companies[0].id
+    slow_query_log = SlowQueryLog(threshold_ms=0.0001)
+
+    async def run():
+        controller = DatabaseController(fresh_db, slow_query_log=slow_query_log)
+        await controller.initialize()
+        try:
+            await controller.get_average_salary(company_hash)
+        finally:
+            await controller.close()
+
+    with caplog.at_level(logging.WARNING, logger="SHEweldo.controllers.slow_queries"):
+        asyncio.run(run())
+
+    messages = [record.getMessage() for record in caplog.records]
+    assert any(message.startswith("Slow query") and "param_types=['str']" in message for message in messages)
+    assert any(message.startswith("Query plan of") for message in messages)
+    assert not any(company_hash in message for message in messages)
+    assert slow_query_log.recent()[0]["param_types"] == ["str"]